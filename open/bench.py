@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+bench.py - Benchmark open.py's link scan on a generated directory tree
+"""
+
+import argparse
+import os
+import random
+import re
+import shutil
+import tempfile
+import time
+
+from open import ALLOWED_EXTENSIONS, ALLOWED_SCHEMES, find_files, get_all_links
+
+
+WORDS = "request served worker queue cache miss retry timeout user session".split()
+
+
+def log_line(rng, i):
+    """Generate one log line, every tenth with a link."""
+    line = f"2024-05-01 12:{i % 60:02d}:{i % 59:02d} INFO {' '.join(rng.choices(WORDS, k=8))}"
+    if i % 10 == 0:
+        line += f" see https://example.com/item/{i % 5000}?ref=log"
+    return line + "\n"
+
+
+def generate_tree(root, dirs, files, large_files, large_size):
+    """Write small text files over nested directories, plus a few large logs."""
+    rng = random.Random(0)
+    paths = [root]
+    for i in range(dirs):
+        path = os.path.join(rng.choice(paths), f"dir{i}")
+        os.makedirs(path)
+        paths.append(path)
+    for i in range(files):
+        # Some files have extensions that are not scanned
+        name = f"file{i}" + rng.choice([".txt", ".md", ".log", ".json", ".py"])
+        with open(os.path.join(rng.choice(paths), name), "w", encoding="utf-8") as f:
+            f.writelines(log_line(rng, j) for j in range(rng.randint(1, 40)))
+    block = "".join(log_line(rng, j) for j in range(10000))
+    for i in range(large_files):
+        with open(os.path.join(rng.choice(paths), f"large{i}.log"), "w", encoding="utf-8") as f:
+            for _ in range(large_size * 1024 * 1024 // len(block) + 1):
+                f.write(block)
+
+
+def baseline_scan(root):
+    """Scan the way open.py used to: os.walk, and one whole-file read and regex per file."""
+    files = []
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            if any(filename.lower().endswith(ext) for ext in ALLOWED_EXTENSIONS):
+                files.append(os.path.join(dirpath, filename))
+    links = []
+    for file in files:
+        with open(file, "r", encoding="utf-8", errors="ignore") as f:
+            content = f.read()
+            links.extend(re.findall(r'\b(?:' + '|'.join(ALLOWED_SCHEMES) + r')://[^\s<>"\'\]\)]+',
+                                    content, re.IGNORECASE))
+    return files, links
+
+
+def current_scan(root):
+    """Scan with open.py's find_files and get_all_links."""
+    files = list(find_files(root, ALLOWED_EXTENSIONS))
+    return files, get_all_links(files, ALLOWED_SCHEMES)
+
+
+def best_time(function, root, repeat):
+    """Return the best time of several runs, and the last result."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(root)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    """Benchmark entry point."""
+    parser = argparse.ArgumentParser(description="Benchmark open.py's link scan")
+    parser.add_argument("--dirs", type=int, default=500, help="Directories in the tree")
+    parser.add_argument("--files", type=int, default=20000, help="Small files in the tree")
+    parser.add_argument("--large-files", type=int, default=2, help="Large .log files in the tree")
+    parser.add_argument("--large-size", type=int, default=64, help="Size of each large file in MB")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per scanner (best is reported)")
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="open-bench-")
+    try:
+        start = time.perf_counter()
+        generate_tree(root, args.dirs, args.files, args.large_files, args.large_size)
+        print(f"Generated {args.files} files and {args.large_files} x {args.large_size} MB logs "
+              f"in {time.perf_counter() - start:.1f}s (files are in the page cache)")
+
+        baseline, (baseline_files, baseline_links) = best_time(baseline_scan, root, args.repeat)
+        current, (current_files, current_links) = best_time(current_scan, root, args.repeat)
+        if (current_files, current_links) != (baseline_files, baseline_links):
+            print("Error: scanners found different files or links")
+
+        print(f"{'scanner':<10}{'seconds':>10}{'files':>10}{'links':>12}")
+        print(f"{'baseline':<10}{baseline:>10.3f}{len(baseline_files):>10}{len(baseline_links):>12}")
+        print(f"{'current':<10}{current:>10.3f}{len(current_files):>10}{len(current_links):>12}")
+        print(f"Speedup: {baseline / current:.1f}x")
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,29 @@
+import mmap
 import os
 import re
 import webbrowser
 import subprocess
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 # Allowed file extensions and URL schemes
 ALLOWED_EXTENSIONS = ['.txt', '.md', '.log']
 ALLOWED_SCHEMES = ['http', 'https']
 
+# Files at least this big are memory-mapped instead of read into memory
+MMAP_THRESHOLD = 1024 * 1024
+# Files being read at once, and files queued ahead of them
+SCAN_WORKERS = min(32, (os.cpu_count() or 1) + 4)
+MAX_PENDING = 4 * SCAN_WORKERS
+
+# What may follow "scheme://" in a link: anything up to whitespace (including
+# the UTF-8 encoded non-ASCII whitespace characters), <, >, quotes, ] or )
+LINK_TAIL = re.compile(rb'(?:[^\s<>"\'\]\)\x1c-\x1f\x80-\xff]+'
+                       rb'|(?!\xc2[\x85\xa0]|\xe1\x9a\x80|\xe2\x80[\x80-\x8a\xa8\xa9\xaf]'
+                       rb'|\xe2\x81\x9f|\xe3\x80\x80)[\x80-\xff])+')
+# ASCII bytes that may not come right before a scheme (regex word characters)
+WORD_BYTES = frozenset(b'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_')
+
 def is_android():
     """Detect if the script is running on Android."""
     return (
@@ -16,28 +33,90 @@ def is_android():
     )
 
 def find_files(root_dir, extensions):
-    """Recursively find files with allowed extensions."""
-    for dirpath, _, filenames in os.walk(root_dir):
-        for filename in filenames:
-            if any(filename.lower().endswith(ext) for ext in extensions):
-                yield os.path.join(dirpath, filename)
+    """Recursively find files with allowed extensions, in os.walk order."""
+    extensions = tuple(ext.lower() for ext in extensions)
+    stack = [root_dir]
+    while stack:
+        subdirs = []
+        try:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.path)
+                        elif entry.name.lower().endswith(extensions) and entry.is_file():
+                            yield entry.path
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+        stack.extend(reversed(subdirs))
+
+def follows_word(data, start):
+    """Check whether the character before data[start] is a word character."""
+    if start == 0:
+        return False
+    if data[start - 1] < 0x80:
+        return data[start - 1] in WORD_BYTES
+    before = data[max(0, start - 4):start].decode('utf-8', errors='ignore')
+    return bool(before) and (before[-1].isalnum() or before[-1] == '_')
+
+def scan_links(data, schemes):
+    """
+    Find links in bytes (or an mmap) with any of the given lowercase byte schemes.
 
-def extract_links(text, schemes):
-    """Extract URLs with allowed schemes from text."""
-    pattern = re.compile(r'\b(' + '|'.join(schemes) + r')://[^\s<>"\'\]\)]+', re.IGNORECASE)
-    return pattern.findall(text), pattern.finditer(text)
+    Finds the same links as a case-insensitive \\b(scheme|...)://... regex,
+    but only looks closer where "://" occurs.
+    """
+    schemes = sorted(schemes, key=len, reverse=True)
+    longest = len(schemes[0])
+    links = []
+    pos = 0
+    while True:
+        sep = data.find(b'://', pos)
+        if sep < 0:
+            return links
+        pos = sep + 3
+        before = data[max(0, sep - longest):sep].lower()
+        for scheme in schemes:
+            start = sep - len(scheme)
+            if before.endswith(scheme) and not follows_word(data, start):
+                match = LINK_TAIL.match(data, sep + 3)
+                if match:
+                    links.append(data[start:match.end()])
+                    pos = match.end()
+                    break
+
+def scan_file(path, schemes):
+    """Return the links in one file, decoded."""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size >= MMAP_THRESHOLD:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                matches = scan_links(data, schemes)
+        else:
+            matches = scan_links(f.read(), schemes)
+    return [match.decode('utf-8', errors='ignore') for match in matches]
 
 def get_all_links(files, schemes):
-    """Get all links from the given files."""
+    """Get all links from the given files, reading several at once."""
+    schemes = [scheme.lower().encode('ascii') for scheme in schemes]
     links = []
-    for file in files:
+    pending = deque()
+
+    def finish():
+        file, future = pending.popleft()
         try:
-            with open(file, 'r', encoding='utf-8', errors='ignore') as f:
-                content = f.read()
-                matches = re.findall(r'\b(?:' + '|'.join(schemes) + r')://[^\s<>"\'\]\)]+', content, re.IGNORECASE)
-                links.extend(matches)
+            links.extend(future.result())
         except Exception as e:
             print(f"Error reading {file}: {e}")
+
+    with ThreadPoolExecutor(max_workers=SCAN_WORKERS) as pool:
+        for file in files:
+            pending.append((file, pool.submit(scan_file, file, schemes)))
+            if len(pending) >= MAX_PENDING:
+                finish()
+        while pending:
+            finish()
     return links
 
 def main():
@@ -65,4 +144,4 @@ def main():
         input("Press Enter to open the next link...")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+"""
+bench.py - Benchmark strip.py on synthetic pages
+"""
+
+import argparse
+import gc
+import gzip
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from bs4 import BeautifulSoup
+
+from strip import WebpageProcessor, DocumentIndex, iter_archive_pages, run_archives, run_files, to_plain
+
+
+PARAGRAPH = "<p>" + "Lorem ipsum dolor sit amet, consectetur. " * 4 + "</p>"
+
+
+def wrap_page(title: str, body: str) -> str:
+    """Wrap body markup in a page with the usual head, nav and footer."""
+    return (f"<html lang='en'><head><title>{title}</title>"
+            f"<meta name='description' content='{title} benchmark page'>"
+            f"<link rel='canonical' href='https://example.com/{title}'>"
+            f"<script>var x = 1;</script><style>p {{ margin: 0 }}</style></head>"
+            f"<body><header><nav><a href='/'>Home page</a> <a href='/docs'>Documentation</a></nav></header>"
+            f"<main>{body}</main><footer>Copyright example footer</footer></body></html>")
+
+
+def flat_page(sections: int) -> str:
+    """Generate a shallow page of headed text sections."""
+    body = "".join(f"<section><h2>Section {i}</h2>{PARAGRAPH * 3}</section>" for i in range(sections))
+    return wrap_page("flat", body)
+
+
+def deep_page_body(depth: int, width: int) -> str:
+    """Generate text-heavy markup nested `depth` levels deep."""
+    html = "".join(f"<div class='level-{i}'>{PARAGRAPH * width}" for i in range(depth))
+    return html + "</div>" * depth
+
+
+def deep_page(depth: int, width: int) -> str:
+    """Generate a text-heavy page nested `depth` levels deep."""
+    html = deep_page_body(depth, width)
+    return f"<html><head><title>Deep</title></head><body><main>{html}</main></body></html>"
+
+
+def link_page(links: int) -> str:
+    """Generate a page that is mostly links."""
+    items = "".join(f"<li><a href='https://example.com/page/{i}' class='btn-link'>Link number {i}</a></li>"
+                    for i in range(links))
+    return wrap_page("links", f"<ul>{items}</ul>")
+
+
+def form_page(options: int) -> str:
+    """Generate a form with large <select> elements."""
+    choices = "".join(f"<option value='{i}'>Option number {i}</option>" for i in range(options))
+    fields = "".join(f"<label>Field {i}</label><input type='text' name='f{i}' required>"
+                     f"<select name='s{i}'>{choices}</select>" for i in range(4))
+    return wrap_page("form", f"<form>{fields}<button type='submit'>Send</button></form>")
+
+
+def table_page(rows: int) -> str:
+    """Generate a page with one large table."""
+    body = "".join(f"<tr><td>Row {i}</td><td>Value {i * 7}</td><td>Comment for row {i}</td></tr>"
+                   for i in range(rows))
+    return wrap_page("table", f"<table><thead><tr><th>Name</th><th>Value</th><th>Comment</th></tr>"
+                              f"</thead><tbody>{body}</tbody></table>")
+
+
+# Generated benchmark corpus: name -> page builder
+CASES = {
+    "small": lambda: flat_page(5),
+    "large": lambda: flat_page(500),
+    "shallow": lambda: flat_page(50),
+    "deep": lambda: wrap_page("deep", deep_page_body(200, 1)),
+    "links": lambda: link_page(3000),
+    "forms": lambda: form_page(3000),
+    "tables": lambda: table_page(5000),
+}
+
+
+def best_time(function, repeat: int) -> float:
+    """Return the best wall time of function() over `repeat` runs."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_case(html: str, repeat: int) -> dict:
+    """Time process_html and each public stage on one page."""
+    processor = WebpageProcessor()
+    result = {
+        "process_html": best_time(lambda: processor.process_html(html), repeat),
+        "text_only": best_time(lambda: processor.process_html(html, ["text_summary"]), repeat),
+        # Parsing includes building the document index, as in process_html
+        "parse": best_time(lambda: processor.parse_html(html), repeat),
+    }
+
+    # Time the stages on a page parsed and indexed the way process_html
+    # does it, so they use the index rather than walking the tree
+    soup = processor.parse_html(html)
+    result.update({
+        "extract_metadata": best_time(lambda: processor.extract_metadata(soup), repeat),
+        "categorize_content": best_time(lambda: processor.categorize_content(soup), repeat),
+        "create_text_summary": best_time(lambda: processor.create_text_summary(soup), repeat),
+        "extract_element_content": best_time(lambda: processor.extract_element_content(soup.main), repeat),
+    })
+    processor.index = None
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    page = processor.process_html(html)
+    result["peak_memory"] = tracemalloc.get_traced_memory()[1]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    # Memory blocks allocated by process_html that the result still holds
+    result["allocations"] = sum(stat.count_diff for stat in after.compare_to(before, "filename"))
+    del page
+
+    size = len(html.encode("utf-8"))
+    result["size"] = size
+    result["pages_per_s"] = 1 / result["process_html"]
+    result["mb_per_s"] = size / result["process_html"] / 1024 / 1024
+    return result
+
+
+def bench_suite(repeat: int, names: list, save: str = None, compare: str = None):
+    """Run the generated corpus, optionally saving or comparing against a baseline."""
+    baseline = {}
+    if compare:
+        with open(compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    results = {}
+    stages = ["parse", "extract_metadata", "categorize_content",
+              "create_text_summary", "extract_element_content", "text_only"]
+    print(f"{'case':>8} {'size':>8} {'total':>9} {'pages/s':>8} {'MB/s':>6} {'peak':>8} {'blocks':>8}  "
+          + " ".join(f"{stage[:10]:>10}" for stage in stages)
+          + (f" {'vs base':>8}" if baseline else ""))
+    for name in names:
+        result = results[name] = bench_case(CASES[name](), repeat)
+        line = (f"{name:>8} {result['size'] / 1024:>6.0f}KB {result['process_html'] * 1000:>7.1f}ms "
+                f"{result['pages_per_s']:>8.1f} {result['mb_per_s']:>6.2f} "
+                f"{result['peak_memory'] / 1024 / 1024:>6.1f}MB {result['allocations']:>8}  "
+                + " ".join(f"{result[stage] * 1000:>8.1f}ms" for stage in stages))
+        if name in baseline:
+            line += f" {result['process_html'] / baseline[name]['process_html']:>7.2f}x"
+        print(line)
+
+    if save:
+        with open(save, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline written to {save}")
+
+
+def time_extract(processor: WebpageProcessor, soup: BeautifulSoup,
+                 depth: int, repeat: int, indexed: bool) -> float:
+    """Return the best wall time of a full-depth extraction over `repeat` runs."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        processor.index = DocumentIndex(soup) if indexed else None
+        processor.extract_element_content(soup.main, max_depth=depth + 1)
+        processor.index = None
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_deep(repeat: int):
+    """Compare indexed text extraction against per-node get_text()."""
+    processor = WebpageProcessor()
+    print(f"{'depth':>6} {'get_text':>10} {'indexed':>10} {'speedup':>8}")
+    for depth in (10, 50, 200, 400):
+        soup = BeautifulSoup(deep_page(depth, width=3), "html.parser")
+        naive = time_extract(processor, soup, depth, repeat, indexed=False)
+        indexed = time_extract(processor, soup, depth, repeat, indexed=True)
+        print(f"{depth:>6} {naive:>9.3f}s {indexed:>9.3f}s {naive / indexed:>7.1f}x")
+
+
+def retained_memory(build) -> int:
+    """Return the traced memory still held by the value build() returns."""
+    gc.collect()
+    tracemalloc.start()
+    value = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del value
+    return size
+
+
+def bench_memory(names: list):
+    """Compare memory held by extracted records against plain nested dicts."""
+    processor = WebpageProcessor()
+    print(f"{'case':>8} {'nodes':>8} {'records':>10} {'dicts':>10} {'saving':>8}")
+    for name in names:
+        soup = BeautifulSoup(CASES[name](), processor.parser)
+        records = processor.extract_element_content(soup.body, max_depth=50)
+        nodes = count_nodes(records)
+        del records
+        compact = retained_memory(lambda: processor.extract_element_content(soup.body, max_depth=50))
+        plain = retained_memory(lambda: to_plain(processor.extract_element_content(soup.body, max_depth=50)))
+        print(f"{name:>8} {nodes:>8} {compact / 1024 / 1024:>8.2f}MB {plain / 1024 / 1024:>8.2f}MB "
+              f"{1 - compact / plain:>7.0%}")
+
+
+def count_nodes(record) -> int:
+    """Count records in an extracted tree."""
+    return 1 + sum(count_nodes(child) for child in record.get("children", ()))
+
+
+def bench_scaling(files: int):
+    """Time directory processing with an increasing number of worker processes."""
+    with tempfile.TemporaryDirectory() as corpus:
+        for i in range(files):
+            with open(os.path.join(corpus, f"page{i:06d}.html"), "w", encoding="utf-8") as f:
+                f.write(deep_page(depth=5 + i % 10, width=2))
+        paths = sorted(os.path.join(corpus, name) for name in os.listdir(corpus))
+
+        cpus = os.cpu_count() or 1
+        jobs_list = sorted({1, 2, 4, 8, cpus} & set(range(1, cpus + 1)))
+        print(f"{'jobs':>6} {'time':>10} {'pages/s':>10} {'scaling':>8}")
+        single = None
+        for jobs in jobs_list:
+            start = time.perf_counter()
+            for _ in run_files(paths, {}, jobs=jobs):
+                pass
+            elapsed = time.perf_counter() - start
+            single = single or elapsed
+            print(f"{jobs:>6} {elapsed:>9.2f}s {files / elapsed:>10.0f} {single / elapsed:>7.1f}x")
+
+
+# Startup scenarios: name -> strip.py arguments ("{page}" is a local HTML file)
+STARTUP_CASES = {
+    "help": ["--help"],
+    "stream": ["--stream", "{page}"],
+    "metadata": ["--fields", "metadata", "{page}"],
+    "text": ["-f", "text", "{page}"],
+    "json": ["{page}"],
+}
+
+# Heavy dependencies, detected by a submodule that loading them always imports
+STARTUP_MODULES = {"requests": "urllib3", "bs4": "bs4.element", "html2text": "html2text.config"}
+
+
+def run_startup(args: list) -> tuple:
+    """Run strip.py under -X importtime, returning (wall time, import time, modules)."""
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "strip.py")
+    start = time.perf_counter()
+    process = subprocess.run([sys.executable, "-X", "importtime", script, *args],
+                             stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    elapsed = time.perf_counter() - start
+    import_time = 0
+    modules = set()
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_time, _, name = line[len("import time:"):].split("|")
+        import_time += int(self_time)
+        modules.add(name.strip())
+    loaded = [name for name, marker in STARTUP_MODULES.items() if marker in modules]
+    return elapsed, import_time / 1e6, loaded
+
+
+def bench_startup(repeat: int):
+    """Time strip.py start-up for common invocations, as measured by -X importtime."""
+    with tempfile.TemporaryDirectory() as directory:
+        page = os.path.join(directory, "page.html")
+        with open(page, "w", encoding="utf-8") as f:
+            f.write(CASES["small"]())
+        print(f"{'case':>8} {'wall':>9} {'imports':>9}  loaded")
+        for name, args in STARTUP_CASES.items():
+            args = [arg.format(page=page) for arg in args]
+            runs = [run_startup(args) for _ in range(repeat)]
+            elapsed = min(run[0] for run in runs)
+            import_time = min(run[1] for run in runs)
+            print(f"{name:>8} {elapsed * 1000:>7.1f}ms {import_time * 1000:>7.1f}ms  "
+                  f"{', '.join(runs[-1][2]) or '-'}")
+
+
+def warc_record(uri: str, html: str) -> bytes:
+    """Build a WARC response record holding an HTML page."""
+    body = html.encode("utf-8")
+    http = (b"HTTP/1.1 200 OK\r\nContent-Type: text/html; charset=utf-8\r\n"
+            + f"Content-Length: {len(body)}\r\n\r\n".encode("ascii") + body)
+    headers = (f"WARC/1.0\r\nWARC-Type: response\r\nWARC-Target-URI: {uri}\r\n"
+               f"Content-Type: application/http; msgtype=response\r\n"
+               f"Content-Length: {len(http)}\r\n\r\n")
+    return headers.encode("utf-8") + http + b"\r\n\r\n"
+
+
+def bench_archive(records: int):
+    """Time reading a .warc.gz archive alone and with parsing by worker processes."""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "pages.warc.gz")
+        with open(path, "wb") as f:
+            for i in range(records):
+                f.write(gzip.compress(warc_record(f"https://example.com/{i}",
+                                                  deep_page(depth=5 + i % 10, width=2))))
+        size = os.path.getsize(path)
+        
+        start = time.perf_counter()
+        pages = sum(1 for _ in iter_archive_pages(path))
+        elapsed = time.perf_counter() - start
+        print(f"read:    {pages} pages in {elapsed:.2f}s, "
+              f"{size / elapsed / 1024 / 1024:.1f} MB/s compressed")
+        
+        start = time.perf_counter()
+        for _ in run_archives([path], {}):
+            pass
+        elapsed = time.perf_counter() - start
+        print(f"process: {pages} pages in {elapsed:.2f}s, {pages / elapsed:.0f} pages/s")
+
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(description="Benchmark strip.py")
+    parser.add_argument(
+        "benchmark",
+        nargs="?",
+        choices=["suite", "deep", "memory", "startup", "scaling", "archive"],
+        default="suite",
+        help="Corpus suite, deep-nesting text extraction, record memory, "
+             "start-up imports, worker scaling, or archive reading"
+    )
+    parser.add_argument(
+        "--cases",
+        default=",".join(CASES),
+        help="Comma-separated cases to run for the suite and memory benchmarks"
+    )
+    parser.add_argument(
+        "--save",
+        metavar="FILE",
+        help="Write suite results to FILE as a baseline"
+    )
+    parser.add_argument(
+        "--compare",
+        metavar="FILE",
+        help="Compare suite results against a saved baseline"
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="Runs per case (best time is reported)"
+    )
+    parser.add_argument(
+        "--files",
+        type=int,
+        default=2000,
+        help="Corpus size for the worker scaling and archive benchmarks"
+    )
+
+    args = parser.parse_args()
+    names = args.cases.split(",")
+    unknown = [name for name in names if name not in CASES]
+    if unknown:
+        parser.error(f"unknown cases: {', '.join(unknown)}")
+    if args.benchmark == "suite":
+        bench_suite(args.repeat, names, save=args.save, compare=args.compare)
+    elif args.benchmark == "deep":
+        bench_deep(args.repeat)
+    elif args.benchmark == "memory":
+        bench_memory(names)
+    elif args.benchmark == "startup":
+        bench_startup(args.repeat)
+    elif args.benchmark == "archive":
+        bench_archive(args.files)
+    else:
+        bench_scaling(args.files)
+
+
+if __name__ == "__main__":
+    main()
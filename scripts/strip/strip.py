@@ -3,17 +3,1158 @@
 strip.py - Process web pages into AI-friendly structured format
 """
 
+from __future__ import annotations
+
 import argparse
+import codecs
+import glob
+import hashlib
+import importlib.util
+import io
 import json
+import math
+import os
 import re
 import sys
-from collections import defaultdict
+import threading
+import time
+import zlib
+from collections import OrderedDict, defaultdict, deque
+from collections.abc import Mapping
+from contextlib import contextmanager, nullcontext
+from html.parser import HTMLParser
 from pathlib import Path
-from typing import Dict, List, Optional, Union, Any
+from urllib.parse import parse_qs, urljoin, urlsplit, urlunsplit
+from typing import IO, TYPE_CHECKING, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union, Any
+
+if TYPE_CHECKING:
+    from bs4 import BeautifulSoup, Tag, NavigableString
+
+
+def lazy_import(name: str):
+    """
+    Return a module that is only loaded when one of its attributes is used.
+    
+    Keeps start-up fast for runs that never touch the module, such as
+    requests for local files or bs4 for --stream.
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named {name!r}", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+def load_modules(*modules):
+    """Finish loading lazily imported modules now rather than on first use."""
+    for module in modules:
+        getattr(module, "__name__")
+
+
+bs4 = lazy_import("bs4")
+html2text = lazy_import("html2text")
+requests = lazy_import("requests")
+sqlite3 = lazy_import("sqlite3")
+tracemalloc = lazy_import("tracemalloc")
+gzip = lazy_import("gzip")
+
+try:
+    orjson = lazy_import("orjson")
+except ImportError:
+    orjson = None
+
+try:
+    zstandard = lazy_import("zstandard")
+except ImportError:
+    zstandard = None
+
+# String classes that get_text() collects for ordinary tags (see text_string_types)
+TEXT_STRING_TYPES: Optional[set] = None
+
+# BeautifulSoup tree builders, mapped to the module each one needs
+PARSER_BACKENDS = {
+    "html.parser": None,
+    "lxml": "lxml",
+    "html5lib": "html5lib",
+}
+DEFAULT_PARSER = "html.parser"
+
+# Characters escaped as entities when a tree is serialized back to HTML
+ESCAPED_TEXT = re.compile(r"([&<>])")
+ENTITY_NAMES = {"&": "amp", "<": "lt", ">": "gt"}
+
+# Semantic type of each tag name ("a" and "input" depend on attributes)
+ELEMENT_TYPES = {
+    "h1": "heading", "h2": "heading", "h3": "heading",
+    "h4": "heading", "h5": "heading", "h6": "heading",
+    "img": "image",
+    "ul": "list", "ol": "list",
+    "li": "list_item",
+    "table": "table",
+    "tr": "table_row",
+    "td": "table_cell", "th": "table_cell",
+    "form": "form",
+    "button": "button",
+    "textarea": "textarea",
+    "select": "select",
+    "option": "option",
+    "label": "label",
+    "code": "code", "pre": "code",
+    "blockquote": "quote",
+    "iframe": "embedded_content", "frame": "embedded_content", "embed": "embedded_content",
+    "audio": "audio",
+    "video": "video",
+    "canvas": "canvas",
+    "svg": "svg",
+    "dialog": "dialog",
+    "details": "expandable",
+    "summary": "expander",
+    "div": "container", "section": "container", "article": "container",
+    "p": "paragraph",
+    "nav": "navigation",
+    "header": "header",
+    "footer": "footer",
+    "aside": "sidebar",
+    "main": "main_content",
+}
+CLICKABLE_TAGS = frozenset(["a", "button", "summary"])
+CLICKABLE_ROLES = frozenset(["button", "link", "menuitem"])
+INTERACTIVE_TAGS = frozenset(["input", "select", "textarea", "button", "a"])
+INTERACTIVE_ROLES = frozenset(["textbox", "combobox", "slider", "checkbox", "radio", "menuitem", "tab"])
+# ARIA roles that override the tag's semantic type
+ARIA_TYPE_ROLES = frozenset(["button", "link", "checkbox", "radio", "tab", "menuitem", "combobox",
+                             "listbox", "textbox", "searchbox", "slider", "spinbutton", "switch",
+                             "grid", "treegrid", "menu", "menubar", "tree", "tablist", "dialog"])
+# Memoized element types kept per processor before the memo is cleared
+MAX_ELEMENT_TYPES = 10000
+
+# Streaming extraction: tags without end tags, tags whose subtrees are
+# skipped, and tags that end a run of text
+VOID_TAGS = frozenset(["area", "base", "br", "col", "embed", "hr", "img", "input",
+                       "link", "meta", "param", "source", "track", "wbr"])
+STREAM_SKIP_TAGS = frozenset(["script", "style", "noscript", "template"])
+BLOCK_TAGS = frozenset(["address", "article", "aside", "blockquote", "body", "dd", "details",
+                        "dialog", "div", "dl", "dt", "fieldset", "figcaption", "figure",
+                        "footer", "form", "h1", "h2", "h3", "h4", "h5", "h6", "header",
+                        "hr", "li", "main", "nav", "ol", "p", "pre", "section", "summary",
+                        "table", "td", "th", "tr", "ul"])
+HEADING_TAGS = frozenset(["h1", "h2", "h3", "h4", "h5", "h6"])
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Links kept in the important_links section
+MAX_IMPORTANT_LINKS = 10
+
+# Top-level result sections, and the sub-sections of categorized_content,
+# in output order
+SECTIONS = ("metadata", "categorized_content", "text_summary")
+CONTENT_SECTIONS = ("main_content", "navigation", "header", "footer",
+                    "headings", "paragraphs", "important_links")
+
+# Section each streamed record type belongs to
+STREAM_SECTIONS = {"metadata": "metadata", "heading": "headings",
+                   "link": "important_links", "text": "text_summary"}
+
+# Tags removed before extraction, whose text never reaches any output
+STRIPPED_TAGS = frozenset(["script", "style", "noscript"])
+
+# Shared key tuples of CompactRecords, one per distinct set of fields
+RECORD_SCHEMAS: Dict[tuple, tuple] = {}
+# Fields of an extracted node that hold lists of nodes
+RECORD_LIST_FIELDS = frozenset(["children", "options"])
+
+# Stand-in for Profiler.stage() when profiling is off
+NULL_STAGE = nullcontext()
+
+# Archive input: page file suffixes (optionally followed by a compression
+# suffix), WARC record types that hold pages, payload types read as HTML,
+# largest record processed, and compressed bytes read at a time
+HTML_SUFFIXES = (".html", ".htm")
+COMPRESSION_SUFFIXES = (".gz", ".zst")
+WARC_PAGE_TYPES = ("response", "resource")
+HTML_MEDIA_TYPES = ("text/html", "application/xhtml+xml")
+MAX_RECORD_SIZE = 64 * 1024 * 1024
+ARCHIVE_CHUNK_SIZE = 1024 * 1024
+
+# <meta charset> or http-equiv declaration near the start of a page, and
+# how many leading bytes are searched for it
+META_CHARSET = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?\s*([\w.:-]+)""", re.IGNORECASE)
+CHARSET_SNIFF_SIZE = 1024
+
+# Fetching: default byte and time budgets per page, beyond which the page
+# is truncated, and bytes read from the connection at a time
+MAX_FETCH_SIZE = 16 * 1024 * 1024
+FETCH_TIME_LIMIT = 30.0
+FETCH_CHUNK_SIZE = 64 * 1024
+
+# Incremental directory runs: manifest file name and version, and the
+# suffix added to each input's path for its output file
+MANIFEST_NAME = ".strip-manifest.json"
+MANIFEST_VERSION = 2
+OUTPUT_SUFFIXES = {"json": ".json", "jsonl": ".jsonl", "chunks": ".chunks.jsonl", "text": ".txt"}
+
+# Chunking text summaries: blank lines between Markdown blocks, heading
+# lines, the units counted as tokens (roughly one per word or punctuation
+# mark), and default chunk size in tokens
+BLOCK_SEPARATOR = re.compile(r"\n\s*\n")
+MARKDOWN_HEADING = re.compile(r"(#{1,6})[ \t]+([^\n]*)")
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+DEFAULT_CHUNK_SIZE = 512
+
+# Boilerplate deduplication: smallest block, as encoded JSON bytes of the
+# block's fields and its descendants', replaced by a reference
+MIN_BOILERPLATE_SIZE = 64
+
+# Crawling: link targets that are never pages, and default ports dropped
+# when normalizing URLs
+NON_PAGE_EXTENSIONS = frozenset([".7z", ".avi", ".css", ".csv", ".doc", ".docx", ".exe", ".gif",
+                                 ".gz", ".ico", ".jpeg", ".jpg", ".js", ".json", ".mov", ".mp3",
+                                 ".mp4", ".pdf", ".png", ".ppt", ".svg", ".tar", ".tgz", ".wav",
+                                 ".webm", ".webp", ".woff", ".woff2", ".xls", ".xlsx", ".xml",
+                                 ".zip"])
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+# Server mode: largest accepted request body, latency samples kept per
+# stage, and the page each worker processes at start-up
+MAX_REQUEST_SIZE = 64 * 1024 * 1024
+LATENCY_WINDOW = 1024
+WARMUP_PAGE = ("<html><head><title>Warm-up</title></head>"
+               "<body><main><h1>Warm-up</h1><p>Warm-up page for a new worker.</p></main></body></html>")
+
+# Bump when output changes so cached results from older versions are ignored
+RESULT_CACHE_VERSION = 2
+
+# Fraction of a WorkBudget limit that may be left when it counts as used up
+BUDGET_SLACK = 0.01
+
+# Containers whose class names mark them as the page's main content
+CONTENT_CONTAINER_TAGS = ["article", "div", "section"]
+CONTENT_CLASS_HINTS = ["content", "main", "article"]
+
+
+class DocumentIndex:
+    """Lookups over a parsed document, shared by every extraction stage."""
+
+    def __init__(self, root: Tag, skip_tags: List[str] = ()):
+        """
+        Index every tag under root by name and class in one walk.
+        
+        Text is indexed lazily: the first get_text() call for an element
+        walks its subtree once, collecting the strings into one buffer and
+        recording a (start, end) span for every tag inside it. Later calls
+        for that element or any descendant slice the shared buffer instead
+        of walking the tree again.
+        
+        Args:
+            root: Tag (usually the BeautifulSoup object) to index
+            skip_tags: Tag names whose subtrees are left out of the index;
+                       the skipped tags are collected in `skipped`
+        """
+        self.root = root
+        self.by_name: Dict[str, List[Tag]] = defaultdict(list)
+        self.by_class: Dict[str, List[Tag]] = defaultdict(list)
+        self.position: Dict[int, int] = {}
+        self.skipped: List[Tag] = []
+        self.spans: Dict[int, tuple] = {}
+        self._main_content = None
+        self._main_content_found = False
+        
+        # Pre-order walk so every list is in document order
+        stack: List[Tag] = [child for child in reversed(root.contents) if isinstance(child, bs4.Tag)]
+        while stack:
+            tag = stack.pop()
+            if tag.name in skip_tags:
+                self.skipped.append(tag)
+                continue
+            self.position[id(tag)] = len(self.position)
+            self.by_name[tag.name].append(tag)
+            classes = tag.get("class")
+            if classes:
+                for cls in ([classes] if isinstance(classes, str) else classes):
+                    self.by_class[cls].append(tag)
+            stack.extend(child for child in reversed(tag.contents) if isinstance(child, bs4.Tag))
+    
+    def find(self, name: str) -> Optional[Tag]:
+        """Return the first tag with the given name, like soup.find(name)."""
+        tags = self.by_name.get(name)
+        return tags[0] if tags else None
+    
+    def find_all(self, *names: str) -> List[Tag]:
+        """Return all tags with any of the given names, in document order."""
+        if len(names) == 1:
+            return list(self.by_name.get(names[0], ()))
+        tags = [tag for name in names for tag in self.by_name.get(name, ())]
+        return sorted(tags, key=lambda tag: self.position[id(tag)])
+    
+    def main_content(self) -> Optional[Tag]:
+        """Return <main>, or the first container whose class suggests content."""
+        if not self._main_content_found:
+            self._main_content_found = True
+            self._main_content = self.find("main")
+            if self._main_content is None:
+                candidates = [tag for cls, tags in self.by_class.items()
+                              if any(hint in cls.lower() for hint in CONTENT_CLASS_HINTS)
+                              for tag in tags if tag.name in CONTENT_CONTAINER_TAGS]
+                if candidates:
+                    self._main_content = min(candidates, key=lambda tag: self.position[id(tag)])
+        return self._main_content
+    
+    def index_text(self, root: Tag):
+        """Walk root's subtree once, recording the text span of each tag."""
+        parts = []
+        spans = []
+        offset = 0
+        text_types = text_string_types()
+        stack: List[Any] = [root]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, tuple):
+                # Closing marker: every descendant string has been seen
+                tag, start = node
+                spans.append((id(tag), start, offset))
+            elif isinstance(node, bs4.NavigableString):
+                if type(node) in text_types:
+                    parts.append(node)
+                    offset += len(node)
+            elif isinstance(node, bs4.Tag):
+                # Tags like <rt> collect other string classes; leave them to get_text()
+                if has_default_string_types(node):
+                    stack.append((node, offset))
+                stack.extend(reversed(node.contents))
+        
+        text = "".join(parts)
+        for key, start, end in spans:
+            self.spans[key] = (text, start, end)
+    
+    def get_text(self, element: Tag) -> str:
+        """Return element.get_text(), reusing already indexed text."""
+        span = self.spans.get(id(element))
+        if span is None:
+            if not has_default_string_types(element):
+                return element.get_text()
+            self.index_text(element)
+            span = self.spans[id(element)]
+        text, start, end = span
+        return text[start:end]
+    
+    def get_text_prefix(self, element: Tag, limit: int) -> str:
+        """Return at least the first limit characters of get_text(), reusing indexed text."""
+        span = self.spans.get(id(element))
+        if span is not None:
+            text, start, end = span
+            return text[start:min(end, start + limit)]
+        return text_prefix(element, limit)
+
+
+def text_prefix(element: Tag, limit: int) -> str:
+    """Return at least the first limit characters of element.get_text(), walking no further."""
+    parts = []
+    length = 0
+    text_types = text_string_types()
+    for node in element.descendants:
+        if length >= limit:
+            break
+        if type(node) in text_types:
+            parts.append(node)
+            length += len(node)
+    return "".join(parts)
+
+
+def resolve_parser(name: str) -> str:
+    """Return name if its backend is installed, else the default parser."""
+    if name not in PARSER_BACKENDS:
+        raise ValueError(f"Unknown parser: {name}")
+    module = PARSER_BACKENDS[name]
+    if module and importlib.util.find_spec(module) is None:
+        print(f"Parser '{name}' is not installed, using {DEFAULT_PARSER}", file=sys.stderr)
+        return DEFAULT_PARSER
+    return name
+
+
+def freeze(value: Any) -> Any:
+    """Make an attribute value hashable (multi-valued attributes are lists)."""
+    return tuple(value) if isinstance(value, list) else value
+
+
+def classify_element(name: str, onclick: bool, role: Any, tabindex: Any, classes: Any,
+                     contenteditable: Any, style: Any, has_href: Optional[bool],
+                     input_type: Any) -> str:
+    """
+    Determine an element's semantic type from its tag name and attributes.
+    
+    Returns the type with any interaction traits as a suffix,
+    e.g. "link:clickable,interactive".
+    """
+    # Check for clickable elements
+    is_clickable = bool(
+        name in CLICKABLE_TAGS or
+        onclick or
+        role in CLICKABLE_ROLES or
+        tabindex == "0" or
+        classes and any("btn" in cls.lower() or "button" in cls.lower() for cls in classes)
+    )
+    
+    # Check for interactive elements
+    is_interactive = bool(
+        name in INTERACTIVE_TAGS or
+        contenteditable == "true" or
+        role in INTERACTIVE_ROLES or
+        tabindex and tabindex != "-1"
+    )
+    
+    # Check for potentially scrollable containers
+    is_scrollable = bool(
+        style and ("overflow" in style or "scroll" in style) or
+        classes and any("scroll" in cls.lower() for cls in classes)
+    )
+    
+    # Determine semantic element type
+    if name == "a":
+        element_type = "link" if has_href else "other"
+    elif name == "input":
+        element_type = f"input_{input_type}"
+    else:
+        element_type = ELEMENT_TYPES.get(name, "other")
+    
+    # Check for ARIA roles that override the default semantic type
+    if role and role in ARIA_TYPE_ROLES:
+        element_type = f"aria_{role}"
+    
+    # Add interaction capabilities as a suffix if they exist
+    interaction_traits = []
+    if is_clickable:
+        interaction_traits.append("clickable")
+    if is_interactive:
+        interaction_traits.append("interactive")
+    if is_scrollable:
+        interaction_traits.append("scrollable")
+        
+    # Return the element type with potential interaction traits
+    if interaction_traits:
+        return f"{element_type}:{','.join(interaction_traits)}"
+    return element_type
+
+
+def resolve_sections(names: Optional[Iterable[str]]) -> Optional[frozenset]:
+    """
+    Expand requested section names into the set of sections to compute.
+    
+    Args:
+        names: Names from SECTIONS or CONTENT_SECTIONS, or a comma-separated
+               string of them; "categorized_content" stands for all of its
+               sub-sections. None selects everything.
+    
+    Raises:
+        ValueError: If a name is not a known section
+    """
+    if names is None:
+        return None
+    if isinstance(names, str):
+        names = names.split(",")
+    sections = set()
+    for name in names:
+        name = name.strip()
+        if name == "categorized_content":
+            sections.update(CONTENT_SECTIONS)
+        elif name in SECTIONS or name in CONTENT_SECTIONS:
+            sections.add(name)
+        else:
+            raise ValueError(f"unknown section: {name}")
+    return frozenset(sections)
+
+
+def normalize_url(url: str) -> Optional[str]:
+    """
+    Normalize an absolute http(s) URL for deduplication, or return None.
+    
+    Lowercases the scheme and host, drops default ports and fragments, and
+    gives an empty path as "/".
+    """
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return None
+    scheme = parts.scheme.lower()
+    if scheme not in DEFAULT_PORTS or not parts.hostname:
+        return None
+    host = parts.hostname
+    if ":" in host:
+        host = f"[{host}]"
+    if port is not None and port != DEFAULT_PORTS[scheme]:
+        host = f"{host}:{port}"
+    return urlunsplit((scheme, host, parts.path or "/", parts.query, ""))
+
+
+def compile_patterns(patterns: List[str]) -> re.Pattern:
+    """Compile substrings into one regex matching any of them."""
+    if not patterns:
+        return re.compile("(?!)")
+    return re.compile("|".join(re.escape(pattern) for pattern in patterns))
+
+
+class CompactRecord(Mapping):
+    """
+    Read-only mapping used for extracted nodes in place of a dict.
+    
+    Keys live in a tuple shared by every record with the same fields, and
+    values in a tuple, which takes far less memory than a dict per node.
+    Encode with json_default, or convert with to_dict().
+    """
+    __slots__ = ("schema", "data")
+
+    def __init__(self, fields: List[tuple]):
+        """
+        Args:
+            fields: (key, value) pairs in output order
+        """
+        keys = tuple(key for key, _ in fields)
+        self.schema = RECORD_SCHEMAS.setdefault(keys, keys)
+        self.data = tuple(value for _, value in fields)
+    
+    def __getitem__(self, key: str) -> Any:
+        try:
+            return self.data[self.schema.index(key)]
+        except ValueError:
+            raise KeyError(key) from None
+    
+    def __contains__(self, key: Any) -> bool:
+        return key in self.schema
+    
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.schema)
+    
+    def __len__(self) -> int:
+        return len(self.schema)
+    
+    def __repr__(self) -> str:
+        return repr(dict(zip(self.schema, self.data)))
+    
+    def to_dict(self) -> Dict:
+        """Convert to plain nested dicts and lists."""
+        return {key: to_plain(value) for key, value in zip(self.schema, self.data)}
+
+
+def to_plain(value: Any) -> Any:
+    """Convert CompactRecords anywhere inside value (a result, node or list) to plain dicts."""
+    if isinstance(value, CompactRecord):
+        return value.to_dict()
+    if isinstance(value, list):
+        return [to_plain(item) for item in value]
+    if isinstance(value, dict):
+        return {key: to_plain(item) for key, item in value.items()}
+    return value
+
+
+def from_plain(node: Any) -> Any:
+    """Rebuild an extracted node, and the nodes under it, from a plain dict (undoes to_dict)."""
+    if not isinstance(node, dict):
+        return node
+    return CompactRecord([
+        (key, [from_plain(item) for item in value] if key in RECORD_LIST_FIELDS else value)
+        for key, value in node.items()
+    ])
+
+
+def json_default(obj: Any) -> Dict:
+    """JSON encoder hook turning CompactRecords into dicts one level at a time."""
+    if isinstance(obj, CompactRecord):
+        return dict(zip(obj.schema, obj.data))
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def text_string_types() -> set:
+    """Return the string classes get_text() collects, importing bs4 on first use."""
+    global TEXT_STRING_TYPES
+    if TEXT_STRING_TYPES is None:
+        TEXT_STRING_TYPES = {bs4.NavigableString, bs4.CData}
+    return TEXT_STRING_TYPES
+
+
+def has_default_string_types(tag: Tag) -> bool:
+    """Check whether get_text() on tag collects the default string classes."""
+    interesting = getattr(tag, "interesting_string_types", None)
+    return interesting is None or interesting == text_string_types()
+
+
+class HTTPCache:
+    """On-disk cache of fetched pages, revalidated with conditional requests."""
+
+    def __init__(self, directory: str, ttl: float = 0, max_size: int = 512 * 1024 * 1024):
+        """
+        Open (or create) a cache directory.
+        
+        Args:
+            directory: Directory holding one JSON file per cached URL
+            ttl: Seconds a cached page is reused without revalidating it
+            max_size: Maximum total size in bytes; least recently used pages are evicted
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        
+        # Entries in least-recently-used order, tracked by file mtime across runs
+        entries = sorted(self.directory.glob("*/*.json"), key=lambda path: path.stat().st_mtime)
+        self.sizes: Dict[Path, int] = OrderedDict((path, path.stat().st_size) for path in entries)
+        self.total_size = sum(self.sizes.values())
+    
+    def path_for(self, url: str) -> Path:
+        """Return the entry file for a URL."""
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return self.directory / key[:2] / f"{key}.json"
+    
+    def get(self, url: str) -> Optional[Dict]:
+        """Return the cached entry for a URL and mark it recently used."""
+        path = self.path_for(url)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        with self.lock:
+            if path in self.sizes:
+                self.sizes.move_to_end(path)
+        return entry if entry.get("url") == url else None
+    
+    def is_fresh(self, entry: Dict) -> bool:
+        """Check whether an entry can be used without revalidating it."""
+        return time.time() - entry["validated_at"] < self.ttl
+    
+    def conditional_headers(self, entry: Dict) -> Dict[str, str]:
+        """Build If-None-Match/If-Modified-Since headers for an entry."""
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+    
+    def store(self, url: str, body: str, headers: Dict[str, str], truncated: bool = False,
+              final_url: Optional[str] = None):
+        """
+        Save a page with its validators, evicting old pages if over max_size.
+        
+        Args:
+            url: URL the page was requested from
+            body: Decoded page
+            headers: Response headers holding the validators
+            truncated: Whether the page was cut off at the fetch budget
+            final_url: URL the page came from after redirects (defaults to url)
+        """
+        entry = {
+            "url": url,
+            "final_url": final_url or url,
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+            "validated_at": time.time(),
+            "body": body,
+            "truncated": truncated,
+        }
+        path = self.path_for(url)
+        path.parent.mkdir(exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        
+        with self.lock:
+            self.total_size -= self.sizes.pop(path, 0)
+            self.sizes[path] = path.stat().st_size
+            self.total_size += self.sizes[path]
+            while self.total_size > self.max_size and len(self.sizes) > 1:
+                old_path, size = self.sizes.popitem(last=False)
+                self.total_size -= size
+                try:
+                    old_path.unlink()
+                except OSError:
+                    pass
+    
+    def revalidated(self, url: str, entry: Dict, headers: Dict[str, str]) -> str:
+        """Refresh an entry after a 304 response and return its body."""
+        self.store(url, entry["body"], {
+            "ETag": headers.get("ETag", entry.get("etag")),
+            "Last-Modified": headers.get("Last-Modified", entry.get("last_modified")),
+        }, truncated=entry.get("truncated", False), final_url=entry.get("final_url"))
+        return entry["body"]
+
+
+class ResultCache:
+    """SQLite store of processed results, keyed by a hash of HTML and settings."""
+
+    def __init__(self, path: str, max_size: int = 1024 * 1024 * 1024):
+        """
+        Open (or create) a result cache database.
+        
+        Args:
+            path: SQLite database file
+            max_size: Maximum total size of stored results in bytes;
+                      least recently used results are evicted
+        """
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self.db:
+            self.db.execute("CREATE TABLE IF NOT EXISTS results ("
+                            "key TEXT PRIMARY KEY, value TEXT, size INTEGER, accessed REAL)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)")
+            self.db.execute("CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER)")
+            self.db.executemany("INSERT OR IGNORE INTO stats VALUES (?, 0)",
+                                [("hits",), ("misses",), ("size",)])
+    
+    def get(self, key: str) -> Optional[Dict]:
+        """
+        Return the stored result for key, counting a hit or miss.
+        
+        Nodes in categorized_content come back as CompactRecords, as
+        analyze_html returns them.
+        """
+        with self.lock, self.db:
+            row = self.db.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.db.execute("UPDATE stats SET value = value + 1 WHERE name = 'misses'")
+                return None
+            self.db.execute("UPDATE results SET accessed = ? WHERE key = ?", (time.time(), key))
+            self.db.execute("UPDATE stats SET value = value + 1 WHERE name = 'hits'")
+        result = json.loads(row[0])
+        if "categorized_content" in result:
+            result["categorized_content"] = {
+                section: [from_plain(node) for node in nodes]
+                for section, nodes in result["categorized_content"].items()
+            }
+        return result
+    
+    def put(self, key: str, result: Dict):
+        """Store a result, evicting least recently used results if over max_size."""
+        value = json.dumps(result, ensure_ascii=False, default=json_default)
+        with self.lock, self.db:
+            old = self.db.execute("SELECT size FROM results WHERE key = ?", (key,)).fetchone()
+            self.db.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                            (key, value, len(value), time.time()))
+            self.db.execute("UPDATE stats SET value = value + ? WHERE name = 'size'",
+                            (len(value) - (old[0] if old else 0),))
+            
+            size = self.db.execute("SELECT value FROM stats WHERE name = 'size'").fetchone()[0]
+            while size > self.max_size:
+                rows = self.db.execute("SELECT key, size FROM results WHERE key != ? "
+                                       "ORDER BY accessed LIMIT 100", (key,)).fetchall()
+                if not rows:
+                    break
+                for old_key, old_size in rows:
+                    if size <= self.max_size:
+                        break
+                    self.db.execute("DELETE FROM results WHERE key = ?", (old_key,))
+                    size -= old_size
+            self.db.execute("UPDATE stats SET value = ? WHERE name = 'size'", (size,))
+    
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss counts and the number and total size of stored results."""
+        with self.lock:
+            stats = dict(self.db.execute("SELECT name, value FROM stats"))
+            stats["entries"] = self.db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        return stats
+
+
+class Profiler:
+    """Per-stage timings, counters and peak memory for profiled runs."""
+
+    def __init__(self, trace_memory: bool = False,
+                 hooks: List[Callable[[str, float], None]] = None):
+        """
+        Create an empty profile.
+        
+        Args:
+            trace_memory: Track peak memory per page with tracemalloc (slow)
+            hooks: Functions called with (stage, seconds) as each stage finishes
+        """
+        self.trace_memory = trace_memory
+        self.hooks = hooks or []
+        self.lock = threading.Lock()
+        self.reset()
+    
+    def reset(self):
+        """Clear all recorded data."""
+        self.pages = 0
+        self.stages: Dict[str, float] = defaultdict(float)
+        self.counters: Dict[str, int] = defaultdict(int)
+        self.peak_memory = 0
+    
+    @contextmanager
+    def stage(self, name: str):
+        """Time a block of work as the named stage."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.stages[name] += elapsed
+            for hook in self.hooks:
+                hook(name, elapsed)
+    
+    def count(self, name: str, n: int = 1):
+        """Add n to the named counter."""
+        self.counters[name] += n
+    
+    def start_page(self):
+        """Mark the start of a page, resetting the memory peak."""
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+    
+    def end_page(self):
+        """Mark the end of a page, recording its memory peak."""
+        self.pages += 1
+        if self.trace_memory and tracemalloc.is_tracing():
+            self.peak_memory = max(self.peak_memory, tracemalloc.get_traced_memory()[1])
+    
+    def report(self) -> Dict:
+        """Return the recorded data as a JSON-serializable dict."""
+        return {
+            "pages": self.pages,
+            "stages": {name: round(seconds, 6) for name, seconds in self.stages.items()},
+            "counters": dict(self.counters),
+            "peak_memory": self.peak_memory,
+        }
+    
+    def merge(self, report: Dict):
+        """Add a report from another profiler (e.g. a worker process) to this one."""
+        self.pages += report["pages"]
+        for name, seconds in report["stages"].items():
+            self.stages[name] += seconds
+        for name, count in report["counters"].items():
+            self.counters[name] += count
+        self.peak_memory = max(self.peak_memory, report["peak_memory"])
+
+
+class LatencyMetrics:
+    """Per-stage latency percentiles over a window of recent requests."""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        """
+        Args:
+            window: Most recent samples kept per stage for percentiles
+        """
+        self.window = window
+        self.lock = threading.Lock()
+        self.samples: Dict[str, deque] = {}
+        self.counts: Dict[str, int] = defaultdict(int)
+        self.totals: Dict[str, float] = defaultdict(float)
+    
+    def record(self, name: str, seconds: float):
+        """Add one sample for the named stage."""
+        with self.lock:
+            samples = self.samples.get(name)
+            if samples is None:
+                samples = self.samples[name] = deque(maxlen=self.window)
+            samples.append(seconds)
+            self.counts[name] += 1
+            self.totals[name] += seconds
+    
+    @contextmanager
+    def stage(self, name: str):
+        """Time a block of work as one sample of the named stage."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+    
+    def report(self) -> Dict:
+        """Return count, mean and percentiles (in seconds) for every stage."""
+        with self.lock:
+            stages = {name: sorted(samples) for name, samples in self.samples.items()}
+            counts = dict(self.counts)
+            totals = dict(self.totals)
+        report = {}
+        for name, samples in stages.items():
+            report[name] = {
+                "count": counts[name],
+                "mean": round(totals[name] / counts[name], 6),
+                "p50": round(samples[len(samples) // 2], 6),
+                "p95": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 6),
+                "p99": round(samples[min(len(samples) - 1, int(len(samples) * 0.99))], 6),
+                "max": round(samples[-1], 6),
+            }
+        return report
+
+
+class WorkBudget:
+    """
+    Limits on the work extract_element_content does for one page.
+    
+    Counts extracted nodes and the characters of the strings they carry
+    (text, attribute values and option labels), and tracks time since the
+    page's extraction started. Any limit may be None to leave it unbounded.
+    """
+
+    def __init__(self, max_nodes: Optional[int] = None, max_output_size: Optional[int] = None,
+                 time_limit: Optional[float] = None):
+        """
+        Args:
+            max_nodes: Nodes extracted before the budget runs out
+            max_output_size: Characters of extracted strings before the budget runs out
+            time_limit: Seconds of extraction before the budget runs out
+        """
+        self.max_nodes = max_nodes
+        self.max_output_size = max_output_size
+        self.time_limit = time_limit
+        self.start = time.monotonic()
+        self.nodes = 0
+        self.output_size = 0
+    
+    def fraction_left(self) -> float:
+        """Return the smallest fraction of any limit not yet used, from 1 down to 0."""
+        used = 0.0
+        if self.max_nodes is not None:
+            used = max(used, self.nodes / self.max_nodes)
+        if self.max_output_size is not None:
+            used = max(used, self.output_size / self.max_output_size)
+        if self.time_limit is not None:
+            used = max(used, (time.monotonic() - self.start) / self.time_limit)
+        return max(0.0, 1.0 - used)
+    
+    def exhausted(self) -> bool:
+        """
+        Whether any limit has been reached, or come within BUDGET_SLACK of it.
+        
+        Texts that take a share of what is left would otherwise leave ever
+        smaller remainders without the limit ever being reached.
+        """
+        return self.fraction_left() <= BUDGET_SLACK
+    
+    def depth(self, max_depth: int) -> int:
+        """Return the depth to extract to, shrinking from max_depth as the budget is used."""
+        return math.ceil(max_depth * self.fraction_left())
+    
+    def allowance(self, share: float = 1.0) -> Optional[int]:
+        """Return characters of output a text may take (share of what is left), or None if unbounded."""
+        if self.max_output_size is None:
+            return None
+        return int(max(0, self.max_output_size - self.output_size) * share)
+    
+    def clip(self, text: str, share: float = 1.0) -> str:
+        """Charge text to the output budget, cutting it to its allowance."""
+        allowance = self.allowance(share)
+        if allowance is not None:
+            text = text[:allowance]
+        self.output_size += len(text)
+        return text
+    
+    def charge(self, value: Any):
+        """Charge the strings in a field value (including inside lists and dicts) to the output budget."""
+        if isinstance(value, str):
+            self.output_size += len(value)
+        elif isinstance(value, dict):
+            for key, item in value.items():
+                self.output_size += len(key)
+                self.charge(item)
+        elif isinstance(value, list):
+            for item in value:
+                self.charge(item)
+
+
+def omitted_summary(nodes: Iterable[Any]) -> CompactRecord:
+    """Summarize nodes left out when a WorkBudget ran out: their count and tags."""
+    count = 0
+    tags: Dict[str, int] = defaultdict(int)
+    for node in nodes:
+        if isinstance(node, bs4.Tag):
+            tags[node.name] += 1
+        elif not isinstance(node, bs4.NavigableString) or not node.strip():
+            continue
+        count += 1
+    fields = [("type", "truncated"), ("omitted", count)]
+    if tags:
+        fields.append(("tags", dict(tags)))
+    return CompactRecord(fields)
+
 
-import requests
-from bs4 import BeautifulSoup, Tag, NavigableString
-import html2text
+class StreamingExtractor(HTMLParser):
+    """
+    Incremental extractor that emits records while HTML is being fed.
+    
+    No tree is built: only the stack of open tag names and the text of the
+    title and of the current block, heading and link are held, so memory
+    stays bounded regardless of page size. Script, style and ignored
+    subtrees are skipped as they are tokenized.
+    """
+
+    def __init__(self, processor: "WebpageProcessor", chunk_size: int = STREAM_CHUNK_SIZE):
+        """
+        Args:
+            processor: WebpageProcessor supplying min_text_length and ignore patterns
+            chunk_size: Maximum characters of text per emitted text record
+        """
+        super().__init__(convert_charrefs=True)
+        self.processor = processor
+        self.chunk_size = chunk_size
+        self.records: List[Dict] = []
+        self.stack: List[str] = []
+        self.skip_depth = 0
+        self.metadata: Optional[Dict] = {}
+        self.og_url: Optional[str] = None
+        self.canonical: Optional[str] = None
+        self.text: List[str] = []
+        self.text_length = 0
+        self.title: Optional[List[str]] = None
+        self.title_length = 0
+        # [level or href, text parts, text length] of the open heading/link
+        self.heading: Optional[list] = None
+        self.link: Optional[list] = None
+    
+    def drain(self) -> List[Dict]:
+        """Return and clear the records emitted so far."""
+        records, self.records = self.records, []
+        return records
+    
+    def handle_starttag(self, tag: str, attrs: List[tuple]):
+        if self.skip_depth:
+            if tag not in VOID_TAGS:
+                self.stack.append(tag)
+            return
+        
+        attributes = dict(attrs)
+        if tag in STREAM_SKIP_TAGS or self.processor.is_ignored(
+                (attributes.get("class") or "").split(), attributes.get("id")):
+            if tag not in VOID_TAGS:
+                self.stack.append(tag)
+                self.skip_depth = len(self.stack)
+            return
+        
+        if tag in BLOCK_TAGS:
+            self.flush_text()
+        if tag == "body":
+            self.flush_metadata()
+        elif tag == "title":
+            self.title = []
+            self.title_length = 0
+        elif tag == "html" and attributes.get("lang") and self.metadata is not None:
+            self.metadata["language"] = attributes["lang"]
+        elif tag == "meta":
+            self.handle_meta(attributes)
+        elif tag == "link" and self.metadata is not None:
+            # The first canonical link wins, as in extract_metadata
+            if "canonical" in (attributes.get("rel") or "").split() and self.canonical is None:
+                self.canonical = attributes.get("href") or ""
+        elif tag in HEADING_TAGS:
+            self.heading = [tag[1], [], 0]
+        elif tag == "a" and attributes.get("href") is not None:
+            self.link = [attributes["href"], [], 0]
+        
+        if tag not in VOID_TAGS:
+            self.stack.append(tag)
+    
+    def handle_endtag(self, tag: str):
+        if tag not in self.stack:
+            return
+        while self.stack:
+            closed = self.stack.pop()
+            if self.skip_depth:
+                if len(self.stack) < self.skip_depth:
+                    self.skip_depth = 0
+            else:
+                self.close_tag(closed)
+            if closed == tag:
+                break
+    
+    def close_tag(self, tag: str):
+        """Emit whatever the closed element completes."""
+        if tag in BLOCK_TAGS:
+            self.flush_text()
+        if tag == "head":
+            self.flush_metadata()
+        elif tag == "title" and self.title is not None:
+            if self.metadata is not None and "title" not in self.metadata:
+                self.metadata["title"] = "".join(self.title).strip()
+            self.title = None
+        elif tag in HEADING_TAGS and self.heading:
+            level, parts, _ = self.heading
+            text = "".join(parts).strip()
+            if text:
+                self.records.append({"type": "heading", "level": level, "text": text})
+            self.heading = None
+        elif tag == "a" and self.link:
+            href, parts, _ = self.link
+            text = "".join(parts).strip()
+            if text:
+                record = {"type": "link", "href": href, "text": text}
+                if href.startswith(("http", "https", "ftp", "mailto")):
+                    record["external"] = True
+                self.records.append(record)
+            self.link = None
+    
+    def handle_data(self, data: str):
+        if self.skip_depth:
+            return
+        if self.title is not None:
+            # An unclosed <title> would otherwise collect the rest of the page
+            if self.title_length < self.chunk_size:
+                self.title.append(data)
+                self.title_length += len(data)
+            return
+        for element in filter(None, (self.heading, self.link)):
+            if element[2] < self.chunk_size:
+                element[1].append(data)
+                element[2] += len(data)
+        if self.heading:
+            # Heading text is emitted by its own record
+            return
+        self.text.append(data)
+        self.text_length += len(data)
+        if self.text_length >= self.chunk_size:
+            self.flush_text()
+    
+    def handle_meta(self, attributes: Dict[str, Optional[str]]):
+        """Record description, keywords and og:url meta tags."""
+        if self.metadata is None:
+            return
+        name = (attributes.get("name") or "").lower()
+        property_name = (attributes.get("property") or "").lower()
+        if name == "description" or property_name == "og:description":
+            self.metadata["description"] = attributes.get("content") or ""
+        elif name == "keywords":
+            self.metadata["keywords"] = attributes.get("content") or ""
+        elif property_name == "og:url":
+            self.og_url = attributes.get("content") or ""
+    
+    def flush_metadata(self):
+        """Emit the metadata record once the head is complete."""
+        if self.metadata is not None:
+            # A <link rel="canonical"> takes precedence over og:url
+            if self.canonical:
+                self.metadata["canonical_url"] = self.canonical
+            elif self.og_url is not None:
+                self.metadata["canonical_url"] = self.og_url
+            if self.metadata:
+                self.records.append({"type": "metadata", "metadata": self.metadata})
+            self.metadata = None
+    
+    def flush_text(self):
+        """Emit the pending block text as a text record if long enough."""
+        if not self.text:
+            return
+        text = " ".join("".join(self.text).split())
+        self.text = []
+        self.text_length = 0
+        if len(text) >= self.processor.min_text_length:
+            self.records.append({"type": "text", "text": text})
+    
+    def close(self):
+        super().close()
+        while self.stack:
+            self.handle_endtag(self.stack[-1])
+        self.flush_text()
+        self.flush_metadata()
 
 
 class WebpageProcessor:
@@ -21,7 +1162,17 @@ class WebpageProcessor:
 
     def __init__(self, min_text_length: int = 10, 
                  ignore_classes: List[str] = None,
-                 ignore_ids: List[str] = None):
+                 ignore_ids: List[str] = None,
+                 parser: str = DEFAULT_PARSER,
+                 max_depth: int = 3,
+                 result_cache: Optional[str] = None,
+                 result_cache_size: int = 1024,
+                 sections: Optional[Iterable[str]] = None,
+                 max_fetch_size: int = MAX_FETCH_SIZE,
+                 fetch_time_limit: float = FETCH_TIME_LIMIT,
+                 max_nodes: Optional[int] = None,
+                 max_output_size: Optional[int] = None,
+                 time_budget: Optional[float] = None):
         """
         Initialize the processor with configurable options.
         
@@ -29,36 +1180,139 @@ class WebpageProcessor:
             min_text_length: Minimum length of text to consider meaningful
             ignore_classes: CSS classes to ignore (ads, menus, etc.)
             ignore_ids: Element IDs to ignore
+            parser: HTML parser backend (falls back to html.parser if not installed)
+            max_depth: Maximum depth of extracted element trees
+            result_cache: SQLite file caching results by HTML content and settings
+            result_cache_size: Maximum result cache size in MB
+            sections: Sections to compute by default (see resolve_sections);
+                      None computes everything
+            max_fetch_size: Bytes of a fetched page read before truncating it
+            fetch_time_limit: Seconds spent reading a fetched page before truncating it
+            max_nodes: Nodes extracted into categorized_content per page
+            max_output_size: Characters of text and attribute values extracted into categorized_content per page
+            time_budget: Seconds spent extracting categorized_content per page
         """
         self.min_text_length = min_text_length
+        self.parser = resolve_parser(parser)
+        self.max_depth = max_depth
+        self.sections = resolve_sections(sections)
+        self.max_fetch_size = max_fetch_size
+        self.fetch_time_limit = fetch_time_limit
+        self.max_nodes = max_nodes
+        self.max_output_size = max_output_size
+        self.time_budget = time_budget
+        # Budget of the page being categorized, when any limit is set
+        self.budget: Optional[WorkBudget] = None
         self.ignore_classes = ignore_classes or ["ad", "advertisement", "banner", 
                                                 "cookie", "popup", "menu-item", 
                                                 "footer", "sidebar"]
         self.ignore_ids = ignore_ids or ["ad", "advertisement", "banner", 
                                         "cookie-notice", "popup", "sidebar"]
-        self.h2t = html2text.HTML2Text()
-        self.h2t.ignore_links = False
-        self.h2t.ignore_images = False
-        self.h2t.ignore_tables = False
-        self.h2t.body_width = 0  # No wrapping
+        self.ignore_classes_pattern = compile_patterns(self.ignore_classes)
+        self.ignore_ids_pattern = compile_patterns(self.ignore_ids)
+        self.element_types: Dict[tuple, str] = {}
+        self.index: Optional[DocumentIndex] = None
+        self.session: Optional[requests.Session] = None
+        self.cache: Optional[HTTPCache] = None
+        self.profiler: Optional[Profiler] = None
+        self.result_cache: Optional[ResultCache] = None
+        if result_cache:
+            self.result_cache = ResultCache(result_cache, max_size=result_cache_size * 1024 * 1024)
+    
+    def new_h2t(self) -> html2text.HTML2Text:
+        """
+        Create an HTML to Markdown converter (importing html2text on first use).
+        
+        HTML2Text keeps table, list and <pre> state between documents, so
+        each rendering gets its own converter instead of sharing one.
+        """
+        h2t = html2text.HTML2Text()
+        h2t.ignore_links = False
+        h2t.ignore_images = False
+        h2t.ignore_tables = False
+        h2t.body_width = 0  # No wrapping
+        return h2t
+    
+    def stage(self, name: str):
+        """Return a context manager timing the named stage when profiling."""
+        if self.profiler is None:
+            return NULL_STAGE
+        return self.profiler.stage(name)
+    
+    def document_index(self, soup: BeautifulSoup) -> DocumentIndex:
+        """Return the index for soup, reusing the one built by process_html."""
+        if self.index is not None and self.index.root is soup:
+            return self.index
+        return DocumentIndex(soup)
     
-    def fetch_url(self, url: str) -> Optional[str]:
+    def element_text(self, element: Tag) -> str:
+        """Get the text of an element, using the document index if available."""
+        if self.index is not None:
+            return self.index.get_text(element)
+        return element.get_text()
+    
+    def element_text_prefix(self, element: Tag, limit: int) -> str:
+        """Get at least the first limit characters of an element's text."""
+        if self.index is not None:
+            return self.index.get_text_prefix(element, limit)
+        return text_prefix(element, limit)
+    
+    def fetch_url(self, url: str) -> Tuple[Optional[str], bool]:
         """Fetch content from URL."""
+        with self.stage("fetch"):
+            return self.fetch_url_content(url)
+    
+    def fetch_url_content(self, url: str) -> Tuple[Optional[str], bool]:
+        """
+        Fetch content from URL, using the HTTP cache if one is set.
+        
+        Returns the page (None on error) and whether it was truncated
+        (see fetch_page).
+        """
+        html_content, truncated, _ = self.fetch_page(url)
+        return html_content, truncated
+    
+    def fetch_page(self, url: str) -> Tuple[Optional[str], bool, str]:
+        """
+        Fetch a page, using the HTTP cache if one is set.
+        
+        The body is streamed and decoded as it arrives, stopping once
+        max_fetch_size bytes have been read or fetch_time_limit seconds
+        have passed. Returns the page (None on error), whether it was
+        truncated, and the URL it came from after redirects, which is what
+        its relative links resolve against.
+        """
         try:
             headers = {
                 "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
             }
-            response = requests.get(url, headers=headers, timeout=10)
-            response.raise_for_status()
-            return response.text
+            cached = self.cache.get(url) if self.cache else None
+            if cached:
+                if self.cache.is_fresh(cached):
+                    return cached["body"], cached.get("truncated", False), cached.get("final_url", url)
+                headers.update(self.cache.conditional_headers(cached))
+                
+            http = self.session or requests
+            with http.get(url, headers=headers, timeout=10, stream=True) as response:
+                if cached and response.status_code == 304:
+                    return (self.cache.revalidated(url, cached, response.headers),
+                            cached.get("truncated", False), cached.get("final_url", url))
+                response.raise_for_status()
+                body = ResponseBody(response, self.max_fetch_size, self.fetch_time_limit)
+                html_content = "".join(decode_chunks(body, response.headers.get("Content-Type", "")))
+            
+            if self.cache:
+                self.cache.store(url, html_content, response.headers, truncated=body.truncated,
+                                 final_url=response.url)
+            return html_content, body.truncated, response.url
         except Exception as e:
             print(f"Error fetching URL: {e}", file=sys.stderr)
-            return None
+            return None, False, url
     
     def read_file(self, filepath: str) -> Optional[str]:
-        """Read content from file."""
+        """Read content from file, decompressing .gz and .zst files."""
         try:
-            with open(filepath, "r", encoding="utf-8") as f:
+            with self.stage("read"), open_text(filepath) as f:
                 return f.read()
         except Exception as e:
             print(f"Error reading file: {e}", file=sys.stderr)
@@ -66,146 +1320,53 @@ class WebpageProcessor:
     
     def should_ignore_element(self, element: Tag) -> bool:
         """Check if element should be ignored based on class/id."""
-        if not isinstance(element, Tag):
+        if self.profiler is not None:
+            self.profiler.count("should_ignore_element")
+        if not isinstance(element, bs4.Tag):
             return False
             
+        return self.is_ignored(element.get("class"), element.get("id"))
+    
+    def is_ignored(self, classes: Optional[List[str]], element_id: Optional[str]) -> bool:
+        """Check whether any class or the id matches the ignore patterns."""
         # Check if any classes match ignore patterns
-        if element.get("class"):
-            for cls in element.get("class"):
-                if any(ignored in cls.lower() for ignored in self.ignore_classes):
+        if classes:
+            for cls in classes:
+                if self.ignore_classes_pattern.search(cls.lower()):
                     return True
         
         # Check if id matches ignore patterns
-        if element.get("id"):
-            element_id = element.get("id").lower()
-            if any(ignored in element_id for ignored in self.ignore_ids):
-                return True
+        if element_id and self.ignore_ids_pattern.search(element_id.lower()):
+            return True
                 
         return False
     
     def get_element_type(self, element: Tag) -> str:
         """Determine semantic element type with detailed interaction capabilities."""
-        if not isinstance(element, Tag):
+        if self.profiler is not None:
+            self.profiler.count("get_element_type")
+        if not isinstance(element, bs4.Tag):
             return "text"
         
-        # Extract common interactive attributes
-        is_clickable = False
-        is_interactive = False
-        is_scrollable = False
-        
-        # Check for clickable elements
-        if (element.name in ["a", "button", "summary"] or 
-            element.get("onclick") or 
-            element.get("role") in ["button", "link", "menuitem"] or
-            element.get("tabindex") == "0" or
-            element.get("class") and any(cls for cls in element.get("class") if "btn" in cls.lower() or "button" in cls.lower())
-           ):
-            is_clickable = True
-            
-        # Check for interactive elements
-        if (element.name in ["input", "select", "textarea", "button", "a"] or
-            element.get("contenteditable") == "true" or
-            element.get("role") in ["textbox", "combobox", "slider", "checkbox", "radio", "menuitem", "tab"] or
-            element.get("tabindex") and element.get("tabindex") != "-1"
-           ):
-            is_interactive = True
-            
-        # Check for potentially scrollable containers
-        if (element.get("style") and ("overflow" in element.get("style") or "scroll" in element.get("style")) or
-            element.get("class") and any(cls for cls in element.get("class") if "scroll" in cls.lower())
-           ):
-            is_scrollable = True
-            
-        # Now determine the primary element type
-        element_type = "other"
-        
-        # Determine semantic element type
-        if element.name in ["h1", "h2", "h3", "h4", "h5", "h6"]:
-            element_type = "heading"
-        elif element.name == "a" and element.get("href"):
-            element_type = "link"
-        elif element.name == "img":
-            element_type = "image"
-        elif element.name == "ul" or element.name == "ol":
-            element_type = "list"
-        elif element.name == "li":
-            element_type = "list_item"
-        elif element.name == "table":
-            element_type = "table"
-        elif element.name == "tr":
-            element_type = "table_row"
-        elif element.name == "td" or element.name == "th":
-            element_type = "table_cell"
-        elif element.name == "form":
-            element_type = "form"
-        elif element.name == "button":
-            element_type = "button"
-        elif element.name == "input":
-            input_type = element.get("type", "text")
-            element_type = f"input_{input_type}"
-        elif element.name == "textarea":
-            element_type = "textarea"
-        elif element.name == "select":
-            element_type = "select"
-        elif element.name == "option":
-            element_type = "option"
-        elif element.name == "label":
-            element_type = "label"
-        elif element.name == "code" or element.name == "pre":
-            element_type = "code"
-        elif element.name == "blockquote":
-            element_type = "quote"
-        elif element.name in ["iframe", "frame", "embed"]:
-            element_type = "embedded_content"
-        elif element.name == "audio":
-            element_type = "audio"
-        elif element.name == "video":
-            element_type = "video"
-        elif element.name == "canvas":
-            element_type = "canvas"
-        elif element.name == "svg":
-            element_type = "svg"
-        elif element.name == "dialog":
-            element_type = "dialog"
-        elif element.name == "details":
-            element_type = "expandable"
-        elif element.name == "summary":
-            element_type = "expander"
-        elif element.name in ["div", "section", "article"]:
-            element_type = "container"
-        elif element.name == "p":
-            element_type = "paragraph"
-        elif element.name == "nav":
-            element_type = "navigation"
-        elif element.name == "header":
-            element_type = "header"
-        elif element.name == "footer":
-            element_type = "footer"
-        elif element.name == "aside":
-            element_type = "sidebar"
-        elif element.name == "main":
-            element_type = "main_content"
-        
-        # Check for ARIA roles that override the default semantic type
-        if element.get("role"):
-            aria_role = element.get("role")
-            if aria_role in ["button", "link", "checkbox", "radio", "tab", "menuitem", "combobox",
-                           "listbox", "textbox", "searchbox", "slider", "spinbutton", "switch",
-                           "grid", "treegrid", "menu", "menubar", "tree", "tablist", "dialog"]:
-                element_type = f"aria_{aria_role}"
-        
-        # Add interaction capabilities as a suffix if they exist
-        interaction_traits = []
-        if is_clickable:
-            interaction_traits.append("clickable")
-        if is_interactive:
-            interaction_traits.append("interactive")
-        if is_scrollable:
-            interaction_traits.append("scrollable")
-            
-        # Return the element type with potential interaction traits
-        if interaction_traits:
-            return f"{element_type}:{','.join(interaction_traits)}"
+        # Only these attributes affect the type, so elements that share them share a result
+        attrs = element.attrs
+        name = element.name
+        key = (
+            name,
+            bool(attrs.get("onclick")),
+            freeze(attrs.get("role")),
+            freeze(attrs.get("tabindex")),
+            freeze(attrs.get("class")),
+            freeze(attrs.get("contenteditable")),
+            freeze(attrs.get("style")),
+            bool(attrs.get("href")) if name == "a" else None,
+            freeze(attrs.get("type", "text")) if name == "input" else None,
+        )
+        element_type = self.element_types.get(key)
+        if element_type is None:
+            if len(self.element_types) >= MAX_ELEMENT_TYPES:
+                self.element_types.clear()
+            element_type = self.element_types[key] = classify_element(*key)
         return element_type
 
     def extract_metadata(self, soup: BeautifulSoup) -> Dict:
@@ -218,12 +1379,15 @@ class WebpageProcessor:
             "language": None,
         }
         
+        index = self.document_index(soup)
+        
         # Extract title
-        if soup.title:
-            metadata["title"] = soup.title.get_text().strip()
+        title = index.find("title")
+        if title:
+            metadata["title"] = self.element_text(title).strip()
         
         # Extract metadata tags
-        for meta in soup.find_all("meta"):
+        for meta in index.find_all("meta"):
             name = meta.get("name", "").lower()
             property_name = meta.get("property", "").lower()
             
@@ -235,35 +1399,52 @@ class WebpageProcessor:
                 metadata["canonical_url"] = meta.get("content", "")
             
         # Extract language
-        html_tag = soup.find("html")
+        html_tag = index.find("html")
         if html_tag and html_tag.get("lang"):
             metadata["language"] = html_tag.get("lang")
             
         # Extract canonical URL
-        canonical = soup.find("link", rel="canonical")
+        canonical = next((link for link in index.find_all("link")
+                          if "canonical" in link.get_attribute_list("rel")), None)
         if canonical and canonical.get("href"):
             metadata["canonical_url"] = canonical.get("href")
             
         return {k: v for k, v in metadata.items() if v is not None}
 
     def extract_element_content(self, element: Union[Tag, NavigableString], 
-                               depth: int = 0, max_depth: int = 3) -> Dict:
+                               depth: int = 0, max_depth: Optional[int] = None) -> Optional["CompactRecord"]:
         """
         Extract content and structure from element recursively with detailed interactive properties.
         
         Args:
             element: BeautifulSoup element
             depth: Current recursion depth
-            max_depth: Maximum recursion depth
+            max_depth: Maximum recursion depth (defaults to the processor's max_depth)
         
         Returns:
-            Dict containing element structure and content with interactive properties
+            CompactRecord (a read-only mapping; see CompactRecord.to_dict) containing
+            element structure and content with interactive properties
+        
+        When self.budget is set, depth shrinks as the budget is used, text
+        is cut to the output left, and once the budget runs out the
+        remaining children of an element are replaced by a "truncated"
+        node counting them (see omitted_summary).
         """
+        if max_depth is None:
+            max_depth = self.max_depth
+        if self.profiler is not None:
+            self.profiler.count("nodes_extracted")
+        budget = self.budget
+        if budget is not None:
+            budget.nodes += 1
+            
         # Handle plain text
-        if isinstance(element, NavigableString):
+        if isinstance(element, bs4.NavigableString):
             text = str(element).strip()
             if text and len(text) >= self.min_text_length:
-                return {"type": "text", "content": text}
+                if budget is not None:
+                    text = budget.clip(text)
+                return CompactRecord([("type", "text"), ("content", text)])
             return None
         
         # Skip ignored elements
@@ -272,288 +1453,643 @@ class WebpageProcessor:
             
         # Get element type and basic attributes
         element_type = self.get_element_type(element)
-        result = {"type": element_type}
+        fields = [("type", sys.intern(element_type))]
         
-        # Extract text content
-        text_content = element.get_text().strip()
+        # Extract text content. Under an output budget an element's text
+        # (which repeats its children's) takes at most half of what is left,
+        # and only that much of it is collected.
+        allowance = budget.allowance(0.5) if budget is not None else None
+        if allowance is None:
+            text_content = self.element_text(element).strip()
+        else:
+            text_content = self.element_text_prefix(element, allowance).strip()
+        if budget is not None:
+            text_content = budget.clip(text_content, 0.5)
         if text_content:
-            result["text"] = text_content
+            fields.append(("text", text_content))
             
         # Extract attributes based on element type
         if "link" in element_type or element.name == "a":
-            result["href"] = element.get("href", "")
-            result["text"] = text_content
+            href = element.get("href", "")
+            fields.append(("href", href))
+            if not text_content:
+                fields.append(("text", text_content))
             # Check if it's an external link
-            if result["href"] and result["href"].startswith(("http", "https", "ftp", "mailto")):
-                result["external"] = True
+            if href and href.startswith(("http", "https", "ftp", "mailto")):
+                fields.append(("external", True))
                 
         elif "image" in element_type or element.name == "img":
-            result["src"] = element.get("src", "")
-            result["alt"] = element.get("alt", "")
+            fields.append(("src", element.get("src", "")))
+            fields.append(("alt", element.get("alt", "")))
             if element.get("width"):
-                result["width"] = element.get("width")
+                fields.append(("width", element.get("width")))
             if element.get("height"):
-                result["height"] = element.get("height")
+                fields.append(("height", element.get("height")))
                 
         elif "heading" in element_type or element.name in ["h1", "h2", "h3", "h4", "h5", "h6"]:
-            result["level"] = element.name[1]  # h1 -> 1, h2 -> 2, etc.
-            result["text"] = text_content
+            fields.append(("level", element.name[1]))  # h1 -> 1, h2 -> 2, etc.
+            if not text_content:
+                fields.append(("text", text_content))
             
         elif "input" in element_type or element.name == "input":
             input_type = element.get("type", "text")
-            result["input_type"] = input_type
-            result["name"] = element.get("name", "")
-            result["placeholder"] = element.get("placeholder", "")
+            fields.append(("input_type", input_type))
+            fields.append(("name", element.get("name", "")))
+            fields.append(("placeholder", element.get("placeholder", "")))
             
             # Add more detailed input information
             if element.get("required"):
-                result["required"] = True
+                fields.append(("required", True))
             if element.get("disabled"):
-                result["disabled"] = True
+                fields.append(("disabled", True))
             if element.get("readonly"):
-                result["readonly"] = True
+                fields.append(("readonly", True))
             if element.get("value"):
-                result["value"] = element.get("value")
+                fields.append(("value", element.get("value")))
             if element.get("min"):
-                result["min"] = element.get("min")
+                fields.append(("min", element.get("min")))
             if element.get("max"):
-                result["max"] = element.get("max")
+                fields.append(("max", element.get("max")))
             if element.get("maxlength"):
-                result["maxlength"] = element.get("maxlength")
+                fields.append(("maxlength", element.get("maxlength")))
                 
         elif "button" in element_type or element.name == "button":
-            result["button_type"] = element.get("type", "submit")
+            fields.append(("button_type", element.get("type", "submit")))
             if element.get("disabled"):
-                result["disabled"] = True
+                fields.append(("disabled", True))
             if element.get("form"):
-                result["form"] = element.get("form")
+                fields.append(("form", element.get("form")))
                 
         elif "textarea" in element_type or element.name == "textarea":
-            result["name"] = element.get("name", "")
-            result["rows"] = element.get("rows", "")
-            result["cols"] = element.get("cols", "")
+            fields.append(("name", element.get("name", "")))
+            fields.append(("rows", element.get("rows", "")))
+            fields.append(("cols", element.get("cols", "")))
             if element.get("required"):
-                result["required"] = True
+                fields.append(("required", True))
             if element.get("disabled"):
-                result["disabled"] = True
+                fields.append(("disabled", True))
             if element.get("readonly"):
-                result["readonly"] = True
+                fields.append(("readonly", True))
                 
         elif "select" in element_type or element.name == "select":
-            result["name"] = element.get("name", "")
-            result["multiple"] = element.has_attr("multiple")
+            fields.append(("name", element.get("name", "")))
+            fields.append(("multiple", element.has_attr("multiple")))
             
             # Extract options
             options = []
-            for option in element.find_all("option"):
-                option_data = {
-                    "value": option.get("value", ""),
-                    "text": option.get_text().strip()
-                }
+            all_options = element.find_all("option")
+            for i, option in enumerate(all_options):
+                if budget is not None:
+                    if budget.exhausted():
+                        options.append(omitted_summary(all_options[i:]))
+                        break
+                    budget.nodes += 1
+                value = option.get("value", "")
+                option_text = self.element_text(option).strip()
+                if budget is not None:
+                    value = budget.clip(value)
+                    option_text = budget.clip(option_text)
+                option_data = [("value", value), ("text", option_text)]
                 if option.has_attr("selected"):
-                    option_data["selected"] = True
+                    option_data.append(("selected", True))
                 if option.has_attr("disabled"):
-                    option_data["disabled"] = True
-                options.append(option_data)
+                    option_data.append(("disabled", True))
+                options.append(CompactRecord(option_data))
                 
             if options:
-                result["options"] = options
+                fields.append(("options", options))
         
         elif "table" in element_type and element.name == "table":
             # Extract basic table structure
-            result["rows"] = len(element.find_all("tr"))
-            if element.find("thead"):
-                result["has_header"] = True
-            if element.find("tbody"):
-                result["has_body"] = True
-            if element.find("tfoot"):
-                result["has_footer"] = True
+            fields.append(("rows", len(element.find_all("tr"))))
+            # Under a budget, only look where row groups belong rather than
+            # searching the whole (possibly huge) table for each
+            recursive = budget is None
+            if element.find("thead", recursive=recursive):
+                fields.append(("has_header", True))
+            if element.find("tbody", recursive=recursive):
+                fields.append(("has_body", True))
+            if element.find("tfoot", recursive=recursive):
+                fields.append(("has_footer", True))
                 
         elif "iframe" in element_type or element.name == "iframe":
-            result["src"] = element.get("src", "")
+            fields.append(("src", element.get("src", "")))
             if element.get("width"):
-                result["width"] = element.get("width")
+                fields.append(("width", element.get("width")))
             if element.get("height"):
-                result["height"] = element.get("height")
+                fields.append(("height", element.get("height")))
         
         elif "video" in element_type or element.name == "video":
-            result["src"] = element.get("src", "")
-            result["controls"] = element.has_attr("controls")
-            result["autoplay"] = element.has_attr("autoplay")
-            result["loop"] = element.has_attr("loop")
-            result["muted"] = element.has_attr("muted")
+            fields.append(("src", element.get("src", "")))
+            fields.append(("controls", element.has_attr("controls")))
+            fields.append(("autoplay", element.has_attr("autoplay")))
+            fields.append(("loop", element.has_attr("loop")))
+            fields.append(("muted", element.has_attr("muted")))
             
         # Extract general interactive attributes
         if element.get("onclick") or element.get("role") == "button":
-            result["clickable"] = True
+            fields.append(("clickable", True))
             
         if element.has_attr("tabindex") and element["tabindex"] != "-1":
-            result["focusable"] = True
-            result["tabindex"] = element["tabindex"]
+            fields.append(("focusable", True))
+            fields.append(("tabindex", element["tabindex"]))
             
         if element.get("contenteditable") == "true":
-            result["editable"] = True
+            fields.append(("editable", True))
             
         if element.get("draggable") == "true":
-            result["draggable"] = True
+            fields.append(("draggable", True))
             
         # Check for scrollable styles
         if element.get("style"):
             style = element.get("style")
             if "overflow" in style and any(val in style for val in ["auto", "scroll"]):
-                result["scrollable"] = True
+                fields.append(("scrollable", True))
                 
-        # Extract ARIA attributes for accessibility information
+        # Extract ARIA attributes for accessibility information, and data
+        # attributes which often contain app-specific information
         aria_attrs = {}
+        data_attrs = {}
         for attr_name, attr_value in element.attrs.items():
             if attr_name.startswith("aria-"):
-                aria_key = attr_name.replace("aria-", "")
-                aria_attrs[aria_key] = attr_value
+                aria_attrs[attr_name.replace("aria-", "")] = attr_value
+            elif attr_name.startswith("data-"):
+                data_attrs[attr_name.replace("data-", "")] = attr_value
                 
         if aria_attrs:
-            result["aria"] = aria_attrs
+            fields.append(("aria", aria_attrs))
             
         # Get CSS identifiers that may indicate semantic purpose
         if element.get("class"):
-            result["classes"] = element["class"]
+            fields.append(("classes", [sys.intern(cls) for cls in element["class"]]))
         if element.get("id"):
-            result["id"] = element["id"]
+            fields.append(("id", element["id"]))
             
-        # Extract data attributes which often contain app-specific information
-        data_attrs = {}
-        for attr_name, attr_value in element.attrs.items():
-            if attr_name.startswith("data-"):
-                data_key = attr_name.replace("data-", "")
-                data_attrs[data_key] = attr_value
-                
         if data_attrs:
-            result["data_attrs"] = data_attrs
+            fields.append(("data_attrs", data_attrs))
+            
+        # Charge the strings added besides text and options, which were
+        # charged as they were cut to fit
+        if budget is not None:
+            for name, value in fields:
+                if name not in ("text", "options"):
+                    budget.charge(value)
 
         # Recursively process children if not at max depth and element can have children
         if depth < max_depth and element.contents:
+            if budget is not None:
+                max_depth = min(max_depth, depth + budget.depth(max_depth - depth))
             children = []
-            for child in element.children:
-                if isinstance(child, (Tag, NavigableString)):
+            for i, child in enumerate(element.contents):
+                if budget is not None and budget.exhausted():
+                    children.append(omitted_summary(element.contents[i:]))
+                    break
+                if depth >= max_depth:
+                    break
+                if isinstance(child, (bs4.Tag, bs4.NavigableString)):
                     child_content = self.extract_element_content(child, depth + 1, max_depth)
                     if child_content:
                         children.append(child_content)
                     
             if children:
-                result["children"] = children
+                fields.append(("children", children))
+        
+        elif budget is not None and depth < self.max_depth and element.contents:
+            # The budget shrank max_depth, cutting off this element's children
+            omitted = omitted_summary(element.contents)
+            if omitted["omitted"]:
+                fields.append(("children", [omitted]))
                 
-        return result
+        return CompactRecord(fields)
         
-    def categorize_content(self, soup: BeautifulSoup) -> Dict:
+    def categorize_content(self, soup: BeautifulSoup,
+                           sections: Optional[Iterable[str]] = None) -> Dict:
         """
         Categorize page content into semantic sections.
         
         Returns a dictionary with categorized content.
+        
+        Args:
+            soup: Parsed page
+            sections: Sub-sections to extract (defaults to all of CONTENT_SECTIONS)
         """
-        # Extract main content sections
         result: Dict[str, List[Any]] = defaultdict(list)
+        for section, content in self.iter_categorized_content(soup, sections):
+            result[section].append(content)
+        return dict(result)
+    
+    def iter_categorized_content(self, soup: BeautifulSoup,
+                                 sections: Optional[Iterable[str]] = None) -> Iterator[tuple]:
+        """
+        Yield (section, content) pairs for each top-level node of each section.
         
-        # Process main content areas
-        main_content = soup.find("main")
-        if not main_content:
-            # Try other common content containers
-            main_content = soup.find(["article", "div", "section"], 
-                                    class_=lambda c: c and any(x in str(c).lower() 
-                                                            for x in ["content", "main", "article"]))
+        Sections come in the order categorize_content lists them, so
+        callers can stream nodes out before the whole page is categorized.
+        Sub-sections not in `sections` are skipped without being extracted.
+        
+        Extraction of the page shares one WorkBudget when any of the
+        processor's budget limits is set.
+        """
+        if sections is None:
+            sections = CONTENT_SECTIONS
+        if self.max_nodes is not None or self.max_output_size is not None \
+                or self.time_budget is not None:
+            self.budget = WorkBudget(self.max_nodes, self.max_output_size, self.time_budget)
+        try:
+            yield from self.iter_section_content(soup, sections)
+        finally:
+            self.budget = None
+    
+    def iter_section_content(self, soup: BeautifulSoup, sections: Iterable[str]) -> Iterator[tuple]:
+        """Yield iter_categorized_content's (section, content) pairs."""
+        index = self.document_index(soup)
+        budget = self.budget
+        
+        # Process main content areas (falls back to common content containers).
+        # Extraction only returns None for ignored elements, so whether the
+        # page has main content is known without extracting it.
+        main_content = index.main_content()
+        has_main_content = bool(main_content) and not self.should_ignore_element(main_content)
         
-        if main_content:
+        if has_main_content and "main_content" in sections:
             # Extract main content
             content = self.extract_element_content(main_content)
             if content:
-                result["main_content"].append(content)
+                yield "main_content", content
         
         # Extract navigation
-        navigation = soup.find("nav")
+        navigation = index.find("nav") if "navigation" in sections else None
         if navigation:
             nav_content = self.extract_element_content(navigation)
             if nav_content:
-                result["navigation"].append(nav_content)
+                yield "navigation", nav_content
         
         # Extract header content
-        header = soup.find("header")
+        header = index.find("header") if "header" in sections else None
         if header:
             header_content = self.extract_element_content(header)
             if header_content:
-                result["header"].append(header_content)
+                yield "header", header_content
         
         # Extract footer
-        footer = soup.find("footer")
+        footer = index.find("footer") if "footer" in sections else None
         if footer:
             footer_content = self.extract_element_content(footer)
             if footer_content:
-                result["footer"].append(footer_content)
+                yield "footer", footer_content
                 
         # Extract headings
-        for heading in soup.find_all(['h1', 'h2', 'h3']):
+        headings = index.find_all('h1', 'h2', 'h3') if "headings" in sections else []
+        for i, heading in enumerate(headings):
+            if budget is not None and budget.exhausted():
+                yield "headings", omitted_summary(headings[i:])
+                break
             if not self.should_ignore_element(heading):
                 heading_content = self.extract_element_content(heading)
                 if heading_content:
-                    result["headings"].append(heading_content)
+                    yield "headings", heading_content
         
         # If no main content identified yet, try a different approach
-        if not result["main_content"]:
+        if not has_main_content and "paragraphs" in sections:
             # Find all paragraphs with substantial text
-            for p in soup.find_all('p'):
-                if len(p.get_text().strip()) >= self.min_text_length * 2:
+            paragraphs = index.find_all('p')
+            for i, p in enumerate(paragraphs):
+                if budget is not None and budget.exhausted():
+                    yield "paragraphs", omitted_summary(paragraphs[i:])
+                    break
+                if len(self.element_text(p).strip()) >= self.min_text_length * 2:
                     p_content = self.extract_element_content(p)
                     if p_content:
-                        result["paragraphs"].append(p_content)
+                        yield "paragraphs", p_content
         
-        # Extract links
-        important_links = []
-        for a in soup.find_all('a', href=True):
-            if not self.should_ignore_element(a) and a.get_text().strip():
+        # Extract links, limited to the most important
+        important_links = 0
+        links = index.find_all('a') if "important_links" in sections else []
+        for i, a in enumerate(links):
+            if important_links >= MAX_IMPORTANT_LINKS:
+                break
+            if budget is not None and budget.exhausted():
+                yield "important_links", omitted_summary(links[i:])
+                break
+            if a.get('href') is None:
+                continue
+            if not self.should_ignore_element(a) and self.element_text(a).strip():
                 link_content = self.extract_element_content(a)
                 if link_content:
-                    important_links.append(link_content)
-        
-        if important_links:
-            result["important_links"] = important_links[:10]  # Limit to most important
-            
-        return {k: v for k, v in result.items() if v}
+                    important_links += 1
+                    yield "important_links", link_content
+    
+    def extract_links(self, soup: BeautifulSoup, base_url: str) -> List[str]:
+        """
+        List the page's distinct link targets as normalized absolute URLs.
+        
+        Args:
+            soup: Parsed page
+            base_url: URL the page was fetched from (a <base href> overrides it)
+        """
+        index = self.document_index(soup)
+        base = index.find("base")
+        if base is not None and base.get("href"):
+            base_url = urljoin(base_url, base["href"])
+        
+        links = {}
+        for a in index.find_all("a"):
+            href = a.get("href")
+            if href:
+                url = normalize_url(urljoin(base_url, href.strip()))
+                if url:
+                    links[url] = None
+        return list(links)
+    
+    def render_markdown(self, root: Tag) -> str:
+        """
+        Render a parsed subtree as Markdown.
+        
+        Walks the tree and feeds html2text the same start tag, end tag and
+        text events it would get from parsing str(root), so the output
+        matches self.new_h2t().handle(str(root)) without serializing the
+        subtree and parsing it a second time. Script and style elements,
+        whose text would be the only text serialized without escaping, are
+        skipped whole.
+        
+        Args:
+            root: Tag or BeautifulSoup object to render
+        """
+        h2t = self.new_h2t()
+        
+        # The BeautifulSoup object itself serializes as just its contents
+        stack: List[Any] = list(reversed(root.contents)) if isinstance(root, bs4.BeautifulSoup) else [root]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, str) and not isinstance(node, bs4.NavigableString):
+                # Closing marker pushed when the tag was opened
+                h2t.handle_endtag(node)
+            elif isinstance(node, bs4.Tag):
+                if node.name in STRIPPED_TAGS:
+                    # Left in the tree when parse_html did not strip them
+                    continue
+                attrs = [(name, " ".join(value) if isinstance(value, list) else value)
+                         for name, value in node.attrs.items()]
+                h2t.handle_starttag(node.name, attrs)
+                stack.append(node.name)
+                stack.extend(reversed(node.contents))
+            elif isinstance(node, bs4.element.PreformattedString):
+                # Comments, CDATA, doctypes etc. produce no html2text output
+                continue
+            else:
+                for part in ESCAPED_TEXT.split(node):
+                    if part in ENTITY_NAMES:
+                        h2t.handle_entityref(ENTITY_NAMES[part])
+                    elif part:
+                        h2t.handle_data(part)
+        
+        markdown = h2t.optwrap(h2t.finish())
+        if h2t.pad_tables:
+            markdown = html2text.pad_tables_in_text(markdown)
+        return markdown
     
     def create_text_summary(self, soup: BeautifulSoup) -> str:
         """Create a plain text summary of the page."""
+        index = self.document_index(soup)
+        
         # Extract title and main content
-        title = soup.title.get_text() if soup.title else ""
+        title_tag = index.find("title")
+        title = self.element_text(title_tag) if title_tag else ""
         
         # Find main content section
-        main_content = soup.find("main") or soup.find(["article", "div", "section"], 
-                                                     class_=lambda c: c and any(x in str(c).lower() 
-                                                                            for x in ["content", "main", "article"]))
+        main_content = index.main_content()
         
         if not main_content:
             main_content = soup
             
         # Convert to markdown-like text
-        text = self.h2t.handle(str(main_content))
+        text = self.render_markdown(main_content)
         
         # Clean up text
         text = re.sub(r'\n{3,}', '\n\n', text)  # Remove excessive newlines
         
         return f"# {title}\n\n{text}" if title else text
     
-    def process_html(self, html_content: str) -> Dict:
-        """Process HTML content into AI-consumable format."""
-        soup = BeautifulSoup(html_content, "html.parser")
+    def settings(self, sections: Optional[frozenset] = None) -> str:
+        """Return every setting that affects results, as canonical JSON."""
+        settings = {
+            "version": RESULT_CACHE_VERSION,
+            "min_text_length": self.min_text_length,
+            "ignore_classes": self.ignore_classes,
+            "ignore_ids": self.ignore_ids,
+            "parser": self.parser,
+            "max_depth": self.max_depth,
+        }
+        # Full results keep the keys they had before sections were selectable
+        if sections is not None:
+            settings["sections"] = sorted(sections)
+        # ...and before work budgets were added
+        budgets = {"max_nodes": self.max_nodes, "max_output_size": self.max_output_size,
+                   "time_budget": self.time_budget}
+        if any(limit is not None for limit in budgets.values()):
+            settings["budgets"] = budgets
+        return json.dumps(settings, sort_keys=True)
+    
+    def result_cache_key(self, html_content: str,
+                         sections: Optional[frozenset] = None) -> str:
+        """Hash HTML content together with every setting that affects the result."""
+        digest = hashlib.sha256(self.settings(sections).encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(html_content.encode("utf-8", "surrogatepass"))
+        return digest.hexdigest()
+    
+    def process_html(self, html_content: str,
+                     sections: Optional[Iterable[str]] = None) -> Dict:
+        """
+        Process HTML content into AI-consumable format.
+        
+        The result is a dict, but the nodes in its categorized_content are
+        CompactRecords, whether they were just extracted or loaded from the
+        result cache. Encode it with json.dumps(..., default=json_default),
+        or convert it with to_plain first.
+        
+        Args:
+            html_content: HTML to process
+            sections: Sections to compute (defaults to self.sections)
+        """
+        sections = self.sections if sections is None else resolve_sections(sections)
+        if self.result_cache is None:
+            return self.analyze_html(html_content, sections)
+        
+        key = self.result_cache_key(html_content, sections)
+        result = self.result_cache.get(key)
+        if result is None:
+            result = self.analyze_html(html_content, sections)
+            self.result_cache.put(key, result)
+        return result
+    
+    def parse_html(self, html_content: str, strip: bool = True) -> BeautifulSoup:
+        """
+        Parse and index HTML, removing script and style elements.
+        
+        The index is kept in self.index until the caller resets it.
+        
+        Args:
+            html_content: HTML to parse
+            strip: Remove script and style elements from the tree. They are
+                   never indexed, and render_markdown skips them, so only
+                   categorize_content needs them removed.
+        """
+        with self.stage("parse"):
+            soup = bs4.BeautifulSoup(html_content, self.parser)
+        
+        # Index the page in one walk, leaving out script and style elements
+        with self.stage("index"):
+            index = DocumentIndex(soup, skip_tags=STRIPPED_TAGS)
+            if strip:
+                for script in index.skipped:
+                    script.decompose()
+        if self.profiler is not None:
+            self.profiler.count("nodes_indexed", len(index.position))
+        
+        self.index = index
+        return soup
+    
+    def analyze_html(self, html_content: str,
+                     sections: Optional[frozenset] = None,
+                     base_url: Optional[str] = None) -> Dict:
+        """
+        Parse HTML and build its metadata, categorized content and text summary.
         
-        # Remove script and style elements
-        for script in soup(["script", "style", "noscript"]):
-            script.decompose()
+        Args:
+            html_content: HTML to analyze
+            sections: Resolved sections to build (see resolve_sections); the
+                      result only has keys for the requested sections
+            base_url: URL the page was fetched from; when given, the page's
+                      links are also listed under "links" (see extract_links)
+        """
+        content_sections = [section for section in CONTENT_SECTIONS
+                            if sections is None or section in sections]
+        soup = self.parse_html(html_content, strip=bool(content_sections))
+        result = {}
+        try:
+            if sections is None or "metadata" in sections:
+                with self.stage("extract_metadata"):
+                    result["metadata"] = self.extract_metadata(soup)
+            if content_sections:
+                with self.stage("categorize_content"):
+                    result["categorized_content"] = self.categorize_content(soup, content_sections)
+            if sections is None or "text_summary" in sections:
+                with self.stage("create_text_summary"):
+                    result["text_summary"] = self.create_text_summary(soup)
+            if base_url is not None:
+                with self.stage("extract_links"):
+                    result["links"] = self.extract_links(soup, base_url)
+        finally:
+            self.index = None
             
-        return {
-            "metadata": self.extract_metadata(soup),
-            "categorized_content": self.categorize_content(soup),
-            "text_summary": self.create_text_summary(soup)
-        }
+        return result
     
-    def process_input(self, input_source: str, is_url: bool = False) -> Dict:
+    def iter_records(self, html_content: str,
+                     sections: Optional[Iterable[str]] = None) -> Iterator[Dict]:
         """
-        Process input source (URL or file or HTML string).
+        Process HTML into JSON Lines records, yielding each as soon as it is built.
+        
+        Yields a metadata record, one record per top-level node of each
+        categorized section, then a text_summary record, leaving out
+        sections that were not requested.
+        
+        Args:
+            html_content: HTML to process
+            sections: Sections to compute (defaults to self.sections)
+        """
+        if self.result_cache is not None:
+            yield from result_records(self.process_html(html_content, sections))
+            return
+        
+        sections = self.sections if sections is None else resolve_sections(sections)
+        content_sections = [section for section in CONTENT_SECTIONS
+                            if sections is None or section in sections]
+        soup = self.parse_html(html_content, strip=bool(content_sections))
+        try:
+            if sections is None or "metadata" in sections:
+                with self.stage("extract_metadata"):
+                    metadata = self.extract_metadata(soup)
+                yield {"section": "metadata", "data": metadata}
+            if content_sections:
+                for section, content in self.iter_categorized_content(soup, content_sections):
+                    yield {"section": section, "data": content}
+            if sections is None or "text_summary" in sections:
+                with self.stage("create_text_summary"):
+                    text_summary = self.create_text_summary(soup)
+                yield {"section": "text_summary", "data": text_summary}
+        finally:
+            self.index = None
+    
+    def stream_html(self, chunks: Iterable[Union[str, bytes]],
+                    encoding: str = "utf-8") -> Iterator[Dict]:
+        """
+        Extract records from HTML as it arrives, without building a tree.
+        
+        Yields metadata, heading, link and text records as soon as the
+        elements completing them have been fed.
+        
+        Args:
+            chunks: Pieces of the document, as text or bytes
+            encoding: Encoding used to decode byte chunks
+        """
+        extractor = StreamingExtractor(self)
+        decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+        for chunk in chunks:
+            if isinstance(chunk, bytes):
+                chunk = decoder.decode(chunk)
+            extractor.feed(chunk)
+            yield from self.select_stream_records(extractor.drain())
+        extractor.feed(decoder.decode(b"", final=True))
+        extractor.close()
+        yield from self.select_stream_records(extractor.drain())
+    
+    def select_stream_records(self, records: List[Dict]) -> List[Dict]:
+        """
+        Keep streamed records whose section (see STREAM_SECTIONS) was
+        requested, and records of types outside any section.
+        """
+        if self.sections is None:
+            return records
+        return [record for record in records
+                if STREAM_SECTIONS.get(record["type"], "") in self.sections
+                or record["type"] not in STREAM_SECTIONS]
+    
+    def stream_file(self, f: IO) -> Iterator[Dict]:
+        """Stream records from an open file, reading it in blocks."""
+        return self.stream_html(iter(lambda: f.read(STREAM_CHUNK_SIZE), f.read(0)))
+    
+    def stream_input(self, input_source: str, is_url: bool = False) -> Iterator[Dict]:
+        """
+        Stream records from a URL or file without loading the whole page.
+        
+        Args:
+            input_source: URL, file path, or '-' for stdin
+            is_url: Whether input_source is a URL
+        """
+        if input_source == "-":
+            yield from self.stream_file(sys.stdin.buffer)
+        elif is_url or input_source.startswith(("http://", "https://")):
+            headers = {
+                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+            }
+            http = self.session or requests
+            with http.get(input_source, headers=headers, timeout=10, stream=True) as response:
+                response.raise_for_status()
+                body = ResponseBody(response, self.max_fetch_size, self.fetch_time_limit)
+                yield from self.stream_html(decode_chunks(body, response.headers.get("Content-Type", "")))
+                if body.truncated:
+                    yield {"type": "truncated"}
+        else:
+            with open(input_source, "rb") as f:
+                yield from self.stream_file(f)
+    
+    def load_input(self, input_source: str, is_url: bool = False) -> Tuple[Optional[str], bool]:
+        """
+        Load HTML from an input source (URL or file or HTML string).
+        
+        Returns the HTML (None if it could not be loaded) and whether a
+        fetched page was truncated (see fetch_url_content).
         
         Args:
             input_source: URL, file path, or HTML string
@@ -562,7 +2098,7 @@ class WebpageProcessor:
         html_content = None
         
         if is_url:
-            html_content = self.fetch_url(input_source)
+            return self.fetch_url(input_source)
         elif Path(input_source).is_file():
             html_content = self.read_file(input_source)
         elif "<html" in input_source.lower():
@@ -570,14 +2106,1536 @@ class WebpageProcessor:
         else:
             # Try to guess if it's a URL anyway
             if input_source.startswith(("http://", "https://")):
-                html_content = self.fetch_url(input_source)
+                return self.fetch_url(input_source)
             else:
                 html_content = input_source
         
+        return html_content, False
+    
+    def process_input_file(self, filepath: str) -> Dict:
+        """Read and process a file."""
+        html_content = self.read_file(filepath)
         if not html_content:
             return {"error": "Could not process input source"}
-            
         return self.process_html(html_content)
+    
+    def iter_input_records(self, input_source: str, is_url: bool = False) -> Iterator[Dict]:
+        """Process an input source into JSON Lines records (see iter_records)."""
+        html_content, truncated = self.load_input(input_source, is_url=is_url)
+        if not html_content:
+            yield {"error": "Could not process input source"}
+        else:
+            if truncated:
+                yield {"truncated": True}
+            yield from self.iter_records(html_content)
+    
+    def process_input(self, input_source: str, is_url: bool = False) -> Dict:
+        """
+        Process input source (URL or file or HTML string).
+        
+        Args:
+            input_source: URL, file path, or HTML string
+            is_url: Whether input_source is a URL
+        """
+        html_content, truncated = self.load_input(input_source, is_url=is_url)
+        
+        if not html_content:
+            return {"error": "Could not process input source"}
+        
+        result = self.process_html(html_content)
+        return {"truncated": True, **result} if truncated else result
+
+
+def create_session(concurrency: int, per_host: int) -> requests.Session:
+    """
+    Create an HTTP session that pools connections across requests.
+    
+    Args:
+        concurrency: Number of hosts to keep connection pools for
+        per_host: Maximum open connections per host (further requests wait)
+    """
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=concurrency, pool_maxsize=per_host, pool_block=True)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+# Processor owned by each worker process, created once by init_worker
+worker_processor: Optional[WebpageProcessor] = None
+
+
+def init_worker(options: Dict, profile: bool = False, trace_memory: bool = True):
+    """Create the worker process's WebpageProcessor."""
+    global worker_processor
+    worker_processor = WebpageProcessor(**options)
+    if profile:
+        # Keep deferred imports out of the first page's stage timings
+        load_modules(bs4, html2text)
+        worker_processor.profiler = Profiler(trace_memory=trace_memory)
+
+
+def run_in_worker(function: Callable[[str], Dict], arg: str) -> Dict:
+    """Run a worker task, adding its profile to the result when profiling."""
+    profiler = worker_processor.profiler
+    if profiler is None:
+        return function(arg)
+    profiler.reset()
+    profiler.start_page()
+    result = function(arg)
+    profiler.end_page()
+    return dict(result, profile=profiler.report())
+
+
+def process_in_worker(html_content: str, sections: Optional[frozenset] = None) -> Dict:
+    """Process HTML with the worker process's WebpageProcessor."""
+    return run_in_worker(lambda html: worker_processor.process_html(html, sections), html_content)
+
+
+def crawl_in_worker(html_content: str, url: str) -> Dict:
+    """Process a crawled page with the worker process's WebpageProcessor, listing its links."""
+    return run_in_worker(
+        lambda html: worker_processor.analyze_html(html, worker_processor.sections, base_url=url),
+        html_content)
+
+
+def process_file_in_worker(filepath: str) -> Dict:
+    """Read and process a file with the worker process's WebpageProcessor."""
+    return run_in_worker(worker_processor.process_input_file, filepath)
+
+
+def find_html_files(pattern: str) -> List[str]:
+    """
+    List HTML files in sorted order.
+    
+    Args:
+        pattern: Directory (searched recursively for .html/.htm files, plain or
+                 compressed with .gz/.zst) or glob pattern
+    """
+    if Path(pattern).is_dir():
+        paths = (str(path) for path in Path(pattern).rglob("*")
+                 if strip_compression_suffix(path.name.lower()).endswith(HTML_SUFFIXES)
+                 and path.is_file())
+    else:
+        paths = (path for path in glob.glob(pattern, recursive=True) if Path(path).is_file())
+    return sorted(paths)
+
+
+def run_files(paths: List[str], options: Dict, jobs: Optional[int] = None,
+              profile: bool = False) -> Iterator[Dict]:
+    """
+    Process local files across a pool of worker processes.
+    
+    Each worker reads its files itself, so only paths and results cross
+    process boundaries, and paths are sent in chunks to keep that traffic
+    low. Results are yielded in the order of `paths`.
+    
+    Args:
+        paths: File paths to process
+        options: WebpageProcessor keyword arguments
+        jobs: Number of worker processes (defaults to CPU count)
+        profile: Add a "profile" report to each result
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    
+    jobs = jobs or os.cpu_count() or 1
+    options = dict(options, parser=resolve_parser(options.get("parser", DEFAULT_PARSER)))
+    # A few chunks per worker balances uneven file sizes against IPC overhead
+    chunksize = max(1, min(64, len(paths) // (jobs * 4)))
+    
+    with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker,
+                             initargs=(options, profile)) as pool:
+        for path, result in zip(paths, pool.map(process_file_in_worker, paths, chunksize=chunksize)):
+            yield {"source": path, **result}
+
+
+def strip_compression_suffix(name: str) -> str:
+    """Remove a trailing .gz or .zst from a file name."""
+    for suffix in COMPRESSION_SUFFIXES:
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+    return name
+
+
+def open_compressed(path: str) -> IO[bytes]:
+    """
+    Open a file for binary reading, decompressing it by its suffix.
+    
+    Raises:
+        ValueError: For .zst files when zstandard is not installed
+    """
+    lower = path.lower()
+    if lower.endswith(".gz"):
+        return gzip.open(path, "rb")
+    if lower.endswith(".zst"):
+        if zstandard is None:
+            raise ValueError(f"{path}: reading .zst files needs the zstandard package")
+        return zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), read_across_frames=True,
+                                                          closefd=True)
+    return open(path, "rb")
+
+
+def open_text(path: str) -> IO[str]:
+    """Open a possibly compressed file as UTF-8 text."""
+    if path.lower().endswith(COMPRESSION_SUFFIXES):
+        return io.TextIOWrapper(open_compressed(path), encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+
+class ArchiveReader:
+    """
+    Buffered reader over a possibly compressed archive that tracks offsets.
+    
+    Gzip input is decompressed member by member, so offset() can report the
+    compressed offset of the member a record starts. That is the offset
+    WARC indexes use for .warc.gz files, where every record is its own
+    member. Otherwise offsets are positions in the uncompressed stream.
+    """
+
+    def __init__(self, f: IO[bytes], gzipped: bool = False,
+                 chunk_size: int = ARCHIVE_CHUNK_SIZE):
+        """
+        Args:
+            f: Binary file, already decompressed unless gzipped
+            gzipped: Whether f is a series of gzip members
+            chunk_size: Bytes read from f at a time
+        """
+        self.f = f
+        self.gzipped = gzipped
+        self.chunk_size = chunk_size
+        self.buffer = bytearray()
+        # Uncompressed position of buffer[0]
+        self.position = 0
+        self.eof = False
+        self.decompressor = None
+        self.produced = 0
+        self.consumed = 0
+        # (uncompressed start, compressed start) of gzip members not yet passed
+        self.members: deque = deque()
+    
+    def fill(self) -> bool:
+        """Read (and decompress) another chunk, returning False at the end of input."""
+        if self.eof:
+            return False
+        data = self.f.read(self.chunk_size)
+        if not data:
+            self.eof = True
+            if self.decompressor is not None:
+                raise EOFError("Compressed file ended before the end-of-stream marker was reached")
+            return False
+        if not self.gzipped:
+            self.buffer += data
+            return True
+        
+        while data:
+            if self.decompressor is None:
+                if not data.strip(b"\0"):
+                    # Zero padding after the last member
+                    self.consumed += len(data)
+                    break
+                self.decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+                self.members.append((self.produced, self.consumed))
+            output = self.decompressor.decompress(data)
+            self.buffer += output
+            self.produced += len(output)
+            if self.decompressor.eof:
+                unused = self.decompressor.unused_data
+                self.consumed += len(data) - len(unused)
+                self.decompressor = None
+                data = unused
+            else:
+                self.consumed += len(data)
+                data = b""
+        return True
+    
+    def take(self, size: int) -> bytes:
+        """Remove and return up to size buffered bytes."""
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        self.position += len(data)
+        return data
+    
+    def readline(self) -> bytes:
+        """Read up to and including the next newline (or to the end of input)."""
+        start = 0
+        while True:
+            end = self.buffer.find(b"\n", start)
+            if end >= 0:
+                return self.take(end + 1)
+            start = len(self.buffer)
+            if not self.fill():
+                return self.take(len(self.buffer))
+    
+    def read(self, size: int) -> bytes:
+        """Read up to size bytes."""
+        while len(self.buffer) < size and self.fill():
+            pass
+        return self.take(size)
+    
+    def skip(self, size: int):
+        """Discard up to size bytes without keeping them in memory."""
+        while size > 0 and (self.buffer or self.fill()):
+            size -= len(self.take(size))
+    
+    def offset(self, position: int) -> int:
+        """
+        Return the offset to report for a record starting at an uncompressed position.
+        
+        That is the compressed offset of its gzip member when the record
+        starts a member, as in .warc.gz files, and the uncompressed
+        position otherwise.
+        """
+        if not self.gzipped:
+            return position
+        while len(self.members) > 1 and self.members[1][0] <= position:
+            self.members.popleft()
+        if self.members and self.members[0][0] == position:
+            return self.members[0][1]
+        return position
+
+
+def iter_warc_records(reader: ArchiveReader, types: Iterable[str] = WARC_PAGE_TYPES,
+                      max_size: int = MAX_RECORD_SIZE) -> Iterator[tuple]:
+    """
+    Yield (offset, headers, content block) for WARC records of the given types.
+    
+    Records of other types, and blocks larger than max_size, are skipped
+    without being held in memory. Header names are lowercased.
+    
+    Raises:
+        ValueError: If the input is not a WARC file
+        EOFError: If a record is truncated
+    """
+    while True:
+        position = reader.position
+        line = reader.readline()
+        if not line:
+            return
+        if not line.strip():
+            continue
+        if not line.startswith(b"WARC/"):
+            raise ValueError(f"not a WARC record at offset {reader.offset(position)}")
+        
+        headers = {}
+        while True:
+            line = reader.readline()
+            if not line.strip():
+                break
+            name, _, value = line.decode("utf-8", errors="replace").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        
+        length = int(headers.get("content-length", 0))
+        if headers.get("warc-type") not in types or length > max_size:
+            reader.skip(length)
+            continue
+        block = reader.read(length)
+        if len(block) < length:
+            raise EOFError(f"truncated WARC record at offset {reader.offset(position)}")
+        yield reader.offset(position), headers, block
+
+
+def dechunk(body: bytes) -> bytes:
+    """Decode a body sent with Transfer-Encoding: chunked (tolerating truncation)."""
+    parts = []
+    position = 0
+    while position < len(body):
+        end = body.find(b"\r\n", position)
+        if end < 0:
+            break
+        try:
+            size = int(body[position:end].split(b";")[0], 16)
+        except ValueError:
+            break
+        if size == 0:
+            break
+        parts.append(body[end + 2:end + 2 + size])
+        position = end + 2 + size + 2
+    return b"".join(parts)
+
+
+def parse_http_response(block: bytes) -> Optional[tuple]:
+    """
+    Split a recorded HTTP response into (status, headers, decoded body).
+    
+    Chunked transfer encoding and gzip/deflate content encoding are undone.
+    Returns None if the response cannot be parsed or decoded.
+    """
+    head, separator, body = block.partition(b"\r\n\r\n")
+    if not separator:
+        head, separator, body = block.partition(b"\n\n")
+        if not separator:
+            return None
+    lines = head.decode("iso-8859-1").splitlines()
+    try:
+        status = int(lines[0].split()[1])
+    except (IndexError, ValueError):
+        return None
+    headers = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+    
+    if "chunked" in headers.get("transfer-encoding", "").lower():
+        body = dechunk(body)
+    encoding = headers.get("content-encoding", "").lower()
+    try:
+        if encoding in ("gzip", "x-gzip"):
+            body = zlib.decompress(body, zlib.MAX_WBITS | 32)
+        elif encoding == "deflate":
+            try:
+                body = zlib.decompress(body)
+            except zlib.error:
+                body = zlib.decompress(body, -zlib.MAX_WBITS)
+        elif encoding not in ("", "identity"):
+            return None
+    except zlib.error:
+        return None
+    return status, headers, body
+
+
+def detect_charset(head: bytes, content_type: str = "") -> Tuple[str, int]:
+    """
+    Pick the encoding of an HTML document from its first bytes.
+    
+    Uses a BOM, the Content-Type charset or a <meta> declaration in the
+    first CHARSET_SNIFF_SIZE bytes. Without one, head is taken as UTF-8 if
+    it decodes as UTF-8, and as Windows-1252 (which browsers use for
+    undeclared Latin-1 pages) otherwise. Returns the encoding and the
+    length of the BOM to skip.
+    """
+    if head.startswith(codecs.BOM_UTF8):
+        return "utf-8", len(codecs.BOM_UTF8)
+    if head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return "utf-16", 0
+    
+    charset = None
+    for param in content_type.split(";")[1:]:
+        name, _, value = param.partition("=")
+        if name.strip().lower() == "charset":
+            charset = value.strip().strip("\"'")
+    if not charset:
+        match = META_CHARSET.search(head, 0, CHARSET_SNIFF_SIZE)
+        if match:
+            charset = match.group(1).decode("ascii")
+    if charset:
+        try:
+            return codecs.lookup(charset).name, 0
+        except LookupError:
+            pass
+    try:
+        # Not final: head may end partway through a character
+        codecs.getincrementaldecoder("utf-8")().decode(head)
+    except UnicodeDecodeError:
+        return "cp1252", 0
+    return "utf-8", 0
+
+
+def decode_html(body: bytes, content_type: str = "") -> str:
+    """Decode HTML bytes in the encoding chosen by detect_charset."""
+    charset, bom_length = detect_charset(body, content_type)
+    return body[bom_length:].decode(charset, errors="replace")
+
+
+def decode_chunks(chunks: Iterable[bytes], content_type: str = "") -> Iterator[str]:
+    """
+    Decode HTML arriving in pieces, choosing the encoding from its start.
+    
+    Buffers only until CHARSET_SNIFF_SIZE bytes have arrived, then decodes
+    each piece as it comes.
+    """
+    chunks = iter(chunks)
+    head = b""
+    for chunk in chunks:
+        head += chunk
+        if len(head) >= CHARSET_SNIFF_SIZE:
+            break
+    charset, bom_length = detect_charset(head, content_type)
+    decoder = codecs.getincrementaldecoder(charset)(errors="replace")
+    yield decoder.decode(head[bom_length:])
+    for chunk in chunks:
+        yield decoder.decode(chunk)
+    yield decoder.decode(b"", final=True)
+
+
+class ResponseBody:
+    """Streamed HTTP response body, cut off at a byte and time budget."""
+
+    def __init__(self, response: requests.Response, max_size: int, time_limit: float):
+        """
+        Args:
+            response: Response requested with stream=True
+            max_size: Bytes (after content decoding) read before stopping
+            time_limit: Seconds spent reading before stopping
+        """
+        self.response = response
+        self.max_size = max_size
+        self.time_limit = time_limit
+        # Whether the body was cut off
+        self.truncated = False
+    
+    def __iter__(self) -> Iterator[bytes]:
+        deadline = time.monotonic() + self.time_limit
+        remaining = self.max_size
+        for chunk in self.read_chunks():
+            if len(chunk) > remaining:
+                self.truncated = True
+                yield chunk[:remaining]
+                return
+            remaining -= len(chunk)
+            yield chunk
+            if time.monotonic() > deadline:
+                self.truncated = True
+                return
+    
+    def read_chunks(self) -> Iterator[bytes]:
+        """Yield the body as it arrives, without waiting to fill whole chunks."""
+        raw = self.response.raw
+        if not hasattr(raw, "read1"):
+            # urllib3 1.x
+            yield from self.response.iter_content(FETCH_CHUNK_SIZE)
+            return
+        while True:
+            chunk = raw.read1(FETCH_CHUNK_SIZE, decode_content=True)
+            if not chunk:
+                return
+            yield chunk
+
+
+def iter_archive_pages(path: str) -> Iterator[Dict]:
+    """
+    Yield {"uri", "offset", "html"} for each page in an archive.
+    
+    WARC files (.warc, optionally .gz or .zst compressed) are streamed
+    record by record, keeping successful HTML responses and HTML resource
+    records. Any other file is read as a single page.
+    
+    Args:
+        path: Archive path
+    """
+    name = strip_compression_suffix(path.lower())
+    if not name.endswith(".warc"):
+        with open_compressed(path) as f:
+            html_content = decode_html(f.read())
+        yield {"uri": None, "offset": 0, "html": html_content.replace("\r\n", "\n")}
+        return
+    
+    gzipped = path.lower().endswith(".gz")
+    with (open(path, "rb") if gzipped else open_compressed(path)) as f:
+        reader = ArchiveReader(f, gzipped=gzipped)
+        for offset, headers, block in iter_warc_records(reader):
+            content_type = headers.get("content-type", "")
+            if headers["warc-type"] == "response":
+                if not content_type.startswith("application/http"):
+                    continue
+                response = parse_http_response(block)
+                if response is None:
+                    continue
+                status, http_headers, block = response
+                content_type = http_headers.get("content-type", "")
+                if not 200 <= status < 300:
+                    continue
+            if content_type.split(";")[0].strip().lower() not in HTML_MEDIA_TYPES:
+                continue
+            # Newlines are normalized as browsers (and text-mode reads) do
+            html_content = decode_html(block, content_type).replace("\r\n", "\n")
+            yield {"uri": headers.get("warc-target-uri"), "offset": offset, "html": html_content}
+
+
+def glob_root(pattern: str) -> str:
+    """Return the directory a find_html_files pattern searches from."""
+    if Path(pattern).is_dir():
+        return pattern
+    parts = []
+    for part in Path(pattern).parts:
+        if glob.has_magic(part):
+            break
+        parts.append(part)
+    return str(Path(*parts)) if parts else "."
+
+
+def file_digest(path: str) -> str:
+    """Return the SHA-256 hex digest of a file's bytes."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def write_atomic(path: str, text: str):
+    """Write a text file so readers never see it half-written."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+class Manifest:
+    """
+    Record of an incremental run's inputs and outputs (see run_incremental).
+    
+    Maps each input's path (relative to the searched directory) to its
+    size, mtime, content hash and output file (relative to the output
+    directory). Entries are discarded if the settings used to produce
+    them change.
+    """
+
+    def __init__(self, path: str, settings: str):
+        """
+        Load the manifest, starting empty if it is missing or stale.
+        
+        Args:
+            path: Manifest file
+            settings: Canonical settings the outputs are produced with
+        """
+        self.path = path
+        self.settings = settings
+        self.files: Dict[str, Dict] = {}
+        # Entries produced with other settings, whose outputs are obsolete
+        self.stale: Dict[str, Dict] = {}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get("version") != MANIFEST_VERSION:
+            # Output paths may be recorded differently, so leave them be
+            return
+        if data.get("settings") == settings:
+            self.files = data.get("files", {})
+        else:
+            self.stale = data.get("files", {})
+    
+    def save(self):
+        """Write the manifest."""
+        write_atomic(self.path, json.dumps({
+            "version": MANIFEST_VERSION,
+            "settings": self.settings,
+            "files": self.files,
+        }, indent=1, sort_keys=True))
+
+
+def run_incremental(pattern: str, output_dir: str, options: Dict,
+                    output_format: str = "json", jobs: Optional[int] = None,
+                    manifest_path: Optional[str] = None,
+                    chunker: Optional[Chunker] = None) -> Iterator[Dict]:
+    """
+    Process a directory into one output file per input, skipping unchanged inputs.
+    
+    Inputs whose size and mtime match the manifest are skipped without
+    being read; others are hashed and only reprocessed if their content
+    changed. Outputs of inputs that no longer exist are deleted. Yields
+    an {"source", "action"} record per input, where action is "added",
+    "updated", "unchanged", "deleted" or "failed".
+    
+    Args:
+        pattern: Directory or glob pattern (see find_html_files)
+        output_dir: Directory for output files, mirroring the input tree
+        options: WebpageProcessor keyword arguments
+        output_format: "json", "jsonl", "chunks" or "text"
+        jobs: Number of worker processes (defaults to CPU count)
+        manifest_path: Manifest file (defaults to MANIFEST_NAME in output_dir)
+        chunker: Chunk settings for the "chunks" format
+    """
+    processor = WebpageProcessor(**options)
+    settings = {"result": processor.settings(processor.sections), "format": output_format}
+    if output_format == "chunks":
+        chunker = chunker or Chunker()
+        settings["chunks"] = chunker.settings()
+    settings = json.dumps(settings, sort_keys=True)
+    manifest = Manifest(manifest_path or os.path.join(output_dir, MANIFEST_NAME), settings)
+    root = glob_root(pattern)
+    for entry in manifest.stale.values():
+        output = os.path.join(output_dir, entry["output"])
+        if os.path.exists(output):
+            os.remove(output)
+    
+    try:
+        present = set()
+        changed = []
+        for path in find_html_files(pattern):
+            key = os.path.relpath(path, root)
+            present.add(key)
+            stat = os.stat(path)
+            entry = manifest.files.get(key)
+            if entry is not None and os.path.exists(os.path.join(output_dir, entry["output"])):
+                if entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+                    yield {"source": path, "action": "unchanged"}
+                    continue
+                digest = file_digest(path)
+                if entry["sha256"] == digest:
+                    # Touched but not modified
+                    entry.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+                    yield {"source": path, "action": "unchanged"}
+                    continue
+            else:
+                digest = file_digest(path)
+            changed.append((path, key, stat, digest, "updated" if entry else "added"))
+        
+        for key in [key for key in manifest.files if key not in present]:
+            output = os.path.join(output_dir, manifest.files.pop(key)["output"])
+            if os.path.exists(output):
+                os.remove(output)
+            yield {"source": os.path.join(root, key), "action": "deleted", "output": output}
+        
+        results = run_files([path for path, *_ in changed], options, jobs=jobs) if changed else []
+        for (path, key, stat, digest, action), result in zip(changed, results):
+            if "error" in result:
+                yield {"source": path, "action": "failed", "error": result["error"]}
+                continue
+            del result["source"]
+            name = key + OUTPUT_SUFFIXES[output_format]
+            output = os.path.join(output_dir, name)
+            write_atomic(output, format_result(result, output_format, chunker))
+            manifest.files[key] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+                                   "sha256": digest, "output": name}
+            yield {"source": path, "action": action, "output": output}
+    finally:
+        manifest.save()
+
+
+def read_sources(path: str) -> Iterator[str]:
+    """Yield non-empty lines from a file, or from stdin if path is '-'."""
+    f = sys.stdin if path == "-" else open(path, "r", encoding="utf-8")
+    try:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield line
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def run_batch(sources: Iterable[str], options: Dict, is_url: bool = False,
+              concurrency: int = 8, per_host: int = 2,
+              jobs: Optional[int] = None,
+              cache: Optional[HTTPCache] = None,
+              profile: bool = False) -> Iterator[Dict]:
+    """
+    Fetch and process many sources concurrently.
+    
+    Sources are loaded by a thread pool sharing one pooled HTTP session and
+    parsed by a pool of worker processes. Results are yielded in completion
+    order, each tagged with its source.
+    
+    Args:
+        sources: URLs or file paths
+        options: WebpageProcessor keyword arguments
+        is_url: Whether every source is a URL
+        concurrency: Maximum sources being fetched at once
+        per_host: Maximum open connections per host
+        jobs: Number of worker processes (defaults to CPU count)
+        cache: HTTP cache shared by all fetches
+        profile: Add a "profile" report, including fetch time, to each result
+    """
+    from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+    
+    loader = WebpageProcessor(**options)
+    loader.cache = cache
+    # Workers reuse the resolved parser rather than repeating fallback warnings
+    options = dict(options, parser=loader.parser)
+    loader.session = create_session(concurrency, per_host)
+    sources = iter(sources)
+    jobs = jobs or os.cpu_count() or 1
+    # Bound pages held in memory while waiting to be fetched or parsed
+    max_pending = concurrency + 2 * jobs
+    
+    with ThreadPoolExecutor(max_workers=concurrency) as fetch_pool, \
+         ProcessPoolExecutor(max_workers=jobs, initializer=init_worker,
+                             initargs=(options, profile)) as parse_pool:
+        pending = {}
+        fetching = 0
+        
+        def load(source):
+            start = time.perf_counter()
+            if not is_url and not source.startswith(("http://", "https://")) \
+                    and not Path(source).is_file():
+                # Sources are never HTML strings, so this is a missing file
+                print(f"Error reading file: {source} not found", file=sys.stderr)
+                return None, False, 0.0
+            html_content, truncated = loader.load_input(source, is_url)
+            return html_content, truncated, time.perf_counter() - start
+        
+        def refill():
+            nonlocal fetching
+            while fetching < concurrency and len(pending) < max_pending:
+                source = next(sources, None)
+                if source is None:
+                    return
+                future = fetch_pool.submit(load, source)
+                pending[future] = ("fetch", source, False, 0)
+                fetching += 1
+        
+        refill()
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, source, truncated, load_time = pending.pop(future)
+                if stage == "fetch":
+                    fetching -= 1
+                    html_content, truncated, load_time = future.result()
+                    if html_content:
+                        future = parse_pool.submit(process_in_worker, html_content)
+                        pending[future] = ("parse", source, truncated, load_time)
+                    else:
+                        yield {"source": source, "error": "Could not process input source"}
+                else:
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        result = {"error": f"Error processing input: {e}"}
+                    if "profile" in result:
+                        result["profile"]["stages"]["load"] = round(load_time, 6)
+                    if truncated:
+                        result = {"truncated": True, **result}
+                    yield {"source": source, **result}
+            refill()
+
+
+def run_archives(paths: List[str], options: Dict, jobs: Optional[int] = None,
+                 profile: bool = False) -> Iterator[Dict]:
+    """
+    Process every page in WARC or compressed archives across worker processes.
+    
+    Archives are decompressed and split into pages in this process while
+    the workers parse, with a bounded number of pages in flight. Results
+    are yielded in archive order, each tagged with its archive, target URI
+    and record offset.
+    
+    Args:
+        paths: Archive paths (see iter_archive_pages)
+        options: WebpageProcessor keyword arguments
+        jobs: Number of worker processes (defaults to CPU count)
+        profile: Add a "profile" report to each result
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    
+    jobs = jobs or os.cpu_count() or 1
+    options = dict(options, parser=resolve_parser(options.get("parser", DEFAULT_PARSER)))
+    max_pending = 4 * jobs
+    
+    with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker,
+                             initargs=(options, profile)) as pool:
+        pending = deque()
+        
+        def finish(entry):
+            path, uri, offset, future = entry
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {"error": f"Error processing input: {e}"}
+            return {"source": path, "uri": uri, "offset": offset, **result}
+        
+        for path in paths:
+            try:
+                for page in iter_archive_pages(path):
+                    future = pool.submit(process_in_worker, page["html"])
+                    pending.append((path, page["uri"], page["offset"], future))
+                    if len(pending) >= max_pending:
+                        yield finish(pending.popleft())
+            except (OSError, ValueError, EOFError, zlib.error) as e:
+                while pending:
+                    yield finish(pending.popleft())
+                yield {"source": path, "error": f"Error reading archive: {e}"}
+        while pending:
+            yield finish(pending.popleft())
+
+
+class SeenSet:
+    """
+    Set of URLs stored as 64-bit hashes rather than strings.
+    
+    Takes a fraction of the memory of the URLs themselves; with 64 bits a
+    false "already seen" is vanishingly unlikely even for huge crawls.
+    """
+
+    def __init__(self):
+        self.hashes: set = set()
+    
+    def key(self, url: str) -> int:
+        """Return the 64-bit hash stored for a URL."""
+        return int.from_bytes(hashlib.blake2b(url.encode("utf-8"), digest_size=8).digest(), "little")
+    
+    def add(self, url: str) -> bool:
+        """Add a URL, returning False if it was already present."""
+        key = self.key(url)
+        if key in self.hashes:
+            return False
+        self.hashes.add(key)
+        return True
+    
+    def __contains__(self, url: str) -> bool:
+        return self.key(url) in self.hashes
+    
+    def __len__(self) -> int:
+        return len(self.hashes)
+
+
+def is_crawlable(url: str, origin: tuple) -> bool:
+    """Whether a normalized URL is on the given (scheme, host) origin and may be a page."""
+    parts = urlsplit(url)
+    if (parts.scheme, parts.netloc) != origin:
+        return False
+    return os.path.splitext(parts.path)[1].lower() not in NON_PAGE_EXTENSIONS
+
+
+def run_crawl(seeds: Iterable[str], options: Dict, max_depth: int = 2, max_pages: int = 100,
+              concurrency: int = 8, per_host: int = 2,
+              jobs: Optional[int] = None,
+              cache: Optional[HTTPCache] = None,
+              profile: bool = False) -> Iterator[Dict]:
+    """
+    Crawl the sites of the seed URLs breadth-first, processing every page.
+    
+    Only links on the same origin (scheme and host) as the page they were
+    found on are followed. Links resolve against the URL a page came from
+    after redirects; a page redirected to another origin is processed but
+    its links are not followed, except for seeds, whose redirect target
+    becomes the site crawled. Pages are fetched by a thread pool sharing one
+    pooled HTTP session and parsed by worker processes, so fetching carries
+    on while earlier pages are processed. Results are yielded in completion
+    order, each tagged with its URL ("source") and link depth.
+    
+    Args:
+        seeds: Start URLs (depth 0)
+        options: WebpageProcessor keyword arguments
+        max_depth: Deepest link depth to fetch
+        max_pages: Maximum pages to fetch
+        concurrency: Maximum pages being fetched at once
+        per_host: Maximum pages being fetched at once from one host
+        jobs: Number of worker processes (defaults to CPU count)
+        cache: HTTP cache shared by all fetches
+        profile: Add a "profile" report, including fetch time, to each result
+    """
+    from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+    
+    loader = WebpageProcessor(**options)
+    loader.cache = cache
+    options = dict(options, parser=loader.parser)
+    loader.session = create_session(concurrency, per_host)
+    jobs = jobs or os.cpu_count() or 1
+    
+    # Breadth-first queue per host; hosts take turns so one site cannot
+    # starve the others
+    seen = SeenSet()
+    queues: Dict[str, deque] = OrderedDict()
+    for seed in seeds:
+        url = normalize_url(seed)
+        if url is None:
+            yield {"source": seed, "error": "Not an http(s) URL"}
+        elif seen.add(url):
+            queues.setdefault(urlsplit(url).netloc, deque()).append((url, 0))
+    
+    with ThreadPoolExecutor(max_workers=concurrency) as fetch_pool, \
+         ProcessPoolExecutor(max_workers=jobs, initializer=init_worker,
+                             initargs=(options, profile)) as parse_pool:
+        pending = {}
+        fetching: Dict[str, int] = defaultdict(int)
+        fetched = 0
+        
+        def load(url):
+            start = time.perf_counter()
+            html_content, truncated, final_url = loader.fetch_page(url)
+            return html_content, truncated, final_url, time.perf_counter() - start
+        
+        def refill():
+            nonlocal fetched
+            # Parsed pages waiting for a worker count against the fetch limit,
+            # so pages are not fetched faster than they can be processed
+            while fetched < max_pages and len(pending) < concurrency + 2 * jobs:
+                host = next((host for host, queue in queues.items()
+                             if queue and fetching[host] < per_host), None)
+                if host is None or sum(fetching.values()) >= concurrency:
+                    return
+                url, depth = queues[host].popleft()
+                queues.move_to_end(host)
+                future = fetch_pool.submit(load, url)
+                pending[future] = ("fetch", url, url, depth, False, 0)
+                fetching[host] += 1
+                fetched += 1
+        
+        refill()
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, url, final_url, depth, truncated, load_time = pending.pop(future)
+                if stage == "fetch":
+                    fetching[urlsplit(url).netloc] -= 1
+                    html_content, truncated, final_url, load_time = future.result()
+                    final_url = normalize_url(final_url) or url
+                    if final_url != url:
+                        # Links to the redirect target are not fetched again
+                        seen.add(final_url)
+                    if html_content:
+                        future = parse_pool.submit(crawl_in_worker, html_content, final_url)
+                        pending[future] = ("parse", url, final_url, depth, truncated, load_time)
+                    else:
+                        yield {"source": url, "depth": depth, "error": "Could not process input source"}
+                    continue
+                
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {"error": f"Error processing input: {e}"}
+                links = result.pop("links", [])
+                parts = urlsplit(final_url)
+                origin = (parts.scheme, parts.netloc)
+                requested = urlsplit(url)
+                if depth < max_depth and (depth == 0 or origin == (requested.scheme, requested.netloc)):
+                    for link in links:
+                        if is_crawlable(link, origin) and seen.add(link):
+                            queues.setdefault(origin[1], deque()).append((link, depth + 1))
+                if "profile" in result:
+                    result["profile"]["stages"]["load"] = round(load_time, 6)
+                if truncated:
+                    result = {"truncated": True, **result}
+                yield {"source": url, "depth": depth, **result}
+            refill()
+
+
+def result_records(result: Dict) -> Iterator[Dict]:
+    """Split a processed result into per-section JSON Lines records."""
+    if "error" in result:
+        yield {"error": result["error"]}
+        return
+    if "metadata" in result:
+        yield {"section": "metadata", "data": result["metadata"]}
+    for section, contents in result.get("categorized_content", {}).items():
+        for content in contents:
+            yield {"section": section, "data": content}
+    if "text_summary" in result:
+        yield {"section": "text_summary", "data": result["text_summary"]}
+
+
+class BoilerplateIndex:
+    """
+    Index of content blocks repeated across the pages of a run.
+    
+    Every node of each page's categorized_content is fingerprinted with a
+    64-bit hash of its own fields and its children's fingerprints, so all
+    subtrees of a page are hashed in one bottom-up pass and memory grows
+    only by one integer per distinct block. When a block is seen a second
+    time it is given an ID and emitted once as a
+    {"boilerplate": ID, "data": block} record, and every later copy,
+    including that one, is replaced with {"ref": ID}. The page a block
+    first appeared on keeps it inline, since it was not yet known to repeat.
+    """
+
+    def __init__(self, min_size: int = MIN_BOILERPLATE_SIZE):
+        """
+        Args:
+            min_size: Smallest block replaced, in encoded JSON bytes; smaller
+                      blocks cost less inline than as references
+        """
+        self.min_size = min_size
+        self.seen: set = set()
+        self.ids: Dict[int, str] = {}
+    
+    def fingerprint(self, node: Dict, prints: Dict[int, tuple]) -> tuple:
+        """Return a node's (hash, size), recording those of its whole subtree by id()."""
+        child_prints = [self.fingerprint(child, prints) for child in node.get("children", ())]
+        fields = {key: value for key, value in node.items() if key != "children"}
+        encoded = json.dumps(fields, ensure_ascii=False, sort_keys=True,
+                             default=json_default).encode("utf-8")
+        digest = hashlib.blake2b(encoded, digest_size=8)
+        for key, _ in child_prints:
+            digest.update(key.to_bytes(8, "little"))
+        prints[id(node)] = (int.from_bytes(digest.digest(), "little"),
+                            len(encoded) + sum(size for _, size in child_prints))
+        return prints[id(node)]
+    
+    def replace(self, node: Dict, prints: Dict[int, tuple], blocks: List[Dict]) -> Dict:
+        """Replace repeated blocks in a subtree with references, outermost first."""
+        key, size = prints[id(node)]
+        if size >= self.min_size:
+            block_id = self.ids.get(key)
+            if block_id is None and key in self.seen:
+                block_id = self.ids[key] = f"{key:016x}"
+                blocks.append({"boilerplate": block_id, "data": node})
+            if block_id is not None:
+                return {"ref": block_id}
+            self.seen.add(key)
+        
+        children = node.get("children")
+        if not children:
+            return node
+        replaced = [self.replace(child, prints, blocks) for child in children]
+        if all(new is old for new, old in zip(replaced, children)):
+            return node
+        return {**node, "children": replaced}
+    
+    def dedupe(self, records: Iterable[Dict]) -> Iterator[Dict]:
+        """Yield page records with repeated blocks replaced, each preceded by the blocks it first repeats."""
+        for record in records:
+            content = record.get("categorized_content")
+            if content:
+                blocks: List[Dict] = []
+                deduped = {}
+                for section, nodes in content.items():
+                    prints: Dict[int, tuple] = {}
+                    for node in nodes:
+                        self.fingerprint(node, prints)
+                    deduped[section] = [self.replace(node, prints, blocks) for node in nodes]
+                record = {**record, "categorized_content": deduped}
+                yield from blocks
+            yield record
+
+
+class Chunker:
+    """
+    Splitter of Markdown text summaries into chunks for LLM ingestion.
+    
+    Chunks end at paragraph boundaries, before headings once they are at
+    least half full, and only split inside a paragraph (at a line break,
+    then a space) when the paragraph alone is too big. Each chunk records
+    the headings it falls under. Sizes are counted in characters or in
+    approximate tokens (see TOKEN_PATTERN).
+    """
+
+    def __init__(self, size: int = DEFAULT_CHUNK_SIZE, overlap: int = 0, unit: str = "tokens"):
+        """
+        Args:
+            size: Maximum chunk size
+            overlap: Size of trailing paragraphs repeated at the start of
+                     the next chunk within a section
+            unit: "tokens" or "chars"
+        """
+        if unit not in ("tokens", "chars"):
+            raise ValueError(f"Unknown chunk unit: {unit}")
+        if size < 1 or not 0 <= overlap < size:
+            raise ValueError("Chunk size must be positive and larger than the overlap")
+        self.size = size
+        self.overlap = overlap
+        self.unit = unit
+        self.separator_size = self.measure("\n\n")
+    
+    def settings(self) -> Dict:
+        """Return the settings that affect the chunks."""
+        return {"size": self.size, "overlap": self.overlap, "unit": self.unit}
+    
+    def measure(self, text: str) -> int:
+        """Return the size of text in the chunk unit."""
+        if self.unit == "chars":
+            return len(text)
+        return len(TOKEN_PATTERN.findall(text))
+    
+    def cut(self, text: str) -> Optional[int]:
+        """Return the end of the longest prefix of text within size, or None if all of it fits."""
+        if self.unit == "chars":
+            return self.size if len(text) > self.size else None
+        for count, match in enumerate(TOKEN_PATTERN.finditer(text)):
+            if count == self.size:
+                return match.start()
+        return None
+    
+    def pieces(self, block: str) -> Iterator[str]:
+        """Split a block too big for one chunk, preferring line breaks, then spaces."""
+        while True:
+            end = self.cut(block)
+            if end is None:
+                if block:
+                    yield block
+                return
+            split = block.rfind("\n", 0, end)
+            if split <= end // 2:
+                split = block.rfind(" ", 0, end)
+            if split <= end // 2:
+                split = end
+            yield block[:split].rstrip()
+            block = block[split:].lstrip()
+    
+    def blocks(self, text: str) -> Iterator[str]:
+        """Yield the non-blank blocks between blank lines of a Markdown text."""
+        start = 0
+        for match in BLOCK_SEPARATOR.finditer(text):
+            if text[start:match.start()].strip():
+                yield text[start:match.start()].strip("\n")
+            start = match.end()
+        if text[start:].strip():
+            yield text[start:].strip("\n")
+    
+    def chunks(self, text: str) -> Iterator[Dict]:
+        """
+        Yield {"chunk", "headings", <unit>, "text"} chunks of a Markdown text
+        as they are completed, without splitting the whole text up front.
+        """
+        headings: List[tuple] = []
+        breadcrumb: List[str] = []
+        blocks: List[str] = []
+        sizes: List[int] = []
+        # Size of the blocks joined by blank lines, and how many leading
+        # blocks were repeated from the previous chunk
+        total = 0
+        repeated = 0
+        number = 0
+        
+        def emit(overlap: bool) -> Dict:
+            nonlocal blocks, sizes, total, repeated, number, breadcrumb
+            chunk = {"chunk": number, "headings": breadcrumb, self.unit: total,
+                     "text": "\n\n".join(blocks)}
+            number += 1
+            kept = 0
+            kept_size = -self.separator_size
+            while overlap and kept < len(blocks) - 1 and \
+                    kept_size + self.separator_size + sizes[-1 - kept] <= self.overlap:
+                kept_size += self.separator_size + sizes[-1 - kept]
+                kept += 1
+            blocks, sizes = blocks[len(blocks) - kept:], sizes[len(sizes) - kept:]
+            total, repeated = max(kept_size, 0), kept
+            breadcrumb = [title for _, title in headings]
+            return chunk
+        
+        for block in self.blocks(text):
+            heading = MARKDOWN_HEADING.match(block)
+            if heading:
+                if len(blocks) > repeated and total >= self.size // 2:
+                    yield emit(overlap=False)
+                elif len(blocks) == repeated:
+                    # Overlap is only kept within a section
+                    blocks, sizes, total, repeated = [], [], 0, 0
+                level = len(heading.group(1))
+                while headings and headings[-1][0] >= level:
+                    headings.pop()
+                headings.append((level, heading.group(2).strip()))
+            
+            for piece in self.pieces(block):
+                size = self.measure(piece)
+                if blocks and total + self.separator_size + size > self.size:
+                    if len(blocks) > repeated:
+                        yield emit(overlap=True)
+                    if blocks and total + self.separator_size + size > self.size:
+                        # The overlap and this piece do not fit together
+                        blocks, sizes, total, repeated = [], [], 0, 0
+                if not blocks:
+                    breadcrumb = [title for _, title in headings]
+                    total = size
+                else:
+                    total += self.separator_size + size
+                blocks.append(piece)
+                sizes.append(size)
+        
+        if len(blocks) > repeated:
+            yield emit(overlap=False)
+
+
+def select_fields(records: Iterable[Dict], output_format: str,
+                  chunker: Optional[Chunker] = None) -> Iterator[Dict]:
+    """Shape page records for the output format."""
+    for record in records:
+        if "boilerplate" in record:
+            # Shared block (see BoilerplateIndex), the same in every format
+            yield record
+            continue
+        # Tags identifying the page, such as its source, URI and offset
+        tags = {k: v for k, v in record.items() if k not in SECTIONS and k != "error"}
+        if output_format == "text":
+            yield {**tags, **{k: v for k, v in record.items() if k in ("text_summary", "error")}}
+        elif output_format == "chunks":
+            # One record per chunk of the text summary, tagged with its source
+            if "error" in record:
+                yield {**tags, "error": record["error"]}
+            else:
+                for chunk in (chunker or Chunker()).chunks(record.get("text_summary", "")):
+                    yield {**tags, **chunk}
+        elif output_format == "jsonl":
+            # One record per section and top-level node, tagged with its source
+            for section_record in result_records(record):
+                yield {**tags, **section_record}
+        else:
+            yield record
+
+
+def format_result(result: Dict, output_format: str, chunker: Optional[Chunker] = None) -> str:
+    """Encode a page result as a whole json, jsonl, chunks or text document."""
+    if output_format == "text":
+        return result.get("text_summary", "Error: No text summary available")
+    if output_format == "jsonl":
+        return "".join(dump_json_line(record) for record in result_records(result))
+    if output_format == "chunks":
+        return "".join(dump_json_line(record) for record in select_fields([result], "chunks", chunker))
+    return json.dumps(result, indent=2, ensure_ascii=False, default=json_default)
+
+
+def dump_json_line(record: Dict, fast: bool = False) -> str:
+    """Encode a record as one line of compact JSON, with orjson if fast and installed."""
+    if fast and orjson is not None:
+        return orjson.dumps(record, default=json_default).decode("utf-8") + "\n"
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":"), default=json_default) + "\n"
+
+
+def collect_profiles(records: Iterable[Dict], totals: Profiler) -> Iterator[Dict]:
+    """Move each record's profile to stderr as JSON Lines, adding it to totals."""
+    for record in records:
+        profile = record.pop("profile", None)
+        if profile is not None:
+            totals.merge(profile)
+            print(json.dumps({"source": record.get("source"), "profile": profile}), file=sys.stderr)
+        yield record
+
+
+def write_json_lines(records: Iterable[Dict], output: Optional[str] = None,
+                     profiler: Optional[Profiler] = None, fast: bool = False):
+    """Write records as JSON Lines to a file or stdout, flushing each line."""
+    f = open(output, "w", encoding="utf-8") if output else sys.stdout
+    encode_stage = profiler.stage if profiler else lambda name: NULL_STAGE
+    try:
+        for record in records:
+            with encode_stage("encode"):
+                line = dump_json_line(record, fast)
+            f.write(line)
+            f.flush()
+    finally:
+        if f is not sys.stdout:
+            f.close()
+
+
+class PageServer:
+    """
+    Request handling behind serve(), independent of the HTTP transport.
+    
+    Pages are processed by worker processes that stay alive (with their
+    imports done and WebpageProcessor built) between requests. URLs are
+    fetched on the request's own thread through one pooled session. Every
+    stage's latency, including the worker's own stages, goes into `metrics`.
+    """
+
+    def __init__(self, options: Dict, jobs: Optional[int] = None,
+                 concurrency: int = 8, per_host: int = 2,
+                 cache: Optional[HTTPCache] = None, fast: bool = False):
+        """
+        Start the worker pool and process a warm-up page on it.
+        
+        Args:
+            options: WebpageProcessor keyword arguments
+            jobs: Number of worker processes (defaults to CPU count)
+            concurrency: Number of hosts to keep connection pools for
+            per_host: Maximum open connections per host
+            cache: HTTP cache for fetched URLs
+            fast: Encode responses with orjson when it is installed
+        """
+        from concurrent.futures import ProcessPoolExecutor
+        
+        self.loader = WebpageProcessor(**options)
+        self.loader.cache = cache
+        self.loader.session = create_session(concurrency, per_host)
+        options = dict(options, parser=self.loader.parser)
+        self.jobs = jobs or os.cpu_count() or 1
+        # Workers profile every page (without tracemalloc) to feed the metrics
+        self.pool = ProcessPoolExecutor(max_workers=self.jobs, initializer=init_worker,
+                                        initargs=(options, True, False))
+        self.fast = fast
+        if fast and orjson is not None:
+            # LazyLoader is not thread-safe: finish the import before
+            # request threads race to trigger it
+            load_modules(orjson)
+        self.metrics = LatencyMetrics()
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.requests = 0
+        self.errors = 0
+        self.active = 0
+        
+        for future in [self.pool.submit(process_in_worker, WARMUP_PAGE) for _ in range(self.jobs)]:
+            future.result()
+    
+    def close(self):
+        """Stop the worker processes."""
+        self.pool.shutdown(cancel_futures=True)
+    
+    def encode(self, value: Any) -> bytes:
+        """Encode a response body as JSON."""
+        if self.fast and orjson is not None:
+            return orjson.dumps(value, default=json_default)
+        return json.dumps(value, ensure_ascii=False, default=json_default).encode("utf-8")
+    
+    def error(self, status: int, message: str) -> tuple:
+        """Build an error response, with the standard library encoder so it cannot fail in encode()."""
+        body = json.dumps({"error": message}, ensure_ascii=False).encode("utf-8")
+        return status, "application/json", body
+    
+    def handle(self, method: str, target: str, content_type: str, body: bytes) -> tuple:
+        """
+        Handle one request, recording its latency.
+        
+        Args:
+            method: HTTP method
+            target: Request path and query string
+            content_type: Content-Type header of the request body
+            body: Request body
+        
+        Returns:
+            (status, content type, body) of the response
+        """
+        start = time.perf_counter()
+        with self.lock:
+            self.requests += 1
+            self.active += 1
+        try:
+            response = self.route(method, target, content_type, body)
+        except Exception as e:
+            response = self.error(500, f"Error processing input: {e}")
+        finally:
+            with self.lock:
+                self.active -= 1
+        if response[0] >= 400:
+            with self.lock:
+                self.errors += 1
+        self.metrics.record("request", time.perf_counter() - start)
+        return response
+    
+    def route(self, method: str, target: str, content_type: str, body: bytes) -> tuple:
+        """Dispatch a request to /health, /metrics or /process."""
+        parts = urlsplit(target)
+        if parts.path == "/health":
+            with self.lock:
+                health = {"status": "ok", "uptime": round(time.time() - self.started, 3),
+                          "workers": self.jobs, "requests": self.requests,
+                          "active": self.active, "errors": self.errors}
+            return 200, "application/json", self.encode(health)
+        if parts.path == "/metrics":
+            return 200, "application/json", self.encode({"stages": self.metrics.report()})
+        if parts.path != "/process":
+            return self.error(404, f"Unknown path: {parts.path}")
+        if method not in ("GET", "POST"):
+            return self.error(405, f"Method not allowed: {method}")
+        
+        # Parameters come from the query string, then a JSON body or raw HTML body
+        params: Dict[str, Any] = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+        if method == "POST":
+            if content_type.split(";")[0].strip() == "application/json":
+                try:
+                    request = json.loads(body)
+                except ValueError as e:
+                    return self.error(400, f"Invalid JSON: {e}")
+                if not isinstance(request, dict):
+                    return self.error(400, "JSON body must be an object")
+                for key in ("html", "url", "fields", "format"):
+                    if key in request and not isinstance(request[key], str):
+                        return self.error(400, f"\"{key}\" must be a string")
+                params.update(request)
+            elif body:
+                params["html"] = body.decode("utf-8", errors="replace")
+        
+        html_content = params.get("html")
+        url = params.get("url")
+        if not html_content and not url:
+            return self.error(400, "Request needs HTML or a url")
+        output_format = params.get("format", "json")
+        if output_format not in ("json", "text"):
+            return self.error(400, f"Unknown format: {output_format}")
+        fields = params.get("fields")
+        if fields is None and output_format == "text":
+            fields = "text_summary"
+        try:
+            sections = resolve_sections(fields)
+        except ValueError as e:
+            return self.error(400, str(e))
+        
+        result = self.process(html_content, url, sections)
+        if result is None:
+            return self.error(502, "Could not process input source")
+        with self.metrics.stage("encode"):
+            if output_format == "text":
+                text = result.get("text_summary", "Error: No text summary available")
+                return 200, "text/plain; charset=utf-8", text.encode("utf-8")
+            return 200, "application/json", self.encode(result)
+    
+    def process(self, html_content: Optional[str], url: Optional[str],
+                sections: Optional[frozenset]) -> Optional[Dict]:
+        """Fetch the page if needed and process it on a worker, or return None."""
+        truncated = False
+        if not html_content:
+            with self.metrics.stage("fetch"):
+                html_content, truncated = self.loader.load_input(url, is_url=True)
+            if not html_content:
+                return None
+        
+        start = time.perf_counter()
+        result = self.pool.submit(process_in_worker, html_content, sections).result()
+        elapsed = time.perf_counter() - start
+        stages = result.pop("profile")["stages"]
+        for name, seconds in stages.items():
+            self.metrics.record(name, seconds)
+        # Time waiting for a free worker and moving the page and result between processes
+        self.metrics.record("queue", max(0.0, elapsed - sum(stages.values())))
+        return {"truncated": True, **result} if truncated else result
+
+
+def serve(address: str, page_server: PageServer):
+    """
+    Serve a PageServer over HTTP until interrupted.
+    
+    Endpoints:
+        GET /health: status, uptime and request counters
+        GET /metrics: per-stage latency count, mean and percentiles
+        GET /process?url=...: fetch and process a URL
+        POST /process: process the HTML body, or a JSON body with "html" or
+            "url". Either form accepts "fields" (see --fields) and "format"
+            ("json" or "text") as parameters.
+    
+    Args:
+        address: [HOST:]PORT on localhost by default, or a Unix socket path
+        page_server: Backend handling the requests
+    """
+    import signal
+    import socketserver
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    
+    class RequestHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        
+        def do_GET(self):
+            self.respond(page_server.handle("GET", self.path, "", b""))
+        
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            if length > MAX_REQUEST_SIZE:
+                self.close_connection = True
+                self.respond(page_server.error(413, "Request body too large"))
+                return
+            body = self.rfile.read(length)
+            self.respond(page_server.handle("POST", self.path,
+                                            self.headers.get("Content-Type", ""), body))
+        
+        def respond(self, response: tuple):
+            status, content_type, body = response
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def address_string(self) -> str:
+            # Unix socket clients have no (host, port) address
+            return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+    
+    class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+    
+    if "/" in address:
+        if os.path.exists(address):
+            os.unlink(address)
+        server = UnixHTTPServer(address, RequestHandler)
+    else:
+        host, _, port = address.rpartition(":")
+        server = ThreadingHTTPServer((host or "127.0.0.1", int(port)), RequestHandler)
+    
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+    
+    # Shut down cleanly (removing the socket file) when terminated as well as on Ctrl-C
+    signal.signal(signal.SIGTERM, stop)
+    print(f"Serving on {address} with {page_server.jobs} workers", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if "/" in address and os.path.exists(address):
+            os.unlink(address)
 
 
 def main():
@@ -587,6 +3645,7 @@ def main():
     )
     parser.add_argument(
         "input", 
+        nargs="?",
         help="Input URL, file path, or HTML string"
     )
     parser.add_argument(
@@ -600,9 +3659,10 @@ def main():
     )
     parser.add_argument(
         "-f", "--format",
-        choices=["json", "text"], 
+        choices=["json", "jsonl", "chunks", "text"], 
         default="json",
-        help="Output format (json or text)"
+        help="Output format (json, jsonl with one record per section node, chunks "
+             "with one record per chunk of the text summary, or text)"
     )
     parser.add_argument(
         "--min-length", 
@@ -610,16 +3670,354 @@ def main():
         default=10,
         help="Minimum text length to include"
     )
+    parser.add_argument(
+        "--parser",
+        choices=list(PARSER_BACKENDS),
+        default=DEFAULT_PARSER,
+        help="HTML parser backend (falls back to html.parser if not installed)"
+    )
+    parser.add_argument(
+        "--max-depth",
+        type=int,
+        default=3,
+        help="Maximum depth of extracted element trees"
+    )
+    parser.add_argument(
+        "--max-nodes",
+        type=int,
+        help="Nodes extracted into categorized_content per page; the rest are "
+             "counted in \"truncated\" nodes, and depth shrinks as the budget is used"
+    )
+    parser.add_argument(
+        "--max-output-size",
+        type=int,
+        help="Characters of text and attribute values extracted into categorized_content per page"
+    )
+    parser.add_argument(
+        "--time-budget",
+        type=float,
+        help="Seconds spent extracting categorized_content per page"
+    )
+    parser.add_argument(
+        "--fields",
+        help="Comma-separated sections to compute: metadata, categorized_content, "
+             "text_summary, or sub-sections of categorized_content ("
+             + ", ".join(CONTENT_SECTIONS) + "). Defaults to everything, "
+             "or just text_summary for text and chunks output"
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=DEFAULT_CHUNK_SIZE,
+        help="Maximum size of each chunk with -f chunks"
+    )
+    parser.add_argument(
+        "--chunk-overlap",
+        type=int,
+        default=0,
+        help="Size of trailing paragraphs repeated at the start of the next chunk"
+    )
+    parser.add_argument(
+        "--chunk-unit",
+        choices=["tokens", "chars"],
+        default="tokens",
+        help="Unit of --chunk-size and --chunk-overlap (tokens are approximate: "
+             "one per word or punctuation mark)"
+    )
+    parser.add_argument(
+        "-b", "--batch",
+        metavar="FILE",
+        help="Process URLs or file paths listed in FILE ('-' for stdin) as JSON Lines"
+    )
+    parser.add_argument(
+        "-d", "--dir",
+        metavar="DIR_OR_GLOB",
+        help="Process HTML files in a directory or matching a glob as JSON Lines"
+    )
+    parser.add_argument(
+        "--output-dir",
+        metavar="DIR",
+        help="With --dir, write one output file per input into DIR and only "
+             "reprocess inputs that changed since the last run"
+    )
+    parser.add_argument(
+        "--manifest",
+        metavar="FILE",
+        help=f"Manifest for --output-dir runs (default: DIR/{MANIFEST_NAME})"
+    )
+    parser.add_argument(
+        "-a", "--archive",
+        metavar="FILE",
+        nargs="+",
+        help="Process every page in WARC files (.warc, .warc.gz, .warc.zst) or "
+             "compressed pages (.html.gz, .html.zst) as JSON Lines"
+    )
+    parser.add_argument(
+        "-c", "--crawl",
+        metavar="URL",
+        nargs="+",
+        help="Crawl the sites of these seed URLs breadth-first, following same-origin "
+             "links, as JSON Lines"
+    )
+    parser.add_argument(
+        "--crawl-depth",
+        type=int,
+        default=2,
+        help="Maximum link depth from the seeds when crawling"
+    )
+    parser.add_argument(
+        "--max-pages",
+        type=int,
+        default=100,
+        help="Maximum pages fetched when crawling"
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=8,
+        help="Maximum concurrent fetches in batch mode"
+    )
+    parser.add_argument(
+        "--per-host",
+        type=int,
+        default=2,
+        help="Maximum connections per host in batch mode"
+    )
+    parser.add_argument(
+        "--max-fetch-size",
+        type=float,
+        default=MAX_FETCH_SIZE / (1024 * 1024),
+        help="MB of a fetched page to read; larger pages are truncated and flagged"
+    )
+    parser.add_argument(
+        "--fetch-time-limit",
+        type=float,
+        default=FETCH_TIME_LIMIT,
+        help="Seconds to spend reading a fetched page before truncating it"
+    )
+    parser.add_argument(
+        "--dedupe",
+        action="store_true",
+        help="In batch, directory, archive and crawl runs, output blocks repeated "
+             "across pages once, as {\"boilerplate\": ID, \"data\": ...} records, "
+             "and replace their copies with {\"ref\": ID}"
+    )
+    parser.add_argument(
+        "-j", "--jobs",
+        type=int,
+        default=None,
+        help="Worker processes for parsing (default: CPU count)"
+    )
+    parser.add_argument(
+        "--cache-dir",
+        help="Cache fetched pages in this directory and revalidate them on later runs"
+    )
+    parser.add_argument(
+        "--cache-ttl",
+        type=float,
+        default=0,
+        help="Seconds to reuse a cached page without revalidating it"
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=512,
+        help="Maximum cache size in MB (least recently used pages are evicted)"
+    )
+    parser.add_argument(
+        "--result-cache",
+        metavar="DB",
+        help="Reuse results for unchanged pages from this SQLite file"
+    )
+    parser.add_argument(
+        "--result-cache-size",
+        type=int,
+        default=1024,
+        help="Maximum result cache size in MB (least recently used results are evicted)"
+    )
+    parser.add_argument(
+        "--fast-json",
+        action="store_true",
+        help="Encode JSON Lines output with orjson when it is installed"
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Stream metadata, heading, link and text records as JSON Lines "
+             "with bounded memory, without building a document tree"
+    )
+    parser.add_argument(
+        "--serve",
+        metavar="ADDRESS",
+        help="Run a server on [HOST:]PORT (localhost by default) or a Unix socket path, "
+             "with endpoints /process, /health and /metrics"
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Write per-stage timings, counters and peak memory to stderr as JSON Lines"
+    )
     
     args = parser.parse_args()
+    if (args.input is None and args.batch is None and args.dir is None
+            and args.archive is None and args.crawl is None and args.serve is None):
+        parser.error("an input, --batch, --dir, --archive, --crawl or --serve is required")
     
-    processor = WebpageProcessor(min_text_length=args.min_length)
-    result = processor.process_input(args.input, is_url=args.url)
+    fields = args.fields
+    if fields is None and args.format in ("text", "chunks"):
+        # Text and chunks output only show the summary, so nothing else is computed
+        fields = "text_summary"
+    try:
+        sections = resolve_sections(fields)
+        chunker = Chunker(args.chunk_size, args.chunk_overlap, args.chunk_unit)
+    except ValueError as e:
+        parser.error(str(e))
+    
+    options = {
+        "min_text_length": args.min_length,
+        "parser": args.parser,
+        "max_depth": args.max_depth,
+        "result_cache": args.result_cache,
+        "result_cache_size": args.result_cache_size,
+        "sections": sections,
+        "max_fetch_size": int(args.max_fetch_size * 1024 * 1024),
+        "fetch_time_limit": args.fetch_time_limit,
+        "max_nodes": args.max_nodes,
+        "max_output_size": args.max_output_size,
+        "time_budget": args.time_budget,
+    }
+    cache = None
+    if args.cache_dir:
+        cache = HTTPCache(args.cache_dir, ttl=args.cache_ttl, max_size=args.cache_size * 1024 * 1024)
+    if args.result_cache:
+        result_cache_before = ResultCache(args.result_cache).stats()
+    
+    profiler = Profiler(trace_memory=True) if args.profile else None
+    
+    if args.output_dir and not args.dir:
+        parser.error("--output-dir needs --dir")
     
-    if args.format == "text":
-        output = result.get("text_summary", "Error: No text summary available")
+    if args.output_dir:
+        counts: Dict[str, int] = defaultdict(int)
+        
+        def report(records):
+            for record in records:
+                counts[record["action"]] += 1
+                if record["action"] != "unchanged":
+                    yield record
+        
+        records = run_incremental(args.dir, args.output_dir, options, output_format=args.format,
+                                  jobs=args.jobs, manifest_path=args.manifest, chunker=chunker)
+        try:
+            write_json_lines(report(records), args.output)
+        except OSError as e:
+            print(f"Error writing output: {e}", file=sys.stderr)
+            sys.exit(1)
+        print("Incremental run: " + ", ".join(
+            f"{counts[action]} {action}"
+            for action in ("added", "updated", "unchanged", "deleted", "failed")), file=sys.stderr)
+    elif args.serve:
+        page_server = PageServer(options, jobs=args.jobs, concurrency=args.concurrency,
+                                 per_host=args.per_host, cache=cache, fast=args.fast_json)
+        try:
+            serve(args.serve, page_server)
+        except (OSError, ValueError) as e:
+            print(f"Error starting server: {e}", file=sys.stderr)
+            sys.exit(1)
+        finally:
+            page_server.close()
+    elif args.stream:
+        if args.input is None:
+            parser.error("--stream needs an input URL, file path or '-' for stdin")
+        processor = WebpageProcessor(**options)
+        try:
+            write_json_lines(processor.stream_input(args.input, is_url=args.url), args.output,
+                             fast=args.fast_json)
+        except OSError as e:  # requests.RequestException is an OSError
+            print(f"Error streaming input: {e}", file=sys.stderr)
+            sys.exit(1)
+    elif args.batch or args.dir or args.archive or args.crawl:
+        if args.crawl:
+            records = run_crawl(args.crawl, options, max_depth=args.crawl_depth,
+                                max_pages=args.max_pages, concurrency=args.concurrency,
+                                per_host=args.per_host, jobs=args.jobs, cache=cache,
+                                profile=args.profile)
+        elif args.batch:
+            records = run_batch(read_sources(args.batch), options, is_url=args.url,
+                                concurrency=args.concurrency, per_host=args.per_host,
+                                jobs=args.jobs, cache=cache, profile=args.profile)
+        elif args.archive:
+            records = run_archives(args.archive, options, jobs=args.jobs, profile=args.profile)
+        else:
+            records = run_files(find_html_files(args.dir), options, jobs=args.jobs,
+                                profile=args.profile)
+        if profiler:
+            records = collect_profiles(records, profiler)
+        if args.dedupe:
+            records = BoilerplateIndex().dedupe(records)
+        try:
+            write_json_lines(select_fields(records, args.format, chunker), args.output, profiler,
+                             fast=args.fast_json)
+        except OSError as e:
+            print(f"Error writing to output file: {e}", file=sys.stderr)
+            sys.exit(1)
+        if profiler:
+            print(json.dumps({"profile_totals": profiler.report()}), file=sys.stderr)
     else:
-        output = json.dumps(result, indent=2, ensure_ascii=False)
+        write_single(args, options, cache, profiler, chunker)
+    
+    if args.result_cache:
+        stats = ResultCache(args.result_cache).stats()
+        print(f"Result cache: {stats['hits'] - result_cache_before['hits']} hits, "
+              f"{stats['misses'] - result_cache_before['misses']} misses, "
+              f"{stats['entries']} entries ({stats['size'] / 1024 / 1024:.1f} MB)",
+              file=sys.stderr)
+
+
+def write_single(args: argparse.Namespace, options: Dict, cache: Optional[HTTPCache],
+                 profiler: Optional[Profiler] = None, chunker: Optional[Chunker] = None):
+    """Process a single input and write it in the requested format."""
+    processor = WebpageProcessor(**options)
+    processor.cache = cache
+    processor.profiler = profiler
+    if profiler:
+        # Keep deferred imports out of the stage timings
+        load_modules(bs4, html2text)
+        profiler.start_page()
+    
+    if args.format == "jsonl":
+        # Records are written as each section node is extracted
+        records = processor.iter_input_records(args.input, is_url=args.url)
+        try:
+            write_json_lines(records, args.output, profiler, fast=args.fast_json)
+        except OSError as e:
+            print(f"Error writing to output file: {e}", file=sys.stderr)
+            sys.exit(1)
+        if profiler:
+            profiler.end_page()
+            print(json.dumps({"source": args.input, "profile": profiler.report()}), file=sys.stderr)
+        return
+    
+    result = processor.process_input(args.input, is_url=args.url)
+    
+    if args.format == "chunks":
+        # Chunks are written as each is completed
+        try:
+            write_json_lines(select_fields([result], "chunks", chunker), args.output, profiler,
+                             fast=args.fast_json)
+        except OSError as e:
+            print(f"Error writing to output file: {e}", file=sys.stderr)
+            sys.exit(1)
+        if profiler:
+            profiler.end_page()
+            print(json.dumps({"source": args.input, "profile": profiler.report()}), file=sys.stderr)
+        return
+    
+    with processor.stage("encode"):
+        output = format_result(result, args.format)
+    if profiler:
+        profiler.end_page()
+        print(json.dumps({"source": args.input, "profile": profiler.report()}), file=sys.stderr)
     
     if args.output:
         try:
@@ -0,0 +1,941 @@
+#!/usr/bin/env python3
+"""
+test_strip.py - Tests for strip.py
+
+Run with: python -m unittest test_strip (or python -m pytest) from this directory.
+"""
+
+import gzip
+import importlib.util
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+STRIP = os.path.join(HERE, "strip.py")
+
+from strip import (PARSER_BACKENDS, BoilerplateIndex, Chunker, CompactRecord, HTTPCache, PageServer, StreamingExtractor, WebpageProcessor,
+                   decode_chunks, decode_html, detect_charset, iter_archive_pages, json_default,
+                   run_archives, run_batch, run_crawl, run_incremental, to_plain)
+
+# Pages whose Markdown rendering depends on html2text's table, list and <pre>
+# state, in an order where leftover state would show up in the next page
+STATEFUL_PAGES = {
+    "a_table.html": "<html><head><title>Table</title></head><body><main><h1>Table</h1>"
+                    "<table><tr><th>A</th><th>B</th></tr><tr><td>1</td><td>2</td></tr></table>"
+                    "</main></body></html>",
+    "b_list.html": "<html><head><title>List</title></head><body><main><h1>List</h1>"
+                   "<ol><li>one</li><li>two<ul><li>nested</li></ul></li></ol>"
+                   "<p>after the list</p></main></body></html>",
+    "c_pre.html": "<html><head><title>Pre</title></head><body><main><h1>Pre</h1>"
+                  "<pre>code\n  indented</pre><p>after <code>x</code></p></main></body></html>",
+    "d_plain.html": "<html><head><title>Plain</title></head><body><main><h1>Plain</h1>"
+                    "<p>hello</p><table><tr><td>a</td><td>b</td></tr></table></main></body></html>",
+}
+
+
+# Well-formed pages every parser backend must turn into the same output
+PARSER_CORPUS = {
+    "article": (
+        '<!DOCTYPE html><html lang="en"><head><meta charset="utf-8"><title>An article</title>'
+        '<meta name="description" content="About things">'
+        '<link rel="canonical" href="https://example.com/a"></head><body><header>'
+        '<a href="/">Site</a></header><nav><ul><li><a href="/one">One</a></li><li>'
+        '<a href="/two">Two</a></li></ul></nav><main><article><h1>An article</h1>'
+        '<p>First paragraph with <em>emphasis</em> and a <a href="https://example.org/x">link</a>.</p>'
+        "<h2>Details</h2>"
+        "<p>Second paragraph &amp; an entity, plus a <code>code</code> span.</p><ul>"
+        "<li>alpha</li><li>beta</li></ul><blockquote><p>A quotation.</p></blockquote>"
+        "<pre>line one\n  line two</pre></article></main><footer><p>Footer text here.</p>"
+        "</footer></body></html>"
+    ),
+    "form": (
+        "<!DOCTYPE html><html><head><title>A form</title></head><body><main><h1>Sign up</h1>"
+        '<form action="/go" method="post"><label for="n">Name</label>'
+        '<input id="n" name="name" type="text" placeholder="Your name" required>'
+        '<textarea name="bio" rows="3" cols="40">Hello</textarea><select name="plan">'
+        '<option value="a">Plan A</option><option value="b" selected>Plan B</option></select>'
+        '<button type="submit">Send</button>'
+        '<div role="button" tabindex="0" onclick="go()">Click</div></form></main></body>'
+        "</html>"
+    ),
+    "table": (
+        "<!DOCTYPE html><html><head><title>A table</title></head><body><main><h1>Prices</h1>"
+        "<table><thead><tr><th>Item</th><th>Price</th></tr></thead><tbody><tr><td>Tea</td>"
+        "<td>2</td></tr><tr><td>Coffee</td><td>3</td></tr></tbody><tfoot><tr><td>Total</td>"
+        "<td>5</td></tr></tfoot></table>"
+        '<img src="/i.png" alt="An image" width="10" height="20"></main></body></html>'
+    ),
+    "nomain": (
+        "<!DOCTYPE html><html><head><title>No main</title><script>var x = 1;</script>"
+        '<style>p {}</style></head><body><div class="content"><h2>Heading</h2>'
+        "<p>A paragraph with quite a lot of text in it to count as content.</p>"
+        "<p>Another paragraph that is also long enough to be kept here.</p></div>"
+        '<div class="ad">Buy now</div><iframe src="/frame" width="5" height="6"></iframe>'
+        "</body></html>"
+    ),
+}
+
+
+def run_strip(*args: str) -> str:
+    """Run strip.py with the given arguments and return its stdout."""
+    result = subprocess.run([sys.executable, STRIP, *args], capture_output=True, text=True, check=True)
+    return result.stdout
+
+
+def write_pages(directory: str, pages: dict):
+    """Write name -> HTML pages into directory."""
+    for name, html in pages.items():
+        with open(os.path.join(directory, name), "w", encoding="utf-8") as f:
+            f.write(html)
+
+
+class DirectoryModeTest(unittest.TestCase):
+    """--dir output must not depend on which pages a worker processed before."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        write_pages(self.tmp.name, STATEFUL_PAGES)
+
+    def check_matches_single_files(self, output_format: str, field: str):
+        records = [json.loads(line) for line in
+                   run_strip("-d", self.tmp.name, "-j", "1", "-f", output_format).splitlines()]
+        self.assertEqual(len(records), len(STATEFUL_PAGES))
+        for record in records:
+            single = run_strip("-f", output_format, record["source"])
+            if output_format == "json":
+                self.assertEqual(record[field], json.loads(single)[field], record["source"])
+            else:
+                self.assertEqual(record[field].strip(), single.strip(), record["source"])
+
+    def test_text_matches_single_files(self):
+        self.check_matches_single_files("text", "text_summary")
+
+    def test_json_matches_single_files(self):
+        self.check_matches_single_files("json", "categorized_content")
+
+
+class IncrementalTest(unittest.TestCase):
+    """--output-dir runs only reprocess what changed, wherever they are run from."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.site = os.path.join(self.tmp.name, "site")
+        self.out = os.path.join(self.tmp.name, "out")
+        os.mkdir(self.site)
+        write_pages(self.site, {"a.html": page("A"), "b.html": page("B"), "c.html": page("C")})
+        cwd = os.getcwd()
+        self.addCleanup(os.chdir, cwd)
+
+    def run_from(self, cwd: str, site: str, out: str, output_format: str = "json") -> dict:
+        """Run incrementally from cwd and return {file name: action}."""
+        os.chdir(cwd)
+        return {os.path.basename(record["source"]): record["action"]
+                for record in run_incremental(site, out, {}, output_format=output_format, jobs=1)}
+
+    def outputs(self) -> list:
+        return sorted(name for name in os.listdir(self.out) if not name.startswith("."))
+
+    def test_actions(self):
+        self.assertEqual(self.run_from(self.tmp.name, "site", "out"),
+                         {"a.html": "added", "b.html": "added", "c.html": "added"})
+        self.assertEqual(self.outputs(), ["a.html.json", "b.html.json", "c.html.json"])
+        
+        # Edit one page, touch another without changing it, delete a third
+        # and add a fourth, then run again from elsewhere with absolute paths
+        write_pages(self.site, {"a.html": page("A", "/changed"), "b.html": page("B"), "d.html": page("D")})
+        os.remove(os.path.join(self.site, "c.html"))
+        self.assertEqual(self.run_from(self.site, self.site, self.out),
+                         {"a.html": "updated", "b.html": "unchanged", "c.html": "deleted", "d.html": "added"})
+        self.assertEqual(self.outputs(), ["a.html.json", "b.html.json", "d.html.json"])
+        with open(os.path.join(self.out, "a.html.json"), encoding="utf-8") as f:
+            self.assertIn("/changed", f.read())
+        
+        self.assertEqual(self.run_from(self.out, os.path.relpath(self.site, self.out), "."),
+                         {"a.html": "unchanged", "b.html": "unchanged", "d.html": "unchanged"})
+
+    def test_format_change_invalidates(self):
+        self.run_from(self.tmp.name, "site", "out")
+        self.assertEqual(self.run_from(self.tmp.name, "site", "out", "text"),
+                         {"a.html": "added", "b.html": "added", "c.html": "added"})
+        self.assertEqual(self.outputs(), ["a.html.txt", "b.html.txt", "c.html.txt"])
+        self.assertEqual(self.run_from(self.tmp.name, "site", "out", "text"),
+                         {"a.html": "unchanged", "b.html": "unchanged", "c.html": "unchanged"})
+
+
+def string_size(value) -> int:
+    """Total length of the strings in a JSON-like value, as WorkBudget counts them."""
+    if isinstance(value, str):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(string_size(item) for item in value.values())
+    if isinstance(value, list):
+        return sum(string_size(item) for item in value)
+    return 0
+
+
+def contains_truncated(value) -> bool:
+    """Whether a JSON-like value contains a "truncated" node."""
+    if isinstance(value, dict):
+        return value.get("type") == "truncated" or any(contains_truncated(v) for v in value.values())
+    if isinstance(value, list):
+        return any(contains_truncated(item) for item in value)
+    return False
+
+
+class WorkBudgetTest(unittest.TestCase):
+    """categorized_content must stay near --max-output-size, however the page is built."""
+
+    MAX_OUTPUT_SIZE = 2000
+
+    def check_near_limit(self, body: str):
+        html = f"<html><head><title>Budget</title></head><body><main>{body}</main></body></html>"
+        # Deep enough that the budget, not max_depth, cuts extraction short
+        processor = WebpageProcessor(max_depth=10, max_output_size=self.MAX_OUTPUT_SIZE)
+        result = processor.process_html(html, ["categorized_content"])
+        content = json.loads(json.dumps(result["categorized_content"], default=json_default))
+        # Nodes extracted once the budget is almost used up may go a little over
+        self.assertLessEqual(string_size(content), self.MAX_OUTPUT_SIZE * 1.1)
+        self.assertTrue(contains_truncated(content))
+
+    def test_large_select(self):
+        options = "".join(f'<option value="v{i}">Option number {i}</option>' for i in range(20000))
+        self.check_near_limit(f'<h1>Form</h1><form><select name="s">{options}</select></form>')
+
+    def test_large_table(self):
+        rows = "".join(f"<tr><td><span>row {i}</span></td><td><b>value {i}</b></td></tr>"
+                       for i in range(20000))
+        self.check_near_limit(f"<h1>Table</h1><table><tbody>{rows}</tbody></table>")
+
+    def test_nested_blocks(self):
+        blocks = "".join(f'<div class="card"><p><a href="/item/{i}">Item {i}</a> description {i}</p></div>'
+                         for i in range(5000))
+        self.check_near_limit(f"<h1>Cards</h1><section>{blocks}</section>")
+
+
+class FixtureSite:
+    """
+    Local HTTP server for a dict of path -> page.
+    
+    A page is an HTML string, ("redirect", location) or a callable taking
+    the request handler and returning an HTML string, or None once it has
+    written the whole response itself. Other paths give 404. Requests are
+    recorded in self.requests, their headers in self.headers, and the most
+    callable pages being built at once in self.max_active.
+    """
+
+    def __init__(self, pages: dict):
+        self.pages = pages
+        self.requests = []
+        self.headers = []
+        self.lock = threading.Lock()
+        self.active = 0
+        self.max_active = 0
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with site.lock:
+                    site.requests.append(self.path)
+                    site.headers.append(dict(self.headers))
+                page = site.pages.get(self.path)
+                if page is None:
+                    self.send_error(404)
+                    return
+                if isinstance(page, tuple):
+                    self.send_response(301)
+                    self.send_header("Location", page[1].format(port=site.port))
+                    self.end_headers()
+                    return
+                if callable(page):
+                    # Counted until the page is ready, as the client may send
+                    # its next request as soon as the response is written
+                    with site.lock:
+                        site.active += 1
+                        site.max_active = max(site.max_active, site.active)
+                    try:
+                        body = page(self)
+                    finally:
+                        with site.lock:
+                            site.active -= 1
+                    if body is None:
+                        return
+                    body = body.encode("utf-8")
+                else:
+                    body = page.format(port=site.port).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def url(self, path: str, host: str = "127.0.0.1") -> str:
+        return f"http://{host}:{self.port}{path}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def page(title: str, *links: str) -> str:
+    """A small page with a title and the given links."""
+    anchors = "".join(f'<li><a href="{href}">Link to {href}</a></li>' for href in links)
+    return (f"<html><head><title>{title}</title></head><body><main><h1>{title}</h1>"
+            f"<p>Page {title} of the fixture site.</p><ul>{anchors}</ul></main></body></html>")
+
+
+def slow_page(title: str, delay: float):
+    """A page served after a delay."""
+    def respond(handler):
+        time.sleep(delay)
+        return page(title)
+    return respond
+
+
+def dripping_page(piece: bytes, count: int, delay: float):
+    """A page written a piece at a time, with a delay between pieces and no Content-Length."""
+    def respond(handler):
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/html; charset=utf-8")
+        handler.end_headers()
+        try:
+            for _ in range(count):
+                handler.wfile.write(piece)
+                handler.wfile.flush()
+                time.sleep(delay)
+        except OSError:
+            # The client stopped reading at its budget
+            pass
+    return respond
+
+
+def validated_page(body: str, etag: str, last_modified: str):
+    """A page sent with validators, answering matching conditional requests with 304."""
+    def respond(handler):
+        if handler.headers.get("If-None-Match") == etag \
+                or handler.headers.get("If-Modified-Since") == last_modified:
+            handler.send_response(304)
+            handler.send_header("ETag", etag)
+            handler.end_headers()
+            return None
+        data = body.encode("utf-8")
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/html; charset=utf-8")
+        handler.send_header("Content-Length", str(len(data)))
+        handler.send_header("ETag", etag)
+        handler.send_header("Last-Modified", last_modified)
+        handler.end_headers()
+        handler.wfile.write(data)
+        return None
+    return respond
+
+
+class HTTPCacheTest(unittest.TestCase):
+    """Fetches through HTTPCache reuse, revalidate and evict cached pages."""
+
+    ETAG = '"v1"'
+    LAST_MODIFIED = "Wed, 01 May 2024 12:00:00 GMT"
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def fetcher(self, cache: HTTPCache) -> WebpageProcessor:
+        processor = WebpageProcessor()
+        processor.cache = cache
+        return processor
+
+    def test_fresh_then_revalidated(self):
+        pages = {"/page.html": validated_page(page("Cached"), self.ETAG, self.LAST_MODIFIED)}
+        with FixtureSite(pages) as site:
+            url = site.url("/page.html")
+            cache = HTTPCache(self.tmp.name, ttl=60)
+            processor = self.fetcher(cache)
+            self.assertEqual(processor.fetch_url_content(url), (page("Cached"), False))
+            # Within the TTL the cached page is used without a request
+            self.assertEqual(processor.fetch_url_content(url), (page("Cached"), False))
+            self.assertEqual(len(site.requests), 1)
+
+            # After the TTL the page is revalidated, and the 304 reuses the body
+            cache.ttl = 0
+            self.assertEqual(processor.fetch_url_content(url), (page("Cached"), False))
+        self.assertEqual(len(site.requests), 2)
+        self.assertEqual(site.headers[1].get("If-None-Match"), self.ETAG)
+        self.assertEqual(site.headers[1].get("If-Modified-Since"), self.LAST_MODIFIED)
+        self.assertIsNotNone(cache.get(url))
+
+    def test_changed_page_replaces_entry(self):
+        pages = {"/page.html": validated_page(page("Old"), self.ETAG, self.LAST_MODIFIED)}
+        with FixtureSite(pages) as site:
+            url = site.url("/page.html")
+            processor = self.fetcher(HTTPCache(self.tmp.name))
+            processor.fetch_url_content(url)
+            pages["/page.html"] = validated_page(page("New"), '"v2"', "Thu, 02 May 2024 12:00:00 GMT")
+            self.assertEqual(processor.fetch_url_content(url), (page("New"), False))
+
+    def test_eviction(self):
+        pages = {f"/p{i}.html": page(f"Page {i}" + " padding" * 200) for i in range(6)}
+        with FixtureSite(pages) as site:
+            urls = [site.url(path) for path in pages]
+            entry_size = len(json.dumps({"body": pages["/p0.html"]})) + 200
+            cache = HTTPCache(self.tmp.name, max_size=3 * entry_size)
+            processor = self.fetcher(cache)
+            for url in urls:
+                processor.fetch_url_content(url)
+        self.assertLessEqual(cache.total_size, cache.max_size)
+        # Least recently used pages went first
+        self.assertIsNone(cache.get(urls[0]))
+        self.assertIsNotNone(cache.get(urls[-1]))
+        stored = [url for url in urls if cache.get(url) is not None]
+        self.assertEqual(stored, urls[len(urls) - len(stored):])
+        self.assertLess(len(stored), len(urls))
+
+
+class FetchBudgetTest(unittest.TestCase):
+    """Fetched pages are cut off at the byte and time budgets."""
+
+    PIECE = b"<p>" + b"budget " * 140 + b"</p>\n"
+
+    def test_oversized_page(self):
+        max_size = 100 * 1024
+        big = "<html><body><main>" + self.PIECE.decode() * 3000 + "</main></body></html>"
+        with FixtureSite({"/big.html": big}) as site:
+            processor = WebpageProcessor(max_fetch_size=max_size)
+            html_content, truncated, _ = processor.fetch_page(site.url("/big.html"))
+            results = list(run_batch([site.url("/big.html")], {"max_fetch_size": max_size},
+                                     is_url=True, jobs=1))
+        self.assertTrue(truncated)
+        self.assertEqual(len(html_content.encode("utf-8")), max_size)
+        self.assertTrue(results[0]["truncated"])
+
+    def test_page_within_budget(self):
+        with FixtureSite({"/ok.html": page("OK")}) as site:
+            html_content, truncated, _ = WebpageProcessor(max_fetch_size=100 * 1024).fetch_page(
+                site.url("/ok.html"))
+        self.assertFalse(truncated)
+        self.assertEqual(html_content, page("OK"))
+
+    def test_slow_page(self):
+        # 100 pieces 0.05s apart take 5s to send in full
+        with FixtureSite({"/slow.html": dripping_page(self.PIECE, 100, 0.05)}) as site:
+            processor = WebpageProcessor(fetch_time_limit=1.0)
+            start = time.monotonic()
+            html_content, truncated, _ = processor.fetch_page(site.url("/slow.html"))
+            elapsed = time.monotonic() - start
+        self.assertTrue(truncated)
+        self.assertLess(elapsed, 2.0)
+        # Whatever arrived within the limit is kept
+        self.assertGreater(len(html_content), len(self.PIECE) * 5)
+        self.assertLess(len(html_content), len(self.PIECE) * 100)
+
+
+class BatchTest(unittest.TestCase):
+    """run_batch against a local HTTP server."""
+
+    def test_completion_order(self):
+        site_pages = {"/slow.html": slow_page("Slow", 1.0), "/fast.html": page("Fast")}
+        with FixtureSite(site_pages) as site:
+            sources = [site.url("/slow.html"), site.url("/fast.html")]
+            results = list(run_batch(sources, {}, is_url=True, jobs=1))
+        # The slow page was listed first but finishes last, and each result
+        # is tagged with the source it came from
+        self.assertEqual([result["source"] for result in results], sources[::-1])
+        self.assertEqual([result["metadata"]["title"] for result in results], ["Fast", "Slow"])
+
+    def test_error_records(self):
+        with FixtureSite({"/ok.html": page("OK")}) as site, tempfile.TemporaryDirectory() as tmp:
+            sources = [site.url("/missing.html"), site.url("/ok.html"), os.path.join(tmp, "missing.html")]
+            results = {result["source"]: result for result in run_batch(sources, {}, jobs=1)}
+        self.assertEqual(set(results), set(sources))
+        self.assertEqual(results[sources[1]]["metadata"]["title"], "OK")
+        for source in (sources[0], sources[2]):
+            self.assertEqual(set(results[source]), {"source", "error"})
+
+    def test_per_host_limit(self):
+        site_pages = {f"/p{i}.html": slow_page(f"P{i}", 0.3) for i in range(8)}
+        with FixtureSite(site_pages) as site:
+            sources = [site.url(path) for path in site_pages]
+            results = list(run_batch(sources, {}, is_url=True, concurrency=8, per_host=2, jobs=1))
+        self.assertEqual(len(results), 8)
+        self.assertEqual(site.max_active, 2)
+
+
+class CharsetTest(unittest.TestCase):
+    """Pages are decoded in their declared encoding, or a sniffed fallback."""
+
+    def test_declared_charset(self):
+        self.assertEqual(detect_charset(b"<p>x</p>", "text/html; charset=ISO-8859-1"), ("iso8859-1", 0))
+        self.assertEqual(detect_charset(b'<meta charset="windows-1251"><p>x</p>'), ("cp1251", 0))
+        self.assertEqual(detect_charset(b"\xef\xbb\xbf<p>x</p>"), ("utf-8", 3))
+
+    def test_undeclared_utf8(self):
+        html = "<p>caf\u00e9 \u2013 na\u00efve</p>".encode("utf-8")
+        self.assertEqual(decode_html(html), "<p>caf\u00e9 \u2013 na\u00efve</p>")
+        # A head cut off partway through a character is still UTF-8
+        self.assertEqual(detect_charset(html[:html.index(b"\xa9")]), ("utf-8", 0))
+
+    def test_undeclared_latin1_falls_back_to_cp1252(self):
+        html = "<p>caf\u00e9 \u2013 na\u00efve</p>".encode("cp1252")
+        self.assertEqual(decode_html(html), "<p>caf\u00e9 \u2013 na\u00efve</p>")
+        self.assertEqual(decode_html(html, "text/html; charset=bogus"), "<p>caf\u00e9 \u2013 na\u00efve</p>")
+        chunks = [html[:6], html[6:]]
+        self.assertEqual("".join(decode_chunks(chunks, "text/html")), "<p>caf\u00e9 \u2013 na\u00efve</p>")
+
+
+class PageServerTest(unittest.TestCase):
+    """PageServer request handling, without the HTTP transport."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = PageServer({}, jobs=1)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.close()
+
+    def post_json(self, request) -> tuple:
+        status, _, body = self.server.handle("POST", "/process", "application/json",
+                                             json.dumps(request).encode("utf-8"))
+        return status, json.loads(body)
+
+    def test_process_html(self):
+        status, result = self.post_json({"html": page("Served"), "fields": "metadata"})
+        self.assertEqual(status, 200)
+        self.assertEqual(result["metadata"]["title"], "Served")
+
+    def test_non_string_parameters(self):
+        for request in ({"html": 123}, {"url": ["http://example.com/"]},
+                        {"html": page("X"), "fields": 5}, {"html": page("X"), "format": {"a": 1}},
+                        {"html": page("X"), "fields": None}):
+            with self.subTest(request=request):
+                status, result = self.post_json(request)
+                self.assertEqual(status, 400)
+                self.assertIn("must be a string", result["error"])
+
+    def test_failing_encoder_still_gives_500(self):
+        with mock.patch.object(self.server, "encode", side_effect=ValueError("encoder failed")):
+            status, _, body = self.server.handle("GET", "/health", "", b"")
+        self.assertEqual(status, 500)
+        self.assertIn("encoder failed", json.loads(body)["error"])
+
+    def test_fast_encoder_from_many_threads(self):
+        # In a fresh interpreter, so orjson has not been loaded by other tests
+        script = (
+            "import sys, threading\n"
+            f"sys.path.insert(0, {HERE!r})\n"
+            "from strip import PageServer\n"
+            "server = PageServer({}, jobs=1, fast=True)\n"
+            "statuses = []\n"
+            "def request():\n"
+            "    statuses.append(server.handle('GET', '/health', '', b'')[0])\n"
+            "threads = [threading.Thread(target=request) for _ in range(16)]\n"
+            "for thread in threads: thread.start()\n"
+            "for thread in threads: thread.join()\n"
+            "server.close()\n"
+            "print(statuses)\n"
+        )
+        result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True)
+        self.assertEqual(json.loads(result.stdout), [200] * 16, result.stderr)
+
+
+class StreamingExtractorTest(unittest.TestCase):
+    """The streaming extractor holds a bounded amount of text however the page is built."""
+
+    CHUNK_SIZE = 1000
+    PIECE = "<p>" + "word " * 20 + "</p>"
+
+    def check_bounded(self, start: str, held):
+        extractor = StreamingExtractor(WebpageProcessor(), chunk_size=self.CHUNK_SIZE)
+        extractor.feed(start)
+        for _ in range(2000):
+            extractor.feed(self.PIECE)
+            extractor.drain()
+            self.assertLessEqual(held(extractor), self.CHUNK_SIZE + len(self.PIECE))
+        extractor.close()
+        return extractor.drain()
+
+    def test_unclosed_title(self):
+        records = self.check_bounded("<html><head><title>Start ", lambda e: sum(map(len, e.title)))
+        title = records[0]["metadata"]["title"]
+        self.assertTrue(title.startswith("Start word word"))
+        self.assertLessEqual(len(title), self.CHUNK_SIZE + len(self.PIECE))
+
+    def test_unclosed_heading(self):
+        records = self.check_bounded("<html><body><h1>Start ", lambda e: e.heading[2])
+        self.assertLessEqual(len(records[-1]["text"]), self.CHUNK_SIZE + len(self.PIECE))
+
+
+class ParserConformanceTest(unittest.TestCase):
+    """Every installed parser backend matches html.parser on well-formed markup."""
+
+    def test_backends_match_html_parser(self):
+        expected = {name: json.dumps(WebpageProcessor().process_html(html), default=json_default)
+                    for name, html in PARSER_CORPUS.items()}
+        for parser, module in PARSER_BACKENDS.items():
+            with self.subTest(parser=parser):
+                if module and importlib.util.find_spec(module) is None:
+                    self.skipTest(f"{module} is not installed")
+                processor = WebpageProcessor(parser=parser)
+                for name, html in PARSER_CORPUS.items():
+                    result = json.dumps(processor.process_html(html), default=json_default)
+                    self.assertEqual(result, expected[name], f"{parser} on {name}")
+
+
+def site_page(title: str) -> str:
+    """A page with the navigation and footer shared by the whole site."""
+    nav = "".join(f'<li><a href="/section/{i}">Section number {i}</a></li>' for i in range(8))
+    return (f"<html><head><title>{title}</title></head><body><nav><ul>{nav}</ul></nav>"
+            f"<main><h1>{title}</h1><p>Only page {title} says this.</p></main>"
+            "<footer><p>Copyright 2026 Example Corporation. All rights reserved.</p>"
+            '<ul><li><a href="/privacy">Privacy policy</a></li><li><a href="/terms">Terms of use</a></li></ul>'
+            "</footer></body></html>")
+
+
+def expand_refs(value, blocks: dict):
+    """Replace {"ref": ID} nodes with the blocks they refer to."""
+    if isinstance(value, dict):
+        if set(value) == {"ref"}:
+            return expand_refs(blocks[value["ref"]], blocks)
+        return {key: expand_refs(item, blocks) for key, item in value.items()}
+    if isinstance(value, list):
+        return [expand_refs(item, blocks) for item in value]
+    return value
+
+
+class BoilerplateIndexTest(unittest.TestCase):
+    """--dedupe must only change how records are written, not what they hold."""
+
+    def test_shared_blocks_become_refs(self):
+        processor = WebpageProcessor()
+        # As written: the fields encoded to plain JSON
+        pages = [json.loads(json.dumps(processor.process_html(site_page(title)), default=json_default))
+                 for title in ("A", "B", "C")]
+        output = [json.loads(json.dumps(record, default=json_default))
+                  for record in BoilerplateIndex().dedupe(pages)]
+        
+        blocks = {record["boilerplate"]: record["data"] for record in output if "boilerplate" in record}
+        records = [record for record in output if "boilerplate" not in record]
+        self.assertEqual(len(records), 3)
+        # The first page keeps its blocks inline; the second emits them
+        # before its record; the third only refers to them
+        self.assertNotIn('{"ref":', json.dumps(records[0]))
+        self.assertEqual(output[0], records[0])
+        self.assertEqual(output[-1], records[2])
+        self.assertIn("boilerplate", output[1])
+        for section in ("navigation", "footer"):
+            for record in records[1:]:
+                self.assertEqual([set(node) for node in record["categorized_content"][section]], [{"ref"}])
+        self.assertEqual([expand_refs(record, blocks) for record in records], pages)
+        self.assertLess(len(json.dumps(records[2])), len(json.dumps(pages[2])) / 2)
+
+
+def sentences(label: str, count: int) -> str:
+    """A paragraph of sentences, labelled so every paragraph is unique."""
+    return " ".join(f"Sentence {i} of {label} says something." for i in range(count))
+
+
+# Sections of varying length, a paragraph far bigger than any chunk, and
+# a list whose lines are the only places to split it
+CHUNK_TEXT = "\n\n".join([
+    "Lead paragraph before any heading.",
+    "# Guide",
+    sentences("intro", 3),
+    "## Install",
+    sentences("install one", 4),
+    sentences("install two", 6),
+    "### From source",
+    sentences("source", 30),
+    "## Usage",
+    "\n".join(f"- usage item {i} with a few words" for i in range(20)),
+    "# Reference",
+    sentences("reference", 2),
+    "## API",
+    sentences("api", 5),
+])
+
+
+class ChunkerTest(unittest.TestCase):
+    """Chunks must stay within size, cover the text and know their headings."""
+
+    SETTINGS = [(80, 0, "tokens"), (80, 20, "tokens"), (40, 0, "tokens"), (300, 0, "chars"), (300, 100, "chars")]
+
+    @staticmethod
+    def breadcrumb(text: str, position: int) -> list:
+        """Headings that the text at position falls under."""
+        headings = []
+        for match in re.finditer(r"^(#+) (.*)$", text, re.M):
+            if match.start() > position:
+                break
+            level = len(match.group(1))
+            headings = [(lvl, title) for lvl, title in headings if lvl < level] + [(level, match.group(2))]
+        return [title for _, title in headings]
+
+    def test_chunks(self):
+        for size, overlap, unit in self.SETTINGS:
+            with self.subTest(size=size, overlap=overlap, unit=unit):
+                chunker = Chunker(size, overlap, unit)
+                chunks = list(chunker.chunks(CHUNK_TEXT))
+                self.assertEqual([chunk["chunk"] for chunk in chunks], list(range(len(chunks))))
+                position = 0
+                for chunk in chunks:
+                    self.assertLessEqual(chunk[unit], size)
+                    self.assertEqual(chunk[unit], chunker.measure(chunk["text"]))
+                    # Each chunk starts no later than where the last one ended
+                    # and continues past it, under the headings there
+                    start = CHUNK_TEXT.index(chunk["text"].split("\n\n")[0][:40])
+                    self.assertFalse(CHUNK_TEXT[position:start].strip())
+                    self.assertEqual(chunk["headings"], self.breadcrumb(CHUNK_TEXT, start))
+                    end = CHUNK_TEXT.index(chunk["text"][-40:], start) + len(chunk["text"][-40:])
+                    self.assertGreater(end, position)
+                    position = end
+                self.assertFalse(CHUNK_TEXT[position:].strip())
+                if not overlap:
+                    self.assertEqual("".join("".join(chunk["text"].split()) for chunk in chunks),
+                                     "".join(CHUNK_TEXT.split()))
+
+    def test_oversized_paragraph(self):
+        chunker = Chunker(40)
+        chunks = [chunk for chunk in chunker.chunks(CHUNK_TEXT) if "of source" in chunk["text"]]
+        self.assertGreater(len(chunks), 2)
+        for chunk in chunks:
+            self.assertLessEqual(chunk["tokens"], 40)
+            self.assertEqual(chunk["headings"], ["Guide", "Install", "From source"])
+        # A short chunk may end with the next section's heading
+        self.assertEqual(" ".join(chunk["text"].split("\n\n")[0] for chunk in chunks), sentences("source", 30))
+        
+        # A paragraph with no spaces is cut wherever it must be
+        chunks = list(Chunker(100, unit="chars").chunks("x" * 250))
+        self.assertEqual([chunk["chars"] for chunk in chunks], [100, 100, 50])
+
+
+class RenderMarkdownTest(unittest.TestCase):
+    """render_markdown matches html2text parsing the serialized tree."""
+
+    def test_matches_html2text(self):
+        import bench
+        pages = {f"bench_{name}": build() for name, build in bench.CASES.items()}
+        pages.update(STATEFUL_PAGES)
+        pages.update(PARSER_CORPUS)
+        pages.update((path, html) for path, html in CRAWL_SITE.items() if isinstance(html, str))
+        pages["entities"] = ("<html><body><main><p>a &lt;b&gt; &amp; c &quot;d&quot; &#169;</p>"
+                             "<!-- comment --><pre>x &lt; y\n  z</pre></main></body></html>")
+        processor = WebpageProcessor()
+        for name, html in pages.items():
+            with self.subTest(page=name):
+                soup = processor.parse_html(html)
+                for root in (soup, soup.main or soup):
+                    self.assertEqual(processor.render_markdown(root),
+                                     processor.new_h2t().handle(str(root)))
+                processor.index = None
+
+
+def warc_record(warc_type: str, uri: str, content_type: str, block: bytes) -> bytes:
+    """Build one WARC record."""
+    headers = (f"WARC/1.0\r\nWARC-Type: {warc_type}\r\nWARC-Target-URI: {uri}\r\n"
+               f"Content-Type: {content_type}\r\nContent-Length: {len(block)}\r\n\r\n")
+    return headers.encode("utf-8") + block + b"\r\n\r\n"
+
+
+def http_response(body: bytes, status: str = "200 OK", content_type: str = "text/html; charset=utf-8",
+                  extra: str = "") -> bytes:
+    """Build a recorded HTTP response."""
+    return (f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n{extra}\r\n".encode("ascii") + body)
+
+
+def chunked(body: bytes, size: int = 50) -> bytes:
+    """Encode a body with Transfer-Encoding: chunked."""
+    pieces = [body[i:i + size] for i in range(0, len(body), size)]
+    return b"".join(b"%x\r\n%s\r\n" % (len(piece), piece) for piece in pieces) + b"0\r\n\r\n"
+
+
+class ArchiveTest(unittest.TestCase):
+    """WARC and compressed page input, read record by record."""
+
+    HTTP = "application/http; msgtype=response"
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        gzipped = gzip.compress(page("Gzipped").encode("utf-8"))
+        # (record, title of the page it yields or None if it yields none)
+        self.records = [
+            (warc_record("warcinfo", "", "application/warc-fields", b"software: test\r\n"), None),
+            (warc_record("request", "http://example.com/a", "application/http; msgtype=request",
+                         b"GET /a HTTP/1.1\r\nHost: example.com\r\n\r\n"), None),
+            (warc_record("response", "http://example.com/a", self.HTTP,
+                         http_response(page("A").encode("utf-8"))), "A"),
+            (warc_record("metadata", "http://example.com/a", "application/warc-fields",
+                         b"outlinks: http://example.com/b\r\n"), None),
+            (warc_record("response", "http://example.com/missing", self.HTTP,
+                         http_response(page("Missing").encode("utf-8"), "404 Not Found")), None),
+            (warc_record("response", "http://example.com/image.png", self.HTTP,
+                         http_response(b"\x89PNG", content_type="image/png")), None),
+            (warc_record("response", "http://example.com/b", self.HTTP,
+                         http_response(chunked(gzipped),
+                                       extra="Transfer-Encoding: chunked\r\nContent-Encoding: gzip\r\n")),
+             "Gzipped"),
+            (warc_record("resource", "http://example.com/c", "text/html",
+                         page("Caf\u00e9").encode("cp1252")), "Caf\u00e9"),
+        ]
+
+    def write(self, name: str, data: bytes) -> str:
+        path = os.path.join(self.tmp.name, name)
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def expected(self, sizes) -> list:
+        """(uri, offset, title) of the pages, given the size each record takes in the file."""
+        pages, offset = [], 0
+        for (record, title), size in zip(self.records, sizes):
+            if title is not None:
+                uri = record.split(b"WARC-Target-URI: ")[1].split(b"\r\n")[0].decode()
+                pages.append((uri, offset, title))
+            offset += size
+        return pages
+
+    def read(self, path: str) -> list:
+        return [(page_["uri"], page_["offset"], WebpageProcessor().process_html(page_["html"])["metadata"]["title"])
+                for page_ in iter_archive_pages(path)]
+
+    def test_plain_warc(self):
+        path = self.write("pages.warc", b"".join(record for record, _ in self.records))
+        self.assertEqual(self.read(path), self.expected(len(record) for record, _ in self.records))
+
+    def test_gzipped_warc(self):
+        # Each record is its own gzip member, and offsets are member offsets
+        members = [gzip.compress(record) for record, _ in self.records]
+        path = self.write("pages.warc.gz", b"".join(members))
+        self.assertEqual(self.read(path), self.expected(len(member) for member in members))
+
+    def test_run_archives(self):
+        warc = self.write("pages.warc.gz", b"".join(gzip.compress(record) for record, _ in self.records))
+        html = self.write("single.html.gz", gzip.compress(page("Single").encode("utf-8")))
+        bad = self.write("bad.warc", b"not a warc file\n")
+        results = list(run_archives([warc, html, bad], {}, jobs=1))
+        self.assertEqual([(result["source"], result.get("uri")) for result in results], [
+            (warc, "http://example.com/a"), (warc, "http://example.com/b"),
+            (warc, "http://example.com/c"), (html, None), (bad, None),
+        ])
+        self.assertEqual(results[3]["metadata"]["title"], "Single")
+        self.assertEqual(results[3]["offset"], 0)
+        self.assertIn("Error reading archive", results[4]["error"])
+
+
+class ResultCacheTest(unittest.TestCase):
+    """process_html returns the same types whether or not the result cache had the page."""
+
+    HTML = ('<html><head><title>Cached</title></head><body><nav><a href="/">Home</a></nav>'
+            '<main><h1>Cached</h1><p aria-label="intro" data-id="7">A paragraph long enough to keep.</p>'
+            '<form><select name="s"><option value="1">One</option></select></form></main></body></html>')
+
+    def test_hit_matches_miss(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            processor = WebpageProcessor(result_cache=os.path.join(tmp, "results.db"))
+            miss = processor.process_html(self.HTML)
+            hit = processor.process_html(self.HTML)
+            self.assertEqual(processor.result_cache.stats()["hits"], 1)
+        for result in (miss, hit):
+            for nodes in result["categorized_content"].values():
+                self.assertTrue(all(isinstance(node, CompactRecord) for node in nodes))
+            main = result["categorized_content"]["main_content"][0]
+            self.assertTrue(all(isinstance(child, CompactRecord) for child in main["children"]))
+        self.assertEqual(to_plain(hit), to_plain(miss))
+        self.assertEqual(json.dumps(hit, default=json_default), json.dumps(miss, default=json_default))
+        json.dumps(to_plain(miss))
+
+
+# Crawl fixture: "localhost" is a different origin from "127.0.0.1", though
+# served by the same server, so following it would show up in the requests
+CRAWL_SITE = {
+    "/": page("Home", "/a.html", "/b.html", "/a.html#section", "/docs", "/away",
+              "http://localhost:{port}/other.html", "/image.png"),
+    "/a.html": page("A", "/c.html", "/", "b.html"),
+    "/b.html": page("B", "/a.html"),
+    "/c.html": page("C", "/d.html"),
+    "/d.html": page("D"),
+    "/docs": ("redirect", "/docs/"),
+    "/docs/": page("Docs", "intro.html"),
+    "/docs/intro.html": page("Intro"),
+    "/intro.html": page("Wrong intro"),
+    "/away": ("redirect", "http://localhost:{port}/elsewhere.html"),
+    "/elsewhere.html": page("Elsewhere", "/secret.html"),
+    "/secret.html": page("Secret"),
+    "/other.html": page("Other"),
+    "/image.png": "not a page",
+}
+
+
+class CrawlTest(unittest.TestCase):
+    """run_crawl against a local fixture site."""
+
+    def crawl(self, **kwargs):
+        with FixtureSite(CRAWL_SITE) as site:
+            results = list(run_crawl([site.url("/")], {}, jobs=1, **kwargs))
+        prefix = site.url("")
+        sources = {result["source"].replace(prefix, ""): result for result in results}
+        self.assertEqual(len(sources), len(results), "a page was crawled twice")
+        for result in results:
+            self.assertNotIn("error", result)
+        return sources, site.requests
+
+    def test_depth_limit(self):
+        sources, _ = self.crawl(max_depth=2)
+        depths = {source: result["depth"] for source, result in sources.items()}
+        self.assertEqual(depths, {
+            "/": 0,
+            "/a.html": 1, "/b.html": 1, "/docs": 1, "/away": 1,
+            "/c.html": 2, "/docs/intro.html": 2,
+        })
+
+    def test_page_limit(self):
+        sources, requests = self.crawl(max_depth=5, max_pages=3)
+        self.assertEqual(len(sources), 3)
+        self.assertIn("/", sources)
+
+    def test_same_origin_and_dedup(self):
+        sources, requests = self.crawl(max_depth=5)
+        self.assertIn("/d.html", sources)
+        self.assertNotIn("/other.html", requests)
+        self.assertNotIn("/image.png", requests)
+        # Each page is fetched once, however many pages link to it
+        self.assertEqual(requests.count("/a.html"), 1)
+        self.assertEqual(requests.count("/"), 1)
+
+    def test_redirects(self):
+        sources, requests = self.crawl(max_depth=5)
+        # Relative links resolve against the URL after the redirect...
+        self.assertIn("/docs/intro.html", sources)
+        self.assertNotIn("/intro.html", requests)
+        # ...and the redirect target is not fetched again
+        self.assertEqual(requests.count("/docs/"), 1)
+        # Links on a page redirected to another origin are not followed
+        self.assertEqual(sources["/away"]["metadata"]["title"], "Elsewhere")
+        self.assertNotIn("/secret.html", requests)
+
+
+if __name__ == "__main__":
+    unittest.main()